@@ -1,190 +1,59 @@
-from flask import Flask
-from flask_socketio import SocketIO  # type: ignore[import-untyped]
+from flask import Flask, request
+from flask_socketio import SocketIO, emit, join_room  # type: ignore[import-untyped]
 from dotenv import load_dotenv
 import os
+import logging
 import sys
 import time
 import threading
 import webbrowser
 from datetime import datetime
-from typing import Dict
-from collections import deque
 
 from routes.scan import scan_bp
 from routes.settings import settings_bp
+from routes.metrics import metrics_bp
+from routes.items import items_bp
+from routes.status import status_bp
+from routes.manifest import manifest_bp
 
-from barcode_scanner import connect_barcode_signal
-from plc import connect_photo_eye_signal, connect_plc, write_bucket, read_photo_eye
-from palletiq_api import request_palletiq_async, init_session, init_token
+from palletiq_api import init_token, warm_up_connection, load_label_history
+from manifest import ManifestJobs
+from line import create_lines
+from log_setup import setup_logging
 
 load_dotenv()
+setup_logging()
 
-barcode_queue: deque = deque()
-queue_lock = threading.Lock()
+logger = logging.getLogger(__name__)
 
-book_dict: Dict[str, dict] = {}
-book_dict_lock = threading.Lock()
-
-belt_speed = 32.1
-max_distance = 972
 _test_signals_started = False
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-_pending_requests = set()
-_pending_lock = threading.Lock()
-
-def on_barcode_scanned(barcode):
-    scan_time = time.time()
-    
-    with _pending_lock:
-        if barcode in _pending_requests:
-            print(f"⚠️ Photo eye triggered for {barcode} but request already pending", flush=True)
-            return
-        _pending_requests.add(barcode)
-
-    item = {
-        "barcode": barcode,
-        "start_time": scan_time,
-        "positionId": None,
-        "positionCm": None,
-        "pusher": None,
-        "label": None,
-        "distance": None,
-        "status": "pending",
-        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    
-    with queue_lock:
-        barcode_queue.append(item)
-        book_dict[barcode] = item
-    
-    socketio.emit('add_book', item)
-
-    def on_success(response):
-        with _pending_lock:
-            _pending_requests.discard(barcode)
-        if response:
-            on_palletiq_response(barcode, response)
-        else:
-            _handle_palletiq_error(barcode, None)
-    
-    def on_error(error):
-        with _pending_lock:
-            _pending_requests.discard(barcode)
-        _handle_palletiq_error(barcode, error)
-    
-    promise = request_palletiq_async(barcode)
-    promise.then(on_success).catch(on_error)
-    
-    sys.stdout.flush()
-
-def on_palletiq_response(barcode, response):
-    if not response:
-        return
-    
-    pusher = response.get("pusher")
-    label = response.get("label")
-    distance = response.get("distance", max_distance)
-    
-    with book_dict_lock:
-        if barcode in book_dict:
-            if book_dict[barcode].get("pusher") is not None:
-                return
-            book_dict[barcode]["pusher"] = pusher
-            book_dict[barcode]["label"] = label
-            book_dict[barcode]["distance"] = distance
-
-    socketio.emit('update_book', book_dict[barcode])
-
-    positionId = book_dict[barcode]['positionId']
-    
-    print(f"✅ PalletIQ Response - Barcode: {barcode}, Label: {label}, Pusher: {pusher}, Distance: {distance}", flush=True)
-
-    if positionId is not None and pusher is not None:
-        write_bucket(positionId, pusher)
-
-def _handle_palletiq_error(barcode, error):
-    if not barcode:
-        return
-    
-    with book_dict_lock:
-        if barcode in book_dict:
-            book_dict[barcode]["status"] = "error"
-            book_dict[barcode]["error"] = str(error) if error else "Unknown error"
-            socketio.emit('update_book', book_dict[barcode])
-    
-    with _pending_lock:
-        _pending_requests.discard(barcode)
-
-def on_photo_eye_triggered(positionId):
-    photo_eye_trigger_time = time.time()
-
-    barcode = None
-    
-    with queue_lock:
-        if len(barcode_queue) > 0:
-            item = barcode_queue.popleft()
-            if item:
-                barcode = item.get("barcode")
-        else:
-            print(f"⚠️ Photo eye triggered at position {positionId} but barcode_queue is empty", flush=True)
-    
-    if barcode:  
-        with book_dict_lock:
-            book_dict[barcode]["positionId"] = positionId
-            book_dict[barcode]["status"] = "progress"
-            book_dict[barcode]["start_time"] = photo_eye_trigger_time
-
-        socketio.emit('update_book', book_dict[barcode])
-
-        print(f"✅ Photo eye processed - Barcode: {barcode}, Position: {positionId}", flush=True)
-        
-    sys.stdout.flush()
-
-def check_connections():
-    from barcode_scanner import is_barcode_scanner_connected as check_barcode
-    from plc import is_plc_connected as check_plc
-    plc_status = check_plc()
-    barcode_status = check_barcode()
-    
-    photo_eye_status = False
-    photo_eye_value = None
-    if plc_status:
-        try:
-            photo_eye_value = read_photo_eye()
-            photo_eye_status = photo_eye_value is not None
-        except Exception:
-            photo_eye_status = False
-    
-    return {
-        "plc": plc_status, 
-        "barcode_scanner": barcode_status,
-        "photo_eye": {
-            "connected": photo_eye_status,
-            "message": "Not Ready" if photo_eye_value == None else "Ready"
-        }
-    }
+# One Line per conveyor (see LINES); the first one is the default for
+# dashboard clients and routes that do not name a line.
+lines = {line.name: line for line in create_lines(socketio)}
+primary_line = next(iter(lines.values()))
+app.extensions['lines'] = lines
 
-def broadcast_system_status():
-    try:
-        status = check_connections()
-        system_status = {
-            "plc": {"connected": status.get("plc", False), "message": "Connected" if status.get("plc") else "Disconnected"},
-            "scanner": {"connected": status.get("barcode_scanner", False), "message": "Connected" if status.get("barcode_scanner") else "Disconnected", "mode": os.getenv("SCAN_MODE", "KEYBOARD")},
-            "photo_eye": status.get("photo_eye", {"connected": False, "message": "Not Ready"})
-        }
+# Kept for tools that drive a single-line setup.
+belt_speed = primary_line.belt_speed
+max_distance = primary_line.max_distance
+correlator = primary_line.correlator
+item_store = primary_line.item_store
 
-        socketio.emit('system_status', system_status)
-    except Exception:
-        pass
+app.extensions['manifest_jobs'] = ManifestJobs(socketio.emit)
 
 @socketio.on('connect')
 def handle_connect():
     global _test_signals_started
-    broadcast_system_status()
+    # Each client follows one line, chosen with ?line= on the page URL.
+    line = lines.get(request.args.get('line'), primary_line)
+    join_room(line.room)
+    # Only the requesting client gets the cached snapshot; no PLC traffic.
+    emit('system_status', line.status_sampler.snapshot())
     
     # if not _test_signals_started:
     #     _test_signals_started = True
@@ -200,24 +69,25 @@ def handle_disconnect():
     pass
 
 def main():
-    print("=" * 60, flush=True)
-    print("🚀 Starting Conveyor System Application", flush=True)
-    print("=" * 60, flush=True)
-    sys.stdout.flush()
+    logger.info("=" * 60)
+    logger.info("🚀 Starting Conveyor System Application")
+    logger.info("=" * 60)
     
-    connect_plc()
-    status = check_connections()
-    print(f"✅ plc: {status['plc']}, barcode_scanner: {status['barcode_scanner']}", flush=True)
-    sys.stdout.flush()
-
-    init_session()
+    # The PalletIQ session, token and label cache are shared by every line.
     init_token()
-    
-    connect_barcode_signal(on_barcode_scanned)
-    connect_photo_eye_signal(on_photo_eye_triggered)
+    warm_up_connection()
+    for line in lines.values():
+        load_label_history(line.item_store.history_path)
+
+    for line in lines.values():
+        line.start()
 
 app.register_blueprint(scan_bp)
 app.register_blueprint(settings_bp)
+app.register_blueprint(metrics_bp)
+app.register_blueprint(items_bp)
+app.register_blueprint(status_bp)
+app.register_blueprint(manifest_bp)
 
 if __name__ == '__main__':
     import sys
@@ -229,11 +99,10 @@ if __name__ == '__main__':
     port = int(os.getenv("FLASK_PORT", "5000"))
     debug_mode = os.getenv("FLASK_DEBUG", "True").lower() == "true"
     
-    print(f"\n🌐 Starting Flask server on {host}:{port}", flush=True)
-    print(f"Debug mode: {debug_mode}", flush=True)
-    print(f"Open browser to: http://localhost:{port}", flush=True)
-    print("=" * 60, flush=True)
-    sys.stdout.flush()
+    logger.info(f"🌐 Starting Flask server on {host}:{port}")
+    logger.info(f"Debug mode: {debug_mode}")
+    logger.info(f"Open browser to: http://localhost:{port}")
+    logger.info("=" * 60)
     
     def open_browser():
         time.sleep(1.5)
@@ -0,0 +1,95 @@
+import codecs
+import re
+from typing import List, Optional
+
+def parse_control_bytes(value: str) -> bytes:
+    # Env values spell control characters as escapes, e.g. "\r\n" or "\x02".
+    return codecs.decode(value, 'unicode_escape').encode('latin-1')
+
+class BarcodeFramer:
+    """Splits a serial byte stream into barcodes.
+
+    Incoming bytes are appended to one reusable ``bytearray`` and only the new
+    bytes are searched for a terminator, in a single regex pass; frames are
+    decoded straight from a memoryview of the buffer. Any byte in
+    ``terminators`` ends a frame, so CR, LF and CRLF all work with the default.
+    The configured ``prefix``/``suffix`` are required and removed, AIM
+    symbology identifiers (``]E0``, ``]C1``...) are optionally stripped, and
+    a frame that grows past ``max_length`` is dropped up to its terminator
+    without touching the frames around it. Each rejection is counted.
+    """
+
+    def __init__(self, terminators: bytes = b"\r\n", prefix: bytes = b"", suffix: bytes = b"",
+                 strip_aim_id: bool = True, max_length: int = 128):
+        if not terminators:
+            raise ValueError("At least one terminator byte is required")
+        self.prefix = prefix
+        self.suffix = suffix
+        self.strip_aim_id = strip_aim_id
+        self.max_length = max_length
+        self._terminator = re.compile(b"[" + re.escape(terminators) + b"]")
+        self._buffer = bytearray()
+        self._discarding = False
+        self.counters = {"frames": 0, "overlong": 0, "missing_prefix": 0, "missing_suffix": 0,
+                         "undecodable": 0, "aim_ids_stripped": 0}
+
+    def reset(self):
+        # After a port error the partial frame cannot be trusted.
+        self._buffer.clear()
+        self._discarding = False
+
+    def feed(self, data: bytes) -> List[str]:
+        buffer = self._buffer
+        scan_from = len(buffer)
+        buffer += data
+        barcodes = []
+        start = 0
+        view = memoryview(buffer)
+        try:
+            for match in self._terminator.finditer(buffer, scan_from):
+                end = match.start()
+                if self._discarding:
+                    self._discarding = False
+                elif end > start:
+                    barcode = self._decode(view[start:end])
+                    if barcode:
+                        barcodes.append(barcode)
+                start = match.end()
+        finally:
+            view.release()
+        del buffer[:start]
+
+        if len(buffer) > self.max_length + len(self.prefix) + len(self.suffix):
+            self.counters["overlong"] += 1
+            buffer.clear()
+            self._discarding = True
+        return barcodes
+
+    def _decode(self, frame: memoryview) -> Optional[str]:
+        if len(frame) > self.max_length + len(self.prefix) + len(self.suffix):
+            self.counters["overlong"] += 1
+            return None
+        if self.prefix:
+            if frame[:len(self.prefix)] != self.prefix:
+                self.counters["missing_prefix"] += 1
+                return None
+            frame = frame[len(self.prefix):]
+        if self.suffix:
+            if len(frame) < len(self.suffix) or frame[len(frame) - len(self.suffix):] != self.suffix:
+                self.counters["missing_suffix"] += 1
+                return None
+            frame = frame[:len(frame) - len(self.suffix)]
+        try:
+            barcode = str(frame, 'utf-8').strip()
+        except UnicodeDecodeError:
+            self.counters["undecodable"] += 1
+            return None
+        if self.strip_aim_id and len(barcode) >= 3 and barcode[0] == "]":
+            barcode = barcode[3:]
+            self.counters["aim_ids_stripped"] += 1
+        if barcode:
+            self.counters["frames"] += 1
+        return barcode
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._buffer), **self.counters}
@@ -2,10 +2,15 @@ import time
 import os
 import sys
 import threading
+import logging
 import serial  # type: ignore
 from dotenv import load_dotenv
-from collections import deque
-from typing import List, Callable
+from typing import Dict, List, Callable, Optional
+
+from dispatcher import dispatch
+from barcode_framing import BarcodeFramer, parse_control_bytes
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -13,278 +18,313 @@ BARCODE_PORT = str(os.getenv('SCAN_PORT', os.getenv('SCANNER_PORT', 'COM36')))
 BARCODE_BAUDRATE = int(os.getenv('SCAN_BAUD', os.getenv('SCANNER_BAUD', '19200')))
 BARCODE_TIMEOUT = float(os.getenv('SCAN_TIMEOUT', '0.5'))
 BARCODE_MODE = str(os.getenv('SCAN_MODE', 'KEYBOARD')).upper()
+# Serial framing: any terminator byte ends a barcode; prefix/suffix are
+# required and removed when set. Escapes such as "\r\n" or "\x02" are allowed.
+SCAN_TERMINATORS = parse_control_bytes(os.getenv('SCAN_TERMINATORS', '\\r\\n'))
+SCAN_PREFIX = parse_control_bytes(os.getenv('SCAN_PREFIX', ''))
+SCAN_SUFFIX = parse_control_bytes(os.getenv('SCAN_SUFFIX', ''))
+SCAN_STRIP_AIM_ID = os.getenv('SCAN_STRIP_AIM_ID', 'true').lower() == 'true'
+SCAN_MAX_LENGTH = int(os.getenv('SCAN_MAX_LENGTH', '128'))
+SCAN_RECONNECT_DELAY = float(os.getenv('SCAN_RECONNECT_DELAY', '1.0'))
+# Only a repeat of the same barcode this soon is a double read; consecutive
+# copies of one title further apart are separate items and all get routed.
+SCAN_REPEAT_WINDOW = float(os.getenv('SCAN_REPEAT_WINDOW', '0.08'))
 
-_barcode_callbacks: List[Callable[[str], None]] = []
-_barcode_callbacks_lock = threading.Lock()
-_barcode_scanner_thread = None
-_barcode_scanner_running = False
-_barcode_scanner = None
-_barcode_scanner_lock = threading.Lock()
-_barcode_buffer = b""
-_last_barcode = ""
-
-_keyboard_listener = None
-_keyboard_buffer = ""
-_keyboard_last_time = 0
-_keyboard_lock = threading.Lock()
 BARCODE_TIMEOUT_MS = 50
 
-def _on_key_press(key):
-    global _keyboard_buffer, _keyboard_last_time, _last_barcode
-    
-    try:
-        from pynput.keyboard import Key  # type: ignore
-        
-        current_time = time.time() * 1000
-        
-        with _keyboard_lock:
-            time_since_last = current_time - _keyboard_last_time
-            
-            if time_since_last > BARCODE_TIMEOUT_MS:
-                _keyboard_buffer = ""
-            
-            try:
-                if hasattr(key, 'char') and key.char:
-                    _keyboard_buffer += key.char
-                    _keyboard_last_time = current_time
-                elif key == Key.enter or (hasattr(key, 'name') and key.name == 'enter'):
-                    if _keyboard_buffer:
-                        barcode = _keyboard_buffer.strip()
-                        _keyboard_buffer = ""
-                        _keyboard_last_time = 0
-                        
-                        if barcode and barcode != _last_barcode:
-                            _last_barcode = barcode
-                            with _barcode_callbacks_lock:
-                                callbacks = _barcode_callbacks.copy()
-                            
-                            for callback in callbacks:
-                                try:
-                                    threading.Thread(target=callback, args=(barcode,), daemon=True).start()
-                                except:
-                                    pass
-            except AttributeError:
-                pass
-    except Exception:
-        pass 
+class BarcodeScanner:
+    """One barcode scanner: a serial port (or the keyboard wedge) and its callbacks.
 
-def connect_barcode_scanner():
-    global _barcode_scanner
-    
-    if BARCODE_MODE != 'SERIAL':
-        return None
-    
-    with _barcode_scanner_lock:
-        if _barcode_scanner is not None:
-            try:
-                if _barcode_scanner.is_open:
-                    return _barcode_scanner
-                else:
-                    _barcode_scanner.close()
-                    _barcode_scanner = None
-            except:
-                _barcode_scanner = None
-        
+    Serial scanners frame their port on a background thread and hand every
+    new barcode to the callbacks through ``dispatch_source``. Keyboard mode
+    hooks the whole keyboard, so only one scanner in a process can use it.
+    """
+
+    def __init__(self, mode: str = BARCODE_MODE, port: str = BARCODE_PORT, baudrate: int = BARCODE_BAUDRATE,
+                 name: str = "Scanner", dispatch_source: str = "barcode"):
+        self.mode = mode.upper()
+        self.port = port
+        self.baudrate = baudrate
+        self.name = name
+        self.dispatch_source = dispatch_source
+
+        self._callbacks: List[Callable[[str], None]] = []
+        self._callbacks_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._serial = None
+        self._serial_lock = threading.Lock()
+        self._framer = BarcodeFramer(SCAN_TERMINATORS, SCAN_PREFIX, SCAN_SUFFIX, SCAN_STRIP_AIM_ID, SCAN_MAX_LENGTH)
+        self._last_barcode = ""
+        self._last_barcode_at = 0.0
+        self.repeats_suppressed = 0
+
+        self._keyboard_listener = None
+        self._keyboard_buffer = ""
+        self._keyboard_last_time = 0
+        self._keyboard_lock = threading.Lock()
+
+    def _is_repeat(self, barcode):
+        now = time.monotonic()
+        repeat = barcode == self._last_barcode and now - self._last_barcode_at < SCAN_REPEAT_WINDOW
+        self._last_barcode = barcode
+        self._last_barcode_at = now
+        if repeat:
+            self.repeats_suppressed += 1
+        return repeat
+
+    def _deliver(self, barcode):
+        with self._callbacks_lock:
+            callbacks = self._callbacks.copy()
+        for callback in callbacks:
+            dispatch(self.dispatch_source, callback, barcode)
+
+    def _on_key_press(self, key):
         try:
-            _barcode_scanner = serial.Serial(
-                port=BARCODE_PORT,
-                baudrate=BARCODE_BAUDRATE,
-                timeout=BARCODE_TIMEOUT,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                xonxoff=False,
-                rtscts=False,
-                dsrdtr=False
-            )
-            if _barcode_scanner.is_open:
-                _barcode_scanner.reset_input_buffer()
-                _barcode_scanner.reset_output_buffer()
-                return _barcode_scanner
-        except (serial.SerialException, OSError, ValueError) as e:
-            _barcode_scanner = None
+            from pynput.keyboard import Key  # type: ignore
+
+            current_time = time.time() * 1000
+
+            with self._keyboard_lock:
+                time_since_last = current_time - self._keyboard_last_time
+
+                if time_since_last > BARCODE_TIMEOUT_MS:
+                    self._keyboard_buffer = ""
+
+                try:
+                    if hasattr(key, 'char') and key.char:
+                        self._keyboard_buffer += key.char
+                        self._keyboard_last_time = current_time
+                    elif key == Key.enter or (hasattr(key, 'name') and key.name == 'enter'):
+                        if self._keyboard_buffer:
+                            barcode = self._keyboard_buffer.strip()
+                            self._keyboard_buffer = ""
+                            self._keyboard_last_time = 0
+
+                            if barcode and not self._is_repeat(barcode):
+                                self._deliver(barcode)
+                except AttributeError:
+                    pass
+        except Exception:
+            pass
+
+    def connect(self):
+        if self.mode != 'SERIAL':
             return None
-    
-    return None
 
-def is_barcode_scanner_connected():
-    if BARCODE_MODE == 'KEYBOARD':
-        return True
-    
-    global _barcode_scanner
-    with _barcode_scanner_lock:
-        if _barcode_scanner is not None:
+        with self._serial_lock:
+            if self._serial is not None:
+                try:
+                    if self._serial.is_open:
+                        return self._serial
+                    else:
+                        self._serial.close()
+                        self._serial = None
+                except:
+                    self._serial = None
+
             try:
-                return _barcode_scanner.is_open
-            except:
-                return False
-    return False
+                self._serial = serial.Serial(
+                    port=self.port,
+                    baudrate=self.baudrate,
+                    timeout=BARCODE_TIMEOUT,
+                    bytesize=serial.EIGHTBITS,
+                    parity=serial.PARITY_NONE,
+                    stopbits=serial.STOPBITS_ONE,
+                    xonxoff=False,
+                    rtscts=False,
+                    dsrdtr=False
+                )
+                if self._serial.is_open:
+                    self._serial.reset_input_buffer()
+                    self._serial.reset_output_buffer()
+                    return self._serial
+            except (serial.SerialException, OSError, ValueError) as e:
+                self._serial = None
+                return None
 
-def read_barcode():
-    if BARCODE_MODE == 'KEYBOARD':
         return None
-    
-    global _barcode_scanner, _barcode_buffer
-    
-    scanner = None
-    
-    with _barcode_scanner_lock:
-        if _barcode_scanner is not None:
-            try:
-                if _barcode_scanner.is_open:
-                    scanner = _barcode_scanner
-            except:
-                _barcode_scanner = None
-    
-    if scanner is None:
-        scanner = connect_barcode_scanner()
-        if scanner is None:
-            return None
-    
-    try:
-        if scanner.in_waiting > 0:
-            new_data = scanner.read(scanner.in_waiting)
-            _barcode_buffer += new_data
-            
-            while b"\n" in _barcode_buffer or b"\r" in _barcode_buffer:
-                line_end = -1
-                if b"\r\n" in _barcode_buffer:
-                    line_end = _barcode_buffer.index(b"\r\n")
-                    line = _barcode_buffer[:line_end]
-                    _barcode_buffer = _barcode_buffer[line_end + 2:]
-                elif b"\n" in _barcode_buffer:
-                    line_end = _barcode_buffer.index(b"\n")
-                    line = _barcode_buffer[:line_end]
-                    _barcode_buffer = _barcode_buffer[line_end + 1:]
-                elif b"\r" in _barcode_buffer:
-                    line_end = _barcode_buffer.index(b"\r")
-                    line = _barcode_buffer[:line_end]
-                    _barcode_buffer = _barcode_buffer[line_end + 1:]
-                else:
-                    break
-                
+
+    def is_connected(self):
+        if self.mode == 'KEYBOARD':
+            return True
+
+        with self._serial_lock:
+            if self._serial is not None:
                 try:
-                    barcode = line.decode('utf-8', errors='ignore').strip()
-                    if barcode:
-                        return barcode
-                except UnicodeDecodeError:
-                    continue
-        
-        if len(_barcode_buffer) > 100:
-            _barcode_buffer = b""
-            
-    except (serial.SerialException, UnicodeDecodeError, OSError):
-        with _barcode_scanner_lock:
-            if _barcode_scanner is not None:
+                    return self._serial.is_open
+                except:
+                    return False
+        return False
+
+    def read_barcodes(self):
+        """Blocks for up to BARCODE_TIMEOUT on the port; returns the barcodes framed, or None without a port."""
+        if self.mode == 'KEYBOARD':
+            return None
+
+        scanner = None
+
+        with self._serial_lock:
+            if self._serial is not None:
                 try:
-                    _barcode_scanner.close()
+                    if self._serial.is_open:
+                        scanner = self._serial
                 except:
-                    pass
-                _barcode_scanner = None
-        _barcode_buffer = b""
-        return None
-    
-    return None
+                    self._serial = None
 
-def connect_barcode_signal(callback):
-    with _barcode_callbacks_lock:
-        if callback not in _barcode_callbacks:
-            _barcode_callbacks.append(callback)
-            print(f"✅ Registered barcode callback: {callback.__name__}", flush=True)
+        if scanner is None:
+            scanner = self.connect()
+            if scanner is None:
+                return None
+            self._framer.reset()
 
-def disconnect_barcode_signal(callback):
-    with _barcode_callbacks_lock:
-        if callback in _barcode_callbacks:
-            _barcode_callbacks.remove(callback)
-
-def _barcode_scanner_loop():
-    global _barcode_scanner_running, _last_barcode
-    
-    if BARCODE_MODE == 'KEYBOARD':
-        return
-    
-    while _barcode_scanner_running:
         try:
-            barcode = read_barcode()
-            
-            if barcode and barcode != _last_barcode:
-                _last_barcode = barcode
-                with _barcode_callbacks_lock:
-                    callbacks = _barcode_callbacks.copy()
-                
-                for callback in callbacks:
+            # Returns as soon as at least one byte arrives, with whatever else is already waiting.
+            data = scanner.read(scanner.in_waiting or 1)
+        except (serial.SerialException, OSError):
+            with self._serial_lock:
+                if self._serial is not None:
                     try:
-                        threading.Thread(target=callback, args=(barcode,), daemon=True).start()
+                        self._serial.close()
                     except:
                         pass
-            
-            time.sleep(0.01)
-        except:
-            time.sleep(0.1)
+                    self._serial = None
+            self._framer.reset()
+            return None
 
-def start_barcode_scanner():
-    global _barcode_scanner_thread, _barcode_scanner_running, _keyboard_listener
-    
-    if BARCODE_MODE == 'KEYBOARD':
-        try:
-            from pynput import keyboard  # type: ignore
-            
-            _keyboard_listener = keyboard.Listener(on_press=_on_key_press)
-            _keyboard_listener.daemon = True
-            _keyboard_listener.start()
-            print("✅ Global keyboard hook activated for barcode scanning")
-        except ImportError:
-            print("❌ pynput library not found. Install with: pip install pynput")
-            print("⚠️ Falling back to console input mode")
-            import sys
-            def fallback_input():
-                while True:
-                    try:
-                        sys.stdout.write('> ')
-                        sys.stdout.flush()
-                        user_input = sys.stdin.readline()
-                        if user_input:
-                            user_input = user_input.strip()
+        return self._framer.feed(data) if data else []
+
+    def stats(self):
+        return {"mode": self.mode, "port": self.port if self.mode == 'SERIAL' else None,
+                "connected": self.is_connected(), "repeats_suppressed": self.repeats_suppressed,
+                **self._framer.stats()}
+
+    def connect_signal(self, callback):
+        with self._callbacks_lock:
+            if callback not in self._callbacks:
+                self._callbacks.append(callback)
+                logger.info(f"✅ Registered barcode callback on {self.name}: {callback.__name__}")
+
+    def disconnect_signal(self, callback):
+        with self._callbacks_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def _loop(self):
+        if self.mode == 'KEYBOARD':
+            return
+
+        while self._running:
+            try:
+                barcodes = self.read_barcodes()
+                if barcodes is None:
+                    time.sleep(SCAN_RECONNECT_DELAY)
+                    continue
+
+                for barcode in barcodes:
+                    if not self._is_repeat(barcode):
+                        self._deliver(barcode)
+            except:
+                time.sleep(0.1)
+
+    def start(self):
+        if self.mode == 'KEYBOARD':
+            if self._keyboard_listener is not None or (self._thread is not None and self._thread.is_alive()):
+                return
+            try:
+                from pynput import keyboard  # type: ignore
+
+                self._keyboard_listener = keyboard.Listener(on_press=self._on_key_press)
+                self._keyboard_listener.daemon = True
+                self._keyboard_listener.start()
+                logger.info("✅ Global keyboard hook activated for barcode scanning")
+            except ImportError:
+                logger.error("❌ pynput library not found. Install with: pip install pynput")
+                logger.warning("⚠️ Falling back to console input mode")
+                def fallback_input():
+                    while True:
+                        try:
+                            sys.stdout.write('> ')
+                            sys.stdout.flush()
+                            user_input = sys.stdin.readline()
                             if user_input:
-                                with _barcode_callbacks_lock:
-                                    callbacks = _barcode_callbacks.copy()
-                                for callback in callbacks:
-                                    try:
-                                        threading.Thread(target=callback, args=(user_input,), daemon=True).start()
-                                    except:
-                                        pass
-                    except (EOFError, KeyboardInterrupt):
-                        break
-                    except:
-                        time.sleep(0.1)
-            input_thread = threading.Thread(target=fallback_input, daemon=True)
-            input_thread.start()
-        except Exception as e:
-            print(f"❌ Failed to start keyboard hook: {e}")
-        return
-    
-    if _barcode_scanner_thread is None or not _barcode_scanner_thread.is_alive():
-        _barcode_scanner_running = True
-        _barcode_scanner_thread = threading.Thread(target=_barcode_scanner_loop, daemon=True)
-        _barcode_scanner_thread.start()
+                                user_input = user_input.strip()
+                                if user_input:
+                                    self._deliver(user_input)
+                        except (EOFError, KeyboardInterrupt):
+                            break
+                        except:
+                            time.sleep(0.1)
+                self._thread = threading.Thread(target=fallback_input, daemon=True)
+                self._thread.start()
+            except Exception as e:
+                logger.error(f"❌ Failed to start keyboard hook: {e}")
+            return
 
-def stop_barcode_scanner():
-    global _barcode_scanner_running, _barcode_scanner, _keyboard_listener
-    _barcode_scanner_running = False
-    
-    if _keyboard_listener is not None:
-        try:
-            _keyboard_listener.stop()
-        except:
-            pass
-        _keyboard_listener = None
-    
-    with _barcode_scanner_lock:
-        if _barcode_scanner is not None:
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, daemon=True, name=self.name)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+        if self._keyboard_listener is not None:
             try:
-                _barcode_scanner.close()
+                self._keyboard_listener.stop()
             except:
                 pass
-            _barcode_scanner = None
+            self._keyboard_listener = None
+
+        with self._serial_lock:
+            if self._serial is not None:
+                try:
+                    self._serial.close()
+                except:
+                    pass
+                self._serial = None
+
+_scanners: Dict[str, BarcodeScanner] = {}
+_scanners_lock = threading.Lock()
+
+def get_barcode_scanner(port: Optional[str] = None, mode: Optional[str] = None, baudrate: Optional[int] = None,
+                        name: Optional[str] = None, dispatch_source: str = "barcode") -> BarcodeScanner:
+    """The scanner on ``port``, created on first use; the configured default scanner without one."""
+    port = port or BARCODE_PORT
+    with _scanners_lock:
+        scanner = _scanners.get(port)
+        if scanner is None:
+            scanner = BarcodeScanner(mode or BARCODE_MODE, port, baudrate or BARCODE_BAUDRATE,
+                                     name=name or "Scanner", dispatch_source=dispatch_source)
+            _scanners[port] = scanner
+        return scanner
+
+# Module-level API for the default scanner.
+_default = get_barcode_scanner()
+_barcode_callbacks = _default._callbacks
+
+def connect_barcode_scanner():
+    return _default.connect()
+
+def is_barcode_scanner_connected():
+    return _default.is_connected()
+
+def read_barcodes():
+    return _default.read_barcodes()
+
+def get_scanner_stats():
+    return _default.stats()
+
+def connect_barcode_signal(callback):
+    _default.connect_signal(callback)
+
+def disconnect_barcode_signal(callback):
+    _default.disconnect_signal(callback)
+
+def start_barcode_scanner():
+    _default.start()
+
+def stop_barcode_scanner():
+    _default.stop()
 
-start_barcode_scanner()
\ No newline at end of file
+start_barcode_scanner()
@@ -0,0 +1,116 @@
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    """Error-rate and latency circuit breaker over a sliding window of calls.
+
+    Calls slower than ``slow_call`` count as failures. Once at least
+    ``min_calls`` are in the window and the failure share reaches
+    ``failure_rate`` the breaker opens and ``allow()`` fails fast for
+    ``open_seconds``; it then lets ``half_open_trials`` probes through and
+    closes only if they all succeed.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call: float = 2.0, open_seconds: float = 10.0, half_open_trials: int = 2):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.half_open_trials = max(1, half_open_trials)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._calls: deque = deque(maxlen=window)
+        self._trials_started = 0
+        self._trials_passed = 0
+        self._transitions: deque = deque(maxlen=20)
+        self.counters = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._trials_started < self.half_open_trials:
+                self._trials_started += 1
+                return True
+            self.counters["rejected"] += 1
+            return False
+
+    def record(self, success: bool, latency: float = 0.0):
+        slow = success and latency > self.slow_call
+        failed = not success or slow
+        with self._lock:
+            self.counters["calls"] += 1
+            if not success:
+                self.counters["failures"] += 1
+            if slow:
+                self.counters["slow_calls"] += 1
+
+            state = self._current_state(time.monotonic())
+            if state == HALF_OPEN:
+                if failed:
+                    self._transition(OPEN, "half-open probe failed")
+                else:
+                    self._trials_passed += 1
+                    if self._trials_passed >= self.half_open_trials:
+                        self._transition(CLOSED, "half-open probes succeeded")
+            elif state == CLOSED:
+                self._calls.append(failed)
+                if len(self._calls) >= self.min_calls:
+                    rate = sum(self._calls) / len(self._calls)
+                    if rate >= self.failure_rate:
+                        self._transition(OPEN, f"failure rate {rate:.0%} over last {len(self._calls)} calls")
+
+    def _current_state(self, now: float) -> str:
+        # Open turns half-open lazily once the cool-down has passed.
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, "cool-down elapsed")
+        return self._state
+
+    def _transition(self, state: str, reason: str):
+        previous = self._state
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self.counters["opened"] += 1
+        if state == HALF_OPEN:
+            self._trials_started = 0
+            self._trials_passed = 0
+        if state == CLOSED:
+            self._calls.clear()
+        self._transitions.append({"from": previous, "to": state, "reason": reason, "at": time.time()})
+        log = logger.warning if state != CLOSED else logger.info
+        log(f"🔌 Circuit breaker {self.name}: {previous} → {state} ({reason})")
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            window = len(self._calls)
+            return {
+                "state": state,
+                "state_code": STATE_CODES[state],
+                "window_calls": window,
+                "window_failure_rate": (sum(self._calls) / window) if window else 0.0,
+                "transitions": list(self._transitions),
+                **self.counters,
+            }
@@ -0,0 +1,351 @@
+import math
+import os
+import threading
+import time
+import logging
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Scanner-to-photo-eye travel assumed until it has been learned, and the
+# shortest travel an edge can possibly belong to.
+SCAN_TO_EYE_SECONDS = float(os.getenv('SCAN_TO_EYE_SECONDS', '2.0'))
+SCAN_TO_EYE_MIN = float(os.getenv('SCAN_TO_EYE_MIN', '0.2'))
+SCAN_TO_EYE_MAX = float(os.getenv('SCAN_TO_EYE_MAX', '10.0'))
+# A match must land within this many seconds (or 4 sigma, up to twice this)
+# of the expected arrival.
+CORRELATION_TOLERANCE = float(os.getenv('CORRELATION_TOLERANCE', '0.1'))
+# Travel is learned once this many edges agree on it, from the last
+# CORRELATION_LEARN_WINDOW scans and edges; after CORRELATION_RESYNC_AFTER
+# edges in a row fit no scan it is re-learned.
+CORRELATION_LEARN_SAMPLES = int(os.getenv('CORRELATION_LEARN_SAMPLES', '6'))
+CORRELATION_LEARN_WINDOW = int(os.getenv('CORRELATION_LEARN_WINDOW', '32'))
+CORRELATION_RESYNC_AFTER = int(os.getenv('CORRELATION_RESYNC_AFTER', '3'))
+CORRELATION_CANDIDATES = int(os.getenv('CORRELATION_CANDIDATES', '4'))
+# The PLC numbers items cyclically from POSITION_ID_FIRST.
+POSITION_ID_FIRST = int(os.getenv('POSITION_ID_FIRST', '101'))
+POSITION_ID_COUNT = int(os.getenv('POSITION_ID_COUNT', '50'))
+
+_EWMA_ALPHA = 0.1
+
+class _Scan:
+    __slots__ = ("item", "scanned_at", "live")
+
+    def __init__(self, item, scanned_at: float):
+        self.item = item
+        self.scanned_at = scanned_at
+        self.live = True
+
+class ScanCorrelator:
+    """Matches photo-eye edges to scans by travel time and PLC position ID.
+
+    Pending scans sit in a ring ordered by scan time; an edge only ever looks
+    at the first few that could have reached the eye. Until the travel time
+    has been learned the oldest one wins (plain FIFO); afterwards the edge
+    takes the oldest whose expected arrival it fits. Older scans it skips
+    are given up as never reaching the eye; an edge too early for every scan
+    is a book that was not scanned and shifts nothing. A repeated position
+    ID is a double trigger; skipped IDs are edges the monitor missed and go
+    to the scans waiting for them. When edges keep fitting nothing the
+    travel estimate is wrong and is re-learned.
+
+    Travel is learned by cross-correlating recent scan and edge times: the
+    delay most edge/scan pairs share is the belt's, whichever scans FIFO
+    happened to pair up. Evenly spaced books make every multiple of the
+    spacing look alike; the candidate nearest the previous estimate wins.
+    """
+
+    def __init__(self, travel: float = SCAN_TO_EYE_SECONDS, travel_min: float = SCAN_TO_EYE_MIN,
+                 travel_max: float = SCAN_TO_EYE_MAX, tolerance: float = CORRELATION_TOLERANCE,
+                 learn_samples: int = CORRELATION_LEARN_SAMPLES, learn_window: int = CORRELATION_LEARN_WINDOW,
+                 resync_after: int = CORRELATION_RESYNC_AFTER, candidates: int = CORRELATION_CANDIDATES,
+                 position_first: int = POSITION_ID_FIRST, position_count: int = POSITION_ID_COUNT):
+        self.travel_min = travel_min
+        self.travel_max = travel_max
+        self.learn_samples = learn_samples
+        self.tolerance = tolerance
+        self.resync_after = max(1, resync_after)
+        self.candidates = max(1, candidates)
+        self.position_first = position_first
+        self.position_count = position_count
+
+        self._lock = threading.Lock()
+        self._pending: deque = deque()
+        self._by_id: Dict[Any, _Scan] = {}
+        self._last_position: Optional[int] = None
+        self._travel = travel
+        self._travel_var = 0.0
+        self._learned = False
+        self._scan_times: deque = deque(maxlen=learn_window)
+        self._edge_times: deque = deque(maxlen=learn_window)
+        self._misfits = 0
+        self._orphans: deque = deque(maxlen=max(1, resync_after))
+        self._confidence_total = 0.0
+        self.counters = {
+            "scans": 0, "edges": 0, "matched": 0, "recovered": 0, "orphan_edges": 0,
+            "double_triggers": 0, "missed_edges": 0, "unmatched_scans": 0, "low_confidence": 0,
+            "resyncs": 0,
+        }
+        self._skew_max = 0.0
+        self._skew_last = 0.0
+
+    @property
+    def travel(self) -> float:
+        """Current scan-to-eye travel estimate in seconds."""
+        with self._lock:
+            return self._travel
+
+    def add_scan(self, item, scanned_at: Optional[float] = None):
+        if scanned_at is None:
+            scanned_at = time.monotonic()
+        scan = _Scan(item, scanned_at)
+        with self._lock:
+            self._pending.append(scan)
+            self._by_id[item.id] = scan
+            self._scan_times.append(scanned_at)
+            self.counters["scans"] += 1
+
+    def discard(self, item) -> bool:
+        # Lazy: the dead entry is skipped when it reaches the head of the ring.
+        with self._lock:
+            scan = self._by_id.pop(item.id, None)
+            if scan is None:
+                return False
+            scan.live = False
+            return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._by_id)
+
+    def _position_index(self, position_id) -> Optional[int]:
+        if not position_id or position_id < self.position_first:
+            return None
+        return (position_id - self.position_first) % self.position_count
+
+    def _tolerance(self) -> float:
+        return min(max(self.tolerance, 4.0 * math.sqrt(self._travel_var)), 2.0 * self.tolerance)
+
+    def _pop(self, scan: _Scan):
+        scan.live = False
+        self._by_id.pop(scan.item.id, None)
+
+    def on_edge(self, position_id: int, edge_at: Optional[float] = None) -> Tuple[List[Tuple[Any, int, float]], List[Any]]:
+        """Returns ``(matches, unmatched)``.
+
+        ``matches`` is a list of ``(item, position_id, confidence)``: normally
+        one entry, more when missed edges are recovered from skipped position
+        IDs. ``unmatched`` are items given up as never reaching the eye.
+        """
+        if edge_at is None:
+            edge_at = time.monotonic()
+        with self._lock:
+            self.counters["edges"] += 1
+            index = self._position_index(position_id)
+
+            gap = 1
+            if index is not None and self._last_position is not None:
+                gap = (index - self._last_position) % self.position_count
+                if gap == 0:
+                    self.counters["double_triggers"] += 1
+                    return [], []
+            if index is not None:
+                self._last_position = index
+            self._edge_times.append(edge_at)
+            sequence_ok = gap == 1
+            if gap > 1:
+                self.counters["missed_edges"] += gap - 1
+
+            self._compact()
+            eligible = []
+            for scan in self._pending:
+                if len(eligible) >= self.candidates + gap - 1:
+                    break
+                if not scan.live:
+                    continue
+                if scan.scanned_at + self.travel_min > edge_at:
+                    break
+                eligible.append(scan)
+
+            matches = []
+            # Edges the monitor missed still got IDs from the PLC; the oldest
+            # waiting scans passed the eye under those IDs.
+            if index is not None and gap > 1:
+                for offset in range(gap - 1, 0, -1):
+                    if len(eligible) <= 1:
+                        break
+                    scan = eligible.pop(0)
+                    missed_id = self.position_first + (index - offset) % self.position_count
+                    matches.append(self._match(scan, missed_id, 0.5))
+                    self.counters["recovered"] += 1
+
+            if not eligible:
+                self.counters["orphan_edges"] += 1
+                self._compact()
+                return matches, []
+
+            learned = self._learned
+            tolerance = self._tolerance()
+            best = eligible[0]
+            unmatched = []
+            if learned:
+                # Eligible scans run from oldest (edge late for them) to newest
+                # (edge early); take the oldest one the edge fits.
+                fit = None
+                for scan in eligible:
+                    skew = edge_at - scan.scanned_at - self._travel
+                    if abs(skew) <= tolerance:
+                        fit = scan
+                        break
+                    if skew < -tolerance:
+                        break
+                if fit is None:
+                    early = edge_at - best.scanned_at - self._travel < -tolerance
+                    if early:
+                        self._orphans.append((position_id, edge_at))
+                    if self._misfit():
+                        # The edges just orphaned were most likely real: replay them in scan order.
+                        matches += self._replay()
+                        if early:
+                            self._compact()
+                            return matches, []
+                        eligible = [scan for scan in eligible if scan.live]
+                        learned = False
+                    elif early:
+                        # Too early for every waiting scan: a book that was never scanned.
+                        self.counters["orphan_edges"] += 1
+                        self._compact()
+                        return matches, []
+                    if not eligible:
+                        self._compact()
+                        return matches, []
+                    best = eligible[0]
+                    # Otherwise late for everything (the belt slowed or
+                    # stopped): keep scan order and learn nothing from it.
+                else:
+                    self._misfits = 0
+                    self._orphans.clear()
+                    for scan in eligible:
+                        if scan is fit:
+                            break
+                        # A later scan fits, so this one's book never reached the eye.
+                        self._pop(scan)
+                        unmatched.append(scan.item)
+                    best = fit
+
+            skew = edge_at - best.scanned_at - self._travel
+            confidence = 0.5
+            if learned:
+                confidence = max(0.0, 1.0 - abs(skew) / tolerance)
+                # Discount matches another waiting scan would have fitted almost as well.
+                rival = min((abs(edge_at - scan.scanned_at - self._travel) for scan in eligible if scan is not best),
+                            default=None)
+                if rival is not None and rival <= tolerance:
+                    confidence *= 0.5 + 0.5 * max(0.0, rival - abs(skew)) / tolerance
+            if not sequence_ok or index is None:
+                confidence *= 0.5
+            matches.append(self._match(best, position_id, confidence))
+
+            if learned:
+                if confidence >= 0.5:
+                    self._adapt(edge_at - best.scanned_at)
+                self._skew_last = skew
+                self._skew_max = max(self._skew_max, abs(skew))
+            else:
+                self._learn()
+            self.counters["unmatched_scans"] += len(unmatched)
+            self._compact()
+            return matches, unmatched
+
+    def _match(self, scan: _Scan, position_id: int, confidence: float):
+        self._pop(scan)
+        self.counters["matched"] += 1
+        if confidence < 0.5:
+            self.counters["low_confidence"] += 1
+        self._confidence_total += confidence
+        return scan.item, position_id, confidence
+
+    def _compact(self):
+        while self._pending and not self._pending[0].live:
+            self._pending.popleft()
+
+    def _misfit(self) -> bool:
+        self._misfits += 1
+        if self._misfits < self.resync_after:
+            return False
+        self._learned = False
+        self._misfits = 0
+        self.counters["resyncs"] += 1
+        logger.warning(f"⚠️ Photo eye edges stopped fitting scans (travel {self._travel:.2f}s), re-learning")
+        return True
+
+    def _replay(self) -> list:
+        matches = []
+        while self._orphans:
+            position_id, edge_at = self._orphans.popleft()
+            scan = next((scan for scan in self._pending if scan.live), None)
+            if scan is None or scan.scanned_at + self.travel_min > edge_at:
+                continue
+            matches.append(self._match(scan, position_id, 0.25))
+            self.counters["recovered"] += 1
+        self._learn()
+        return matches
+
+    def _learn(self):
+        if len(self._edge_times) < self.learn_samples:
+            return
+        width = self.tolerance / 4
+        delays: Dict[int, List[float]] = {}
+        for edge_at in self._edge_times:
+            seen = set()
+            for scanned_at in self._scan_times:
+                delay = edge_at - scanned_at
+                if self.travel_min <= delay <= self.travel_max:
+                    bucket = int(delay / width)
+                    # Each edge votes once per bucket.
+                    if bucket not in seen:
+                        seen.add(bucket)
+                        delays.setdefault(bucket, []).append(delay)
+        counts = Counter({bucket: len(values) for bucket, values in delays.items()})
+        if not counts:
+            return
+        # Score adjacent bucket pairs so a peak split across a boundary still counts.
+        scores = {bucket: counts[bucket] + counts[bucket + 1] for bucket in counts}
+        best = max(scores.values())
+        if best < self.learn_samples:
+            return
+        candidates = [bucket for bucket, score in scores.items() if score >= 0.8 * best]
+        bucket = min(candidates, key=lambda bucket: abs((bucket + 1) * width - self._travel))
+        if (max(candidates) - min(candidates) > 2 and abs((bucket + 1) * width - self._travel) > self.tolerance
+                and len(self._edge_times) < self._edge_times.maxlen):
+            # Several delays fit about equally well and none is the one
+            # expected; wait for more edges.
+            return
+        values = sorted(delays.get(bucket, []) + delays.get(bucket + 1, []))
+        self._travel = values[len(values) // 2]
+        self._travel_var = 0.0
+        self._learned = True
+        self._misfits = 0
+        self._orphans.clear()
+        logger.info(f"✅ Scan-to-eye travel learned: {self._travel:.2f}s")
+
+    def _adapt(self, travel: float):
+        delta = travel - self._travel
+        self._travel += _EWMA_ALPHA * delta
+        self._travel_var = (1 - _EWMA_ALPHA) * (self._travel_var + _EWMA_ALPHA * delta * delta)
+
+    def stats(self) -> dict:
+        with self._lock:
+            matched = self.counters["matched"]
+            return {
+                "pending": len(self._by_id),
+                "travel": self._travel,
+                "travel_std": math.sqrt(self._travel_var),
+                "learned": self._learned,
+                "tolerance": self._tolerance(),
+                "skew_last": self._skew_last,
+                "skew_max": self._skew_max,
+                "confidence_avg": (self._confidence_total / matched) if matched else 0.0,
+                **self.counters,
+            }
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class DeadlineTracker:
+    """Fires ``on_expire(key)`` once each scheduled deadline (epoch seconds) passes.
+
+    Rescheduling a key replaces its previous deadline; stale heap entries are
+    skipped lazily when they surface.
+    """
+
+    def __init__(self, on_expire: Callable[[str], None], name: str = "DeadlineTracker"):
+        self.on_expire = on_expire
+        self.name = name
+        self._heap: List[Tuple[float, int, str]] = []
+        self._current: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"scheduled": 0, "cancelled": 0, "expired": 0}
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def schedule(self, key: str, deadline: float):
+        with self._cond:
+            sequence = next(self._sequence)
+            self._current[key] = sequence
+            heapq.heappush(self._heap, (deadline, sequence, key))
+            self.counters["scheduled"] += 1
+            if self._heap[0][1] == sequence:
+                self._cond.notify()
+
+    def cancel(self, key: str) -> bool:
+        with self._cond:
+            if self._current.pop(key, None) is None:
+                return False
+            self.counters["cancelled"] += 1
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                while self._heap and self._current.get(self._heap[0][2]) != self._heap[0][1]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, sequence, key = self._heap[0]
+                delay = deadline - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                del self._current[key]
+                self.counters["expired"] += 1
+            try:
+                self.on_expire(key)
+            except Exception as e:
+                logger.error(f"❌ Deadline handler failed for {key}: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"pending": len(self._current), **self.counters}
+
+class DeadlineGate:
+    """Asyncio admission gate that lets at most ``limit`` holders in at once,
+    admitting waiters earliest-deadline-first instead of in arrival order."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._active = 0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self.counters = {"admitted": 0, "queued": 0}
+
+    async def acquire(self, deadline: Optional[float] = None):
+        # Live waiters only exist while every slot is taken, so a free slot
+        # can be handed out directly.
+        if self._active < self.limit:
+            self._active += 1
+            self.counters["admitted"] += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (deadline if deadline is not None else float("inf"), next(self._sequence), waiter))
+        self.counters["queued"] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as we were cancelled; pass the slot on.
+                self.release()
+            raise
+        self.counters["admitted"] += 1
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                # The slot moves straight to the next waiter; _active is unchanged.
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def slot(self, deadline: Optional[float] = None):
+        return _GateSlot(self, deadline)
+
+    def stats(self) -> dict:
+        return {"active": self._active, "waiting": len(self._waiters), **self.counters}
+
+class _GateSlot:
+    def __init__(self, gate: DeadlineGate, deadline: Optional[float]):
+        self.gate = gate
+        self.deadline = deadline
+
+    async def __aenter__(self):
+        await self.gate.acquire(self.deadline)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.gate.release()
+        return False
@@ -0,0 +1,257 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping overhead (OrderedDict node, tuple, floats) on top
+# of the key and serialized value lengths.
+ENTRY_OVERHEAD_BYTES = 160
+
+class DecisionCache:
+    """Thread-safe LRU + TTL cache with an optional SQLite (WAL) backing store.
+
+    Reads and writes only touch memory; changes are written behind to disk by a
+    background thread so the hot path never waits on the filesystem. Entries
+    use ``ttl`` unless ``set``/``extend`` give them their own lifetime.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 50000, max_bytes: int = 32 * 1024 * 1024,
+                 db_path: Optional[str] = None, flush_interval: float = 2.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+
+        # key -> (value, stored_at, size, ttl)
+        self._entries: "OrderedDict[str, Tuple[Any, float, int, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._dirty: Dict[str, Tuple[str, float, float]] = {}
+        self._deleted: set = set()
+        self._flush_event = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._running = False
+
+        if db_path:
+            self._open_db(db_path)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at, _, ttl = entry
+            if now - stored_at >= ttl:
+                self._remove(key)
+                self._forget(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None, ttl: Optional[float] = None):
+        if stored_at is None:
+            stored_at = time.time()
+        if ttl is None:
+            ttl = self.ttl
+        encoded = json.dumps(value, separators=(",", ":"))
+        size = len(key) + len(encoded) + ENTRY_OVERHEAD_BYTES
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, stored_at, size, ttl)
+            self._bytes += size
+            self._deleted.discard(key)
+            if self._db is not None:
+                self._dirty[key] = (encoded, stored_at, ttl)
+            self._evict()
+
+    def extend(self, key: str, ttl: float) -> bool:
+        """Keeps a live entry for at least ``ttl`` more seconds.
+
+        Not a lookup: hit/miss counters are left alone. Returns False when the
+        key is missing or already expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] >= entry[3]:
+                return False
+            value, stored_at, size, current = entry
+            if stored_at + current - now < ttl:
+                self._entries[key] = (value, now, size, ttl)
+                if self._db is not None:
+                    self._dirty[key] = (json.dumps(value, separators=(",", ":")), now, ttl)
+            self._entries.move_to_end(key)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self._forget(key)
+
+    def clear(self):
+        with self._lock:
+            if self._db is not None:
+                self._deleted.update(self._entries.keys())
+            self._entries.clear()
+            self._dirty.clear()
+            self._bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.time() - entry[1] < entry[3]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "persistent": self._db is not None,
+                "pending_writes": len(self._dirty) + len(self._deleted),
+            }
+
+    def _remove(self, key: str):
+        size = self._entries.pop(key)[2]
+        self._bytes -= size
+
+    def _forget(self, key: str):
+        # Pending deletes only matter to the write-behind store; without one
+        # the set would just grow with every expiry and eviction.
+        self._dirty.pop(key, None)
+        if self._db is not None:
+            self._deleted.add(key)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, (_, _, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._forget(key)
+            self.evictions += 1
+
+    def _open_db(self, db_path: str):
+        try:
+            db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS decisions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, ttl REAL)"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(decisions)")}
+            if "ttl" not in columns:
+                # Stores written before per-entry lifetimes; NULL means the default TTL.
+                db.execute("ALTER TABLE decisions ADD COLUMN ttl REAL")
+        except sqlite3.Error as e:
+            logger.error(f"❌ Failed to open decision cache store {db_path}: {e}")
+            return
+
+        self._db = db
+        self._load()
+        self._running = True
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True, name="DecisionCache-Flush")
+        self._flush_thread.start()
+
+    def _load(self):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("DELETE FROM decisions WHERE stored_at + COALESCE(ttl, ?) <= ?", (self.ttl, now))
+            rows = self._db.execute(
+                "SELECT key, value, stored_at, ttl FROM decisions ORDER BY stored_at DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+
+        loaded = 0
+        with self._lock:
+            for key, encoded, stored_at, ttl in reversed(rows):
+                try:
+                    value = json.loads(encoded)
+                except json.JSONDecodeError:
+                    continue
+                size = len(key) + len(encoded) + ENTRY_OVERHEAD_BYTES
+                self._entries[key] = (value, stored_at, size, self.ttl if ttl is None else ttl)
+                self._bytes += size
+                loaded += 1
+            evictions = self.evictions
+            self._evict()
+            self.evictions = evictions
+        logger.info(f"✅ Decision cache warmed with {loaded} entries from disk")
+
+    def _flush_loop(self):
+        while self._running:
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            self.flush()
+
+    def flush(self):
+        if self._db is None:
+            with self._lock:
+                self._dirty.clear()
+                self._deleted.clear()
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            deleted, self._deleted = self._deleted, set()
+        if not dirty and not deleted:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute("BEGIN")
+                if deleted:
+                    self._db.executemany("DELETE FROM decisions WHERE key = ?", [(key,) for key in deleted])
+                if dirty:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO decisions (key, value, stored_at, ttl) VALUES (?, ?, ?, ?)",
+                        [(key, encoded, stored_at, ttl) for key, (encoded, stored_at, ttl) in dirty.items()],
+                    )
+                self._db.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"❌ Decision cache flush failed: {e}")
+            try:
+                with self._db_lock:
+                    self._db.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        self._running = False
+        self._flush_event.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join(timeout=2)
+        self.flush()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
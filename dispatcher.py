@@ -0,0 +1,163 @@
+import os
+import queue
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Workers per pool (one pool per conveyor line). Each source is served by a
+# single worker to keep its events in order, so extra workers only add
+# parallelism across sources (barcode, photo_eye, promise, ...); they never
+# speed up one busy source such as a line's "promise" callbacks.
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '4'))
+DISPATCH_QUEUE_SIZE = int(os.getenv('DISPATCH_QUEUE_SIZE', '256'))
+DISPATCH_PUT_TIMEOUT = float(os.getenv('DISPATCH_PUT_TIMEOUT', '0.5'))
+
+class Dispatcher:
+    """Fixed-size worker pool for event callbacks.
+
+    Every named source is pinned to one worker, so events from the same source
+    (e.g. photo-eye edges) are always delivered in order. The price is that a
+    source never runs on more than one thread: its throughput is one worker's,
+    whatever ``workers`` is, and sources beyond ``workers`` share threads
+    round-robin. Only ``source=None`` spreads across the pool. Queues are bounded:
+    a producer that outruns its worker blocks for up to ``put_timeout`` and the
+    event is dropped (and counted) if the worker still has not caught up.
+    Producers that must never block (event-loop threads) pass ``block=False``
+    and handle the drop themselves.
+    """
+
+    def __init__(self, name: str = "Dispatch", workers: int = DISPATCH_WORKERS,
+                 queue_size: int = DISPATCH_QUEUE_SIZE, put_timeout: float = DISPATCH_PUT_TIMEOUT):
+        self.name = name
+        self.put_timeout = put_timeout
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self._threads: List[threading.Thread] = []
+        self._sources: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._running = True
+
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "blocked": 0,
+            "dropped": 0,
+        }
+        self._max_depth = [0] * len(self._queues)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for index, work_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._worker, args=(work_queue,), daemon=True, name=f"{name}-{index}")
+            thread.start()
+            self._threads.append(thread)
+
+    def _slot_for(self, source: Optional[str]) -> int:
+        if source is None:
+            return min(range(len(self._queues)), key=lambda i: self._queues[i].qsize())
+        with self._lock:
+            slot = self._sources.get(source)
+            if slot is None:
+                slot = len(self._sources) % len(self._queues)
+                self._sources[source] = slot
+            return slot
+
+    def submit(self, source: Optional[str], callback: Callable, *args, block: bool = True) -> bool:
+        if not self._running:
+            return False
+
+        slot = self._slot_for(source)
+        work_queue = self._queues[slot]
+        entry = (callback, args, time.monotonic())
+        try:
+            work_queue.put_nowait(entry)
+        except queue.Full:
+            try:
+                if not block:
+                    raise
+                with self._lock:
+                    self._stats["blocked"] += 1
+                work_queue.put(entry, timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self._stats["dropped"] += 1
+                logger.warning(f"⚠️ {self.name}: queue for '{source}' is full, dropped {getattr(callback, '__name__', callback)}")
+                return False
+
+        with self._lock:
+            self._stats["submitted"] += 1
+            depth = work_queue.qsize()
+            if depth > self._max_depth[slot]:
+                self._max_depth[slot] = depth
+        return True
+
+    def _worker(self, work_queue: queue.Queue):
+        while True:
+            entry = work_queue.get()
+            if entry is None:
+                break
+            callback, args, queued_at = entry
+            waited = time.monotonic() - queued_at
+            try:
+                callback(*args)
+                outcome = "completed"
+            except Exception as e:
+                logger.error(f"❌ {self.name}: callback {getattr(callback, '__name__', callback)} failed: {e}", exc_info=True)
+                outcome = "failed"
+            with self._lock:
+                self._stats[outcome] += 1
+                self._wait_total += waited
+                if waited > self._wait_max:
+                    self._wait_max = waited
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self._stats["completed"] + self._stats["failed"]
+            return {
+                **self._stats,
+                "workers": len(self._queues),
+                "queue_depths": [work_queue.qsize() for work_queue in self._queues],
+                "max_queue_depths": list(self._max_depth),
+                "sources": dict(self._sources),
+                "avg_wait_ms": (self._wait_total / finished * 1000) if finished else 0.0,
+                "max_wait_ms": self._wait_max * 1000,
+            }
+
+    def shutdown(self, timeout: float = 2.0):
+        self._running = False
+        for work_queue in self._queues:
+            try:
+                work_queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+_dispatcher: Optional[Dispatcher] = None
+_line_dispatchers: Dict[str, Dispatcher] = {}
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher(line: Optional[str] = None) -> Dispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if line is None:
+            if _dispatcher is None:
+                _dispatcher = Dispatcher()
+            return _dispatcher
+        dispatcher = _line_dispatchers.get(line)
+        if dispatcher is None:
+            dispatcher = Dispatcher(name=f"Dispatch-{line}")
+            _line_dispatchers[line] = dispatcher
+        return dispatcher
+
+def dispatch(source: Optional[str], callback: Callable, *args, block: bool = True) -> bool:
+    # Sources named "<kind>:<line>" belong to an additional conveyor line and run
+    # on that line's own pool, so a stalled PLC on one line never holds up another.
+    line = source.partition(":")[2] if source else ""
+    return get_dispatcher(line or None).submit(source, callback, *args, block=block)
+
+def get_dispatch_stats(line: Optional[str] = None) -> dict:
+    return get_dispatcher(line).stats()
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EMIT_INTERVAL = float(os.getenv('EMIT_INTERVAL', '0.05'))
+EMIT_EVENT = 'items_batch'
+
+# Fields that are always sent with an update so the client can key and order it.
+_IDENTITY_FIELDS = ("id", "barcode", "version")
+
+class ItemEmitter:
+    """Collects item changes and broadcasts them as one Socket.IO frame per interval.
+
+    Hot-path callers only mark a record dirty; serialising, diffing against
+    what was last sent and emitting all happen on the emitter thread. Several
+    changes to one item inside a frame collapse into one entry, and updates
+    carry only the fields that changed.
+
+    ``mark`` must be called under the record lock in the same critical section
+    that bumped the record's version (ItemStore's ``on_change`` does this), and
+    frames are cut under that lock too. A frame's "version" is then a safe
+    ``/book-dict`` cursor: every change up to it is in this or an earlier frame.
+    """
+
+    def __init__(self, socketio, lock=None, interval: float = EMIT_INTERVAL, event: str = EMIT_EVENT,
+                 room: Optional[str] = None):
+        self.socketio = socketio
+        self.interval = interval
+        self.event = event
+        # Frames go only to clients in `room` (one per conveyor line); None broadcasts.
+        self.room = room
+        self._record_lock = lock if lock is not None else threading.RLock()
+        self._lock = threading.Lock()
+        self._dirty: "OrderedDict[str, object]" = OrderedDict()
+        self._removed: "OrderedDict[str, dict]" = OrderedDict()
+        self._last_sent: Dict[str, dict] = {}
+        self._wake = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"marks": 0, "frames": 0, "added": 0, "updated": 0, "removed": 0, "coalesced": 0, "errors": 0}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ItemEmitter")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def mark(self, record):
+        with self._lock:
+            self.counters["marks"] += 1
+            if record.retired_at is not None:
+                self._dirty.pop(record.id, None)
+                self._removed[record.id] = {"id": record.id, "barcode": record.barcode,
+                                            "status": record.status, "version": record.version}
+            else:
+                if record.id in self._dirty:
+                    self.counters["coalesced"] += 1
+                self._dirty[record.id] = record
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            self._wake.wait()
+            # Let the rest of the frame accumulate before flushing.
+            time.sleep(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                with self._lock:
+                    self.counters["errors"] += 1
+                logger.error(f"❌ Item emit failed: {e}", exc_info=True)
+
+    def flush(self) -> Optional[dict]:
+        with self._record_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, OrderedDict()
+                removed, self._removed = self._removed, OrderedDict()
+            if not dirty and not removed:
+                return None
+            snapshots = [record.to_dict() for record in dirty.values()]
+
+        added = []
+        updated = []
+        for item in snapshots:
+            previous = self._last_sent.get(item["id"])
+            self._last_sent[item["id"]] = item
+            if previous is None:
+                added.append(item)
+                continue
+            changes = {key: value for key, value in item.items() if previous.get(key) != value}
+            if changes:
+                for key in _IDENTITY_FIELDS:
+                    changes[key] = item[key]
+                updated.append(changes)
+
+        gone = []
+        for item_id, payload in removed.items():
+            # Items that appeared and retired inside one frame were never shown.
+            if self._last_sent.pop(item_id, None) is not None:
+                gone.append(payload)
+
+        if not added and not updated and not gone:
+            return None
+
+        versions = [entry["version"] for entry in added + updated + gone]
+        frame = {"added": added, "updated": updated, "removed": gone, "version": max(versions)}
+        self.socketio.emit(self.event, frame, to=self.room)
+
+        with self._lock:
+            self.counters["frames"] += 1
+            self.counters["added"] += len(added)
+            self.counters["updated"] += len(updated)
+            self.counters["removed"] += len(gone)
+        return frame
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": len(self._dirty) + len(self._removed), "tracked": len(self._last_sent), **self.counters}
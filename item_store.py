@@ -0,0 +1,296 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ITEM_TIMEOUT = float(os.getenv('ITEM_TIMEOUT', '120'))
+# Belt-position retirement belongs to the tracker; this is only a backstop.
+ITEM_RETIRE_MARGIN = float(os.getenv('ITEM_RETIRE_MARGIN', '5.0'))
+ITEM_STORE_MAX_ACTIVE = int(os.getenv('ITEM_STORE_MAX_ACTIVE', '1000'))
+COMPLETED_ITEMS = int(os.getenv('COMPLETED_ITEMS', '200'))
+ITEM_HISTORY_FILE = os.getenv('ITEM_HISTORY_FILE', 'item_history.jsonl')
+ITEM_TOMBSTONES = int(os.getenv('ITEM_TOMBSTONES', '2000'))
+
+class ItemRecord:
+    __slots__ = (
+        "id", "barcode", "start_time", "created_at", "positionId", "positionCm",
+        "pusher", "label", "distance", "status", "error", "trace", "retired_at", "version",
+        "decision", "confidence",
+    )
+
+    def __init__(self, item_id: str, barcode: str, created_at: Optional[float] = None):
+        self.id = item_id
+        self.barcode = barcode
+        self.created_at = created_at if created_at is not None else time.time()
+        self.start_time = self.created_at
+        self.positionId = None
+        self.positionCm = None
+        self.pusher = None
+        self.label = None
+        self.distance = None
+        self.status = "pending"
+        self.error = None
+        self.trace: Dict[str, float] = {}
+        self.retired_at = None
+        self.version = 0
+        self.decision = None
+        self.confidence = None
+
+    def to_dict(self) -> dict:
+        item = {
+            "id": self.id,
+            "barcode": self.barcode,
+            "start_time": self.start_time,
+            "positionId": self.positionId,
+            "positionCm": self.positionCm,
+            "pusher": self.pusher,
+            "label": self.label,
+            "distance": self.distance,
+            "status": self.status,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created_at)),
+            "trace": dict(self.trace),
+            "version": self.version,
+            "decision": self.decision,
+            "confidence": self.confidence,
+        }
+        if self.error is not None:
+            item["error"] = self.error
+        return item
+
+class ItemStore:
+    """Active items plus a bounded ring of recently retired ones.
+
+    A sweeper retires items once they have passed their pusher (eye time +
+    distance / belt speed) or exceeded ``item_timeout``; retired items are
+    appended to a JSON-lines history file by a background writer.
+
+    Every mutation stamps the record with a new store-wide version (and calls
+    ``on_change`` under the lock, so listeners see changes in version order)
+    and retirements leave a tombstone, so ``changes(since)`` can return just what
+    a client missed. Once a tombstone older than ``since`` has been dropped,
+    or the cursor belongs to another ``epoch`` (a previous server run), the
+    caller gets a full snapshot instead, paged with ``snapshot=True``.
+    """
+
+    def __init__(self, belt_speed: float, max_distance: float, item_timeout: float = ITEM_TIMEOUT,
+                 retire_margin: float = ITEM_RETIRE_MARGIN, max_active: int = ITEM_STORE_MAX_ACTIVE,
+                 completed_size: int = COMPLETED_ITEMS, history_path: Optional[str] = ITEM_HISTORY_FILE,
+                 on_retire: Optional[Callable[[ItemRecord], None]] = None, max_tombstones: int = ITEM_TOMBSTONES,
+                 on_change: Optional[Callable[[ItemRecord], None]] = None):
+        self.belt_speed = belt_speed
+        self.max_distance = max_distance
+        self.item_timeout = item_timeout
+        self.retire_margin = retire_margin
+        self.max_active = max_active
+        self.history_path = history_path
+        self.on_retire = on_retire
+        self.on_change = on_change
+        self.max_tombstones = max_tombstones
+
+        self.lock = threading.RLock()
+        self._active: "OrderedDict[str, ItemRecord]" = OrderedDict()
+        self._completed: deque = deque(maxlen=completed_size)
+        self._history_queue: queue.Queue = queue.Queue()
+        # Versions restart with every run; the epoch tells cursors from different runs apart.
+        self.epoch = uuid.uuid4().hex[:12]
+        self._version = 0
+        self._tombstones: "OrderedDict[str, int]" = OrderedDict()
+        self._tombstone_floor = 0
+        self._running = False
+        self._threads: List[threading.Thread] = []
+        self.counters = {"added": 0, "completed": 0, "timed_out": 0, "missed": 0, "evicted": 0, "history_written": 0}
+
+    def start(self, sweep_interval: float = 0.5):
+        if self._running:
+            return
+        self._running = True
+        targets = [(self._sweep_loop, (sweep_interval,), "ItemStore-Sweep")]
+        if self.history_path:
+            targets.append((self._history_loop, (), "ItemStore-History"))
+        for target, args, name in targets:
+            thread = threading.Thread(target=target, args=args, daemon=True, name=name)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running = False
+        self._history_queue.put(None)
+
+    def add(self, record: ItemRecord):
+        evicted = []
+        with self.lock:
+            self._active[record.id] = record
+            self.touch(record)
+            self.counters["added"] += 1
+            while len(self._active) > self.max_active:
+                _, oldest = self._active.popitem(last=False)
+                evicted.append(oldest)
+                self.counters["evicted"] += 1
+        for oldest in evicted:
+            self._finish(oldest, "timeout")
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def touch(self, record: ItemRecord) -> int:
+        with self.lock:
+            self._version += 1
+            record.version = self._version
+            if self.on_change is not None:
+                self.on_change(record)
+            return self._version
+
+    def get(self, item_id: str) -> Optional[ItemRecord]:
+        with self.lock:
+            return self._active.get(item_id)
+
+    def active(self) -> List[ItemRecord]:
+        with self.lock:
+            return list(self._active.values())
+
+    def completed(self) -> List[ItemRecord]:
+        with self.lock:
+            return list(self._completed)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._active)
+
+    def retire(self, item_id: str, status: str = "completed") -> Optional[ItemRecord]:
+        with self.lock:
+            record = self._active.pop(item_id, None)
+        if record is not None:
+            self._finish(record, status)
+        return record
+
+    def due_at(self, record: ItemRecord) -> Optional[float]:
+        if record.status not in ("progress", "routing") or not self.belt_speed:
+            return None
+        distance = record.distance if record.distance is not None else self.max_distance
+        return record.start_time + distance / self.belt_speed + self.retire_margin
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        if now is None:
+            now = time.time()
+        expired = []
+        with self.lock:
+            for record in self._active.values():
+                due = self.due_at(record)
+                if due is not None and now >= due:
+                    expired.append((record, "completed"))
+                elif now - record.created_at >= self.item_timeout:
+                    expired.append((record, "timeout"))
+            for record, _ in expired:
+                del self._active[record.id]
+        for record, status in expired:
+            self._finish(record, status)
+        return len(expired)
+
+    def _finish(self, record: ItemRecord, status: str):
+        with self.lock:
+            if record.status != "error" or status != "completed":
+                record.status = status
+            record.retired_at = time.time()
+            self._completed.append(record)
+            self._tombstones.pop(record.id, None)
+            self._tombstones[record.id] = self.touch(record)
+            while len(self._tombstones) > self.max_tombstones:
+                _, floor = self._tombstones.popitem(last=False)
+                self._tombstone_floor = floor
+            self.counters[status if status in ("completed", "missed") else "timed_out"] += 1
+        if self.history_path:
+            self._history_queue.put(record.to_dict())
+        if self.on_retire is not None:
+            try:
+                self.on_retire(record)
+            except Exception as e:
+                logger.error(f"❌ Item retire callback failed: {e}", exc_info=True)
+
+    def changes(self, since: int = 0, limit: Optional[int] = None, epoch: Optional[str] = None,
+                snapshot: bool = False) -> dict:
+        # `snapshot` continues the pages of a reset: the cursor of a reset page
+        # may already be below the tombstone floor, which must not reset again.
+        with self.lock:
+            reset = (since <= 0 or epoch != self.epoch or since > self._version
+                     or (since < self._tombstone_floor and not snapshot))
+            if reset:
+                since = 0
+            entries = [(record.version, record.id, record) for record in self._active.values() if record.version > since]
+            if not reset:
+                entries.extend((version, item_id, None) for item_id, version in self._tombstones.items() if version > since)
+            entries.sort(key=lambda entry: entry[0])
+
+            has_more = limit is not None and len(entries) > limit
+            if has_more:
+                entries = entries[:limit]
+            cursor = entries[-1][0] if has_more else self._version
+
+            items = {}
+            removed = []
+            for _, item_id, record in entries:
+                if record is None:
+                    removed.append(item_id)
+                else:
+                    items[item_id] = record.to_dict()
+            return {
+                "epoch": self.epoch,
+                "version": self._version,
+                "cursor": cursor,
+                "reset": reset,
+                "snapshot": (reset or snapshot) and has_more,
+                "has_more": has_more,
+                "items": items,
+                "removed": removed,
+            }
+
+    def _sweep_loop(self, interval: float):
+        while self._running:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Item sweep failed: {e}", exc_info=True)
+            time.sleep(interval)
+
+    def _history_loop(self):
+        stopping = False
+        while not stopping:
+            entry = self._history_queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            while True:
+                try:
+                    entry = self._history_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            try:
+                with open(self.history_path, "a") as f:
+                    for item in batch:
+                        f.write(json.dumps(item, separators=(",", ":")) + "\n")
+                with self.lock:
+                    self.counters["history_written"] += len(batch)
+            except OSError as e:
+                logger.error(f"❌ Failed to write item history to {self.history_path}: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "active": len(self._active),
+                "completed_ring": len(self._completed),
+                "history_pending": self._history_queue.qsize(),
+                "version": self._version,
+                "tombstones": len(self._tombstones),
+                **self.counters,
+            }
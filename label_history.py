@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import logging
+from collections import Counter, OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LABEL_HISTORY_MAX = int(os.getenv('LABEL_HISTORY_MAX', '200000'))
+LABEL_HISTORY_PREFIX_LEN = int(os.getenv('LABEL_HISTORY_PREFIX_LEN', '7'))
+LABEL_HISTORY_MIN_SAMPLES = int(os.getenv('LABEL_HISTORY_MIN_SAMPLES', '5'))
+LABEL_HISTORY_MIN_SHARE = float(os.getenv('LABEL_HISTORY_MIN_SHARE', '0.6'))
+
+class LabelHistory:
+    """Labels PalletIQ has returned before, for routing while it is unreachable.
+
+    Exact barcodes map to their last label. Barcodes never seen before fall
+    back to the dominant label of their prefix (an ISBN's registrant block),
+    but only when that prefix has enough samples and a clear majority.
+    """
+
+    def __init__(self, max_entries: int = LABEL_HISTORY_MAX, prefix_len: int = LABEL_HISTORY_PREFIX_LEN,
+                 min_samples: int = LABEL_HISTORY_MIN_SAMPLES, min_share: float = LABEL_HISTORY_MIN_SHARE):
+        self.max_entries = max_entries
+        self.prefix_len = prefix_len
+        self.min_samples = min_samples
+        self.min_share = min_share
+        self._lock = threading.Lock()
+        self._labels: "OrderedDict[str, str]" = OrderedDict()
+        self._prefixes: dict = {}
+        self.counters = {"exact_hits": 0, "prefix_hits": 0, "misses": 0}
+
+    def record(self, barcode: str, label: Optional[str]):
+        if not barcode or label is None:
+            return
+        with self._lock:
+            previous = self._labels.pop(barcode, None)
+            if previous is not None:
+                self._count_prefix(barcode, previous, -1)
+            self._labels[barcode] = label
+            self._count_prefix(barcode, label, 1)
+            while len(self._labels) > self.max_entries:
+                oldest, oldest_label = self._labels.popitem(last=False)
+                self._count_prefix(oldest, oldest_label, -1)
+
+    def lookup(self, barcode: str) -> Optional[str]:
+        with self._lock:
+            label = self._labels.get(barcode)
+            if label is not None:
+                self._labels.move_to_end(barcode)
+                self.counters["exact_hits"] += 1
+                return label
+            counts = self._prefixes.get(barcode[:self.prefix_len]) if len(barcode) > self.prefix_len else None
+            if counts:
+                total = sum(counts.values())
+                label, count = counts.most_common(1)[0]
+                if total >= self.min_samples and count / total >= self.min_share:
+                    self.counters["prefix_hits"] += 1
+                    return label
+            self.counters["misses"] += 1
+            return None
+
+    def _count_prefix(self, barcode: str, label: str, delta: int):
+        if len(barcode) <= self.prefix_len:
+            return
+        prefix = barcode[:self.prefix_len]
+        counts = self._prefixes.setdefault(prefix, Counter())
+        counts[label] += delta
+        if counts[label] <= 0:
+            del counts[label]
+        if not counts:
+            del self._prefixes[prefix]
+
+    def load(self, path: Optional[str]) -> int:
+        # Item history lines written by ItemStore; only labels PalletIQ itself
+        # decided are learned from, never fallback or degraded routes.
+        if not path or not os.path.exists(path):
+            return 0
+        loaded = 0
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if item.get("decision", "palletiq") != "palletiq":
+                        continue
+                    if item.get("barcode") and item.get("label") is not None:
+                        self.record(item["barcode"], item["label"])
+                        loaded += 1
+        except OSError as e:
+            logger.error(f"❌ Failed to read label history from {path}: {e}")
+        logger.info(f"✅ Label history loaded {loaded} decisions from {path}")
+        return loaded
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"barcodes": len(self._labels), "prefixes": len(self._prefixes), **self.counters}
@@ -0,0 +1,423 @@
+import itertools
+import os
+import threading
+import time
+import logging
+from typing import List, Optional
+
+from barcode_scanner import get_barcode_scanner
+from plc import get_plc_connection
+from palletiq_api import request_palletiq_async, get_breaker_stats
+from dispatcher import get_dispatch_stats
+from routing import get_routing_table, FALLBACK_ROUTE, SETTINGS_FILE
+from metrics import tracer
+from item_store import ItemStore, ItemRecord, ITEM_HISTORY_FILE
+from emitter import ItemEmitter
+from system_status import StatusSampler
+from deadlines import DeadlineTracker
+from tracker import BeltTracker
+from correlation import ScanCorrelator, SCAN_TO_EYE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated line names. The first line is configured by the plain
+# variables (PLC_IP, SCAN_PORT, ...); every other line by LINE_<NAME>_<VAR>.
+LINES = [name.strip() for name in os.getenv('LINES', '1').split(',') if name.strip()] or ['1']
+
+BELT_SPEED = 32.1
+MAX_DISTANCE = 972
+# Items still undecided at the last safe moment go to this pusher.
+FALLBACK_PUSHER = int(os.getenv('FALLBACK_PUSHER', str(FALLBACK_ROUTE["pusher"])))
+DEADLINE_MARGIN = float(os.getenv('DEADLINE_MARGIN', '0.25'))
+
+_BREAKER_MESSAGES = {"closed": "Online", "half_open": "Recovering", "open": "Degraded"}
+
+# Item IDs are unique across lines, so traces and dashboard keys never collide.
+_item_ids = itertools.count(1)
+
+class Line:
+    """One conveyor line: scanner, PLC, routing table and the item pipeline between them.
+
+    Lines share the PalletIQ client and its cache; all other state is their
+    own. A line created with ``dispatch_line`` runs its callbacks on that
+    line's own dispatch pool (sources "barcode:<line>", ...), the first line
+    on the default pool. Dashboard events go to the line's Socket.IO room.
+    """
+
+    def __init__(self, name: str, socketio, scanner, plc, routing, belt_speed: float = BELT_SPEED,
+                 max_distance: float = MAX_DISTANCE, fallback_pusher: int = FALLBACK_PUSHER,
+                 travel: float = SCAN_TO_EYE_SECONDS, history_path: Optional[str] = ITEM_HISTORY_FILE,
+                 dispatch_line: Optional[str] = None):
+        self.name = name
+        self.dispatch_line = dispatch_line
+        self.promise_source = f"promise:{dispatch_line}" if dispatch_line else "promise"
+        self.room = f"line:{name}"
+        self.socketio = socketio
+        self.scanner = scanner
+        self.plc = plc
+        self.routing = routing
+        self.belt_speed = belt_speed
+        self.max_distance = max_distance
+        self.fallback_pusher = fallback_pusher
+
+        self._deadline_stats_lock = threading.Lock()
+        self._deadline_stats = {"fallbacks": 0, "decided_too_late": 0}
+
+        self.correlator = ScanCorrelator(travel)
+        self.item_store = ItemStore(belt_speed, max_distance, history_path=history_path,
+                                    on_retire=self._on_item_retired, on_change=self._on_item_changed)
+        self.item_emitter = ItemEmitter(socketio, lock=self.item_store.lock, room=self.room)
+        self.belt_tracker = BeltTracker(belt_speed, max_distance)
+        self.deadline_tracker = DeadlineTracker(self._on_decision_deadline, name=f"DeadlineTracker-{name}")
+        self.status_sampler = StatusSampler(self._collect_system_status, self.broadcast_system_status)
+
+    def _on_item_changed(self, record):
+        # Runs under the store lock, right after the version bump.
+        self.item_emitter.mark(record)
+
+    def _on_item_retired(self, record):
+        self.correlator.discard(record)
+        tracer.discard(record.id)
+        self.deadline_tracker.cancel(record.id)
+        self.belt_tracker.remove(record.id)
+
+    def _count_deadline(self, key):
+        with self._deadline_stats_lock:
+            self._deadline_stats[key] += 1
+
+    def deadline_stats(self):
+        with self._deadline_stats_lock:
+            stats = dict(self._deadline_stats)
+        return {**self.deadline_tracker.stats(), **stats}
+
+    def _fallback_route(self):
+        route = self.routing.snapshot.by_pusher.get(self.fallback_pusher)
+        if route is None:
+            route = {**FALLBACK_ROUTE, "pusher": self.fallback_pusher}
+        return route
+
+    def _pusher_deadline(self, item, distance):
+        # When the item reaches a pusher `distance` cm past the eye, less a safety
+        # margin. Before the eye fires its eye time is estimated from the scan
+        # using the travel time the correlator has learned.
+        if distance is None:
+            distance = self.max_distance
+        eye_time = item.start_time if item.positionId is not None else item.created_at + self.correlator.travel
+        return eye_time + distance / self.belt_speed - DEADLINE_MARGIN
+
+    def _decision_deadline(self, item):
+        return self._pusher_deadline(item, self._fallback_route().get("distance"))
+
+    def _apply_fallback(self, item):
+        route = self._fallback_route()
+        item.pusher = route["pusher"]
+        item.label = route.get("label")
+        item.distance = route.get("distance")
+        item.decision = "fallback"
+        self.item_store.touch(item)
+        self.belt_tracker.set_target(item.id, item.distance)
+
+    def _on_decision_deadline(self, item_id):
+        with self.item_store.lock:
+            item = self.item_store.get(item_id)
+            if item is None or item.pusher is not None:
+                return
+            self._apply_fallback(item)
+            barcode = item.barcode
+            positionId = item.positionId
+            pusher = item.pusher
+
+        self._count_deadline("fallbacks")
+        logger.warning(f"⏰ No PalletIQ decision for {barcode} before its deadline, routing to fallback pusher {pusher}",
+                       extra={"line": self.name, "barcode": barcode, "pusher": pusher, "event": "deadline_fallback"})
+
+        if positionId is not None:
+            self._write_item_bucket(item, positionId, pusher)
+
+    def _trace(self, item, stage):
+        tracer.mark(item.id, stage)
+        item.trace[stage] = time.time()
+
+    def _write_item_bucket(self, item, positionId, pusher):
+        self._trace(item, "write_bucket_issued")
+        if self.plc.write_bucket(positionId, pusher) == 1:
+            self._trace(item, "plc_ack")
+        else:
+            tracer.fail(item.id)
+
+    def on_barcode_scanned(self, barcode):
+        item_id = str(next(_item_ids))
+
+        item = ItemRecord(item_id, barcode)
+        self._trace(item, "scan_received")
+
+        self.item_store.add(item)
+        self.correlator.add_scan(item)
+
+        self.plc.expect_photo_eye_edge()
+
+        def on_success(response):
+            self._trace(item, "api_response")
+            if response:
+                self.on_palletiq_response(item_id, response)
+            else:
+                self._handle_palletiq_error(item_id, None)
+
+        def on_error(error):
+            self._trace(item, "api_response")
+            self._handle_palletiq_error(item_id, error)
+
+        # Copies of the same title each get their own item; concurrent lookups for
+        # one barcode, from any line, are coalesced into a single upstream call.
+        deadline = self._decision_deadline(item)
+        self.deadline_tracker.schedule(item_id, deadline)
+        self._trace(item, "api_request_sent")
+        promise = request_palletiq_async(barcode, deadline, self.routing, self.promise_source)
+        promise.then(on_success).catch(on_error)
+
+    def on_palletiq_response(self, item_id, response):
+        if not response:
+            return
+
+        pusher = response.get("pusher")
+        label = response.get("label")
+        distance = response.get("distance", self.max_distance)
+
+        with self.item_store.lock:
+            item = self.item_store.get(item_id)
+            if item is None:
+                return
+            barcode = item.barcode
+            positionId = item.positionId
+            # A pusher is only set already if the deadline routed the item to the fallback.
+            decided = item.pusher is None
+            if decided and positionId is not None and time.time() > self._pusher_deadline(item, distance):
+                # Its pusher is already behind it; fall back rather than missort.
+                self._apply_fallback(item)
+            elif decided:
+                item.pusher = pusher
+                item.label = label
+                item.distance = distance
+                item.decision = "degraded" if response.get("degraded") else "palletiq"
+                self.item_store.touch(item)
+                self.belt_tracker.set_target(item.id, distance)
+            routed_pusher = item.pusher
+            too_late = item.decision == "fallback"
+
+        self.deadline_tracker.cancel(item_id)
+        if too_late:
+            self._count_deadline("decided_too_late")
+            logger.warning(f"⏰ PalletIQ decision for {barcode} arrived too late ({label} → pusher {pusher}), routed to pusher {routed_pusher}",
+                           extra={"line": self.name, "barcode": barcode, "pusher": routed_pusher, "event": "decided_too_late"})
+        if not decided:
+            return
+
+        logger.info(f"✅ PalletIQ Response - Barcode: {barcode}, Label: {label}, Pusher: {routed_pusher}, Distance: {distance}",
+                    extra={"line": self.name, "barcode": barcode, "label": label, "pusher": routed_pusher,
+                           "distance": distance, "event": "decision"})
+
+        if positionId is not None and routed_pusher is not None:
+            self._write_item_bucket(item, positionId, routed_pusher)
+
+    def _handle_palletiq_error(self, item_id, error):
+        if not item_id:
+            return
+
+        with self.item_store.lock:
+            item = self.item_store.get(item_id)
+            if item is None:
+                return
+            item.status = "error"
+            item.error = str(error) if error else "Unknown error"
+            self.item_store.touch(item)
+
+    def on_photo_eye_triggered(self, positionId):
+        photo_eye_trigger_time = time.time()
+        photo_eye_trigger_mono = time.monotonic()
+
+        matches, unmatched = self.correlator.on_edge(positionId, photo_eye_trigger_mono)
+
+        for item in unmatched:
+            with self.item_store.lock:
+                item.error = "Never reached the photo eye"
+                self.item_store.touch(item)
+            self.item_store.retire(item.id, "missed")
+            logger.warning(f"⚠️ Scan {item.barcode} never reached the photo eye, dropped from correlation",
+                           extra={"line": self.name, "barcode": item.barcode, "event": "missed"})
+
+        if not matches:
+            logger.warning(f"⚠️ Photo eye triggered at position {positionId} but no scan matches it",
+                           extra={"line": self.name, "position_id": positionId, "event": "unmatched_edge"})
+
+        for item, matchedPositionId, confidence in matches:
+            self._on_item_at_eye(item, matchedPositionId, confidence, photo_eye_trigger_time, photo_eye_trigger_mono)
+
+    def _on_item_at_eye(self, item, positionId, confidence, eye_time, eye_mono):
+        barcode = item.barcode
+        self._trace(item, "photo_eye_edge")
+        with self.item_store.lock:
+            item.positionId = positionId
+            item.status = "progress"
+            item.start_time = eye_time
+            item.confidence = round(confidence, 3)
+            self.item_store.touch(item)
+            self.belt_tracker.add(item.id, eye_mono, item.distance)
+            pusher = item.pusher
+            if pusher is None:
+                # Now that the eye time is known the deadline is exact.
+                self.deadline_tracker.schedule(item.id, self._decision_deadline(item))
+
+        logger.info(f"✅ Photo eye processed - Barcode: {barcode}, Position: {positionId}, Confidence: {confidence:.2f}",
+                    extra={"line": self.name, "barcode": barcode, "position_id": positionId,
+                           "confidence": round(confidence, 3), "event": "photo_eye"})
+
+        # Cached and coalesced lookups often resolve before the item reaches the eye.
+        if pusher is not None:
+            self._write_item_bucket(item, positionId, pusher)
+
+    def on_items_arrived(self, item_ids):
+        with self.item_store.lock:
+            for item_id in item_ids:
+                item = self.item_store.get(item_id)
+                if item is not None and item.status == "progress":
+                    item.status = "routing"
+                    self.item_store.touch(item)
+
+    def on_items_completed(self, item_ids):
+        for item_id in item_ids:
+            self.item_store.retire(item_id, "completed")
+
+    def publish_positions(self, frame):
+        self.socketio.emit('positions', frame, to=self.room)
+
+    def on_routing_changed(self, snapshot):
+        logger.info(f"🔀 Routing table for line {self.name} updated to version {snapshot.version}")
+        self.socketio.emit('routing_updated', {"version": snapshot.version, "settings": snapshot.settings}, to=self.room)
+
+    def check_connections(self):
+        plc_health = self.plc.health()
+        photo_eye_value = plc_health["photo_eye"]
+
+        return {
+            "plc": plc_health["connected"],
+            "barcode_scanner": self.scanner.is_connected(),
+            "photo_eye": {
+                "connected": photo_eye_value is not None,
+                "message": "Not Ready" if photo_eye_value == None else "Ready"
+            }
+        }
+
+    def _collect_system_status(self):
+        status = self.check_connections()
+        breaker_state = get_breaker_stats()["state"]
+        return {
+            "line": self.name,
+            "plc": {"connected": status.get("plc", False), "message": "Connected" if status.get("plc") else "Disconnected"},
+            "scanner": {"connected": status.get("barcode_scanner", False), "message": "Connected" if status.get("barcode_scanner") else "Disconnected", "mode": self.scanner.mode},
+            "photo_eye": status.get("photo_eye", {"connected": False, "message": "Not Ready"}),
+            "palletiq": {"connected": breaker_state == "closed", "message": _BREAKER_MESSAGES.get(breaker_state, breaker_state), "breaker": breaker_state}
+        }
+
+    def broadcast_system_status(self, system_status):
+        try:
+            self.socketio.emit('system_status', system_status, to=self.room)
+        except Exception:
+            pass
+
+    def start(self):
+        plc_connected = self.plc.connect() is not None
+        logger.info(f"✅ Line {self.name} - plc: {plc_connected}, barcode_scanner: {self.scanner.is_connected()}")
+
+        self.item_store.start()
+        self.item_emitter.start()
+        self.deadline_tracker.start()
+        self.belt_tracker.start(self.on_items_arrived, self.on_items_completed, self.publish_positions)
+        self.status_sampler.start()
+        self.routing.subscribe(self.on_routing_changed)
+        self.scanner.connect_signal(self.on_barcode_scanned)
+        self.plc.connect_photo_eye_signal(self.on_photo_eye_triggered)
+        self.scanner.start()
+
+    def stats(self) -> dict:
+        stats = {
+            "items": self.item_store.stats(),
+            "emitter": self.item_emitter.stats(),
+            "tracker": self.belt_tracker.stats(),
+            "correlation": self.correlator.stats(),
+            "deadlines": self.deadline_stats(),
+            "status_sampler": self.status_sampler.stats(),
+            "photo_eye": self.plc.photo_eye_stats(),
+            "scanner": self.scanner.stats(),
+            "plc_link": self.plc.link_stats(),
+        }
+        if self.dispatch_line:
+            stats["dispatch"] = get_dispatch_stats(self.dispatch_line)
+        return stats
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "room": self.room,
+            "plc": f"{self.plc.host}:{self.plc.port}",
+            "scanner": self.scanner.port if self.scanner.mode == 'SERIAL' else self.scanner.mode,
+            "settings_file": self.routing.settings_file,
+        }
+
+def _line_env(name: str, key: str, default=None, primary: bool = False):
+    if primary:
+        return os.getenv(key, default)
+    return os.getenv(f"LINE_{name.upper()}_{key}", default)
+
+def create_line(name: str, socketio, primary: bool = False) -> Line:
+    """Builds a line from the environment; see LINES."""
+    def env(key, default=None):
+        return _line_env(name, key, default, primary)
+
+    # Only the first line has plain dispatch source names and uses the default
+    # pool; the others get "<kind>:<name>" sources on a pool of their own.
+    suffix = "" if primary else f":{name}"
+    settings_file = env('SETTINGS_FILE', SETTINGS_FILE if primary else f"settings_{name}.json")
+    history_path = env('ITEM_HISTORY_FILE', ITEM_HISTORY_FILE if primary else f"item_history_{name}.jsonl")
+    routing = get_routing_table(None if settings_file == SETTINGS_FILE else settings_file)
+
+    plc_ip = env('PLC_IP')
+    if not primary and not plc_ip:
+        raise ValueError(f"Line {name}: LINE_{name.upper()}_PLC_IP is not set")
+    plc = get_plc_connection(plc_ip, int(env('PLC_PORT', '502')), int(env('MODBUS_UNIT_ID', '1')), routing=routing,
+                             name="PLC" if primary else f"PLC-{name}", dispatch_source=f"photo_eye{suffix}")
+    plc.routing = routing
+
+    mode = str(env('SCAN_MODE', 'KEYBOARD' if primary else 'SERIAL')).upper()
+    if mode == 'KEYBOARD' and not primary:
+        # The keyboard hook is process-wide and cannot tell scanners apart.
+        logger.warning(f"⚠️ Line {name}: keyboard scanning is only available on the first line, using serial")
+        mode = 'SERIAL'
+    port = env('SCAN_PORT', os.getenv('SCANNER_PORT') if primary else None)
+    if not primary and not port:
+        raise ValueError(f"Line {name}: LINE_{name.upper()}_SCAN_PORT is not set")
+    scanner = get_barcode_scanner(port, mode, int(env('SCAN_BAUD', '19200')),
+                                  name="Scanner" if primary else f"Scanner-{name}", dispatch_source=f"barcode{suffix}")
+
+    return Line(
+        name, socketio, scanner, plc, routing,
+        belt_speed=float(env('BELT_SPEED', str(BELT_SPEED))),
+        max_distance=float(env('MAX_DISTANCE', str(MAX_DISTANCE))),
+        fallback_pusher=int(env('FALLBACK_PUSHER', str(FALLBACK_PUSHER))),
+        travel=float(env('SCAN_TO_EYE_SECONDS', str(SCAN_TO_EYE_SECONDS))),
+        history_path=history_path or None,
+        dispatch_line=None if primary else name,
+    )
+
+def create_lines(socketio, names: Optional[List[str]] = None) -> List[Line]:
+    lines: List[Line] = []
+    for index, name in enumerate(names or LINES):
+        if any(line.name == name for line in lines):
+            raise ValueError(f"Line {name} is configured twice")
+        line = create_line(name, socketio, primary=index == 0)
+        for other in lines:
+            if other.plc is line.plc:
+                raise ValueError(f"Lines {other.name} and {name} share PLC {line.plc.host}:{line.plc.port}")
+            if other.scanner is line.scanner:
+                raise ValueError(f"Lines {other.name} and {name} share scanner {line.scanner.port}")
+        lines.append(line)
+    return lines
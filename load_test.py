@@ -0,0 +1,507 @@
+import argparse
+import asyncio
+import hashlib
+import heapq
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+LABELS = [
+    "FBA", "MF", "SBYB", "Reject Book", "Reject Music",
+    "Reject DVD", "Reject Video Game", "Extra", None
+]
+REJECT_GROUPS = {
+    "Reject Book": "Book",
+    "Reject Music": "Music",
+    "Reject DVD": "DVD",
+    "Reject Video Game": "Video Game",
+}
+
+PHOTO_EYE_COIL = 1
+PHOTO_EYE_STATE_REGISTER = 0x0014
+POSITION_ID_REGISTER = 0x0015
+BUCKET_BASE_REGISTER = 0x0064
+BUCKET_LAST_REGISTER = 0x0095
+PUSHER_DISTANCE_REGISTER = 0x7001
+FIRST_POSITION_ID = 101
+POSITION_ID_COUNT = 50
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    pick = lambda q: ordered[min(last, int(round(q * last)))] * 1000
+    return {"count": len(ordered), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000}
+
+def label_for(barcode):
+    digest = hashlib.sha1(barcode.encode()).digest()
+    return LABELS[digest[0] % len(LABELS)]
+
+class PlcStandIn:
+    """Minimal Modbus TCP server emulating the conveyor PLC's register map.
+
+    Implements function codes 1-6, 15 and 16 and records every holding-register
+    write with its arrival time so bucket writes can be checked after the run.
+    """
+
+    def __init__(self, host="127.0.0.1", port=None):
+        self.host = host
+        self.port = port or _free_port()
+        self.coils = bytearray(0x100)
+        self.input_registers = [0] * 0x100
+        self.holding_registers = {}
+        self.writes = []
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._ready = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self._run, daemon=True, name="PLC-StandIn")
+        thread.start()
+        if not self._ready.wait(5):
+            raise RuntimeError("PLC stand-in failed to start")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+
+    def set_photo_eye(self, blocked, position_id=None):
+        with self._lock:
+            if position_id is not None:
+                self.input_registers[POSITION_ID_REGISTER] = position_id
+            self.input_registers[PHOTO_EYE_STATE_REGISTER] = 1 if blocked else 0
+            self.coils[PHOTO_EYE_COIL] = 1 if blocked else 0
+
+    def set_holding(self, address, values):
+        with self._lock:
+            for offset, value in enumerate(values):
+                self.holding_registers[address + offset] = value
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction_id, _, length, unit = struct.unpack(">HHHB", header)
+                pdu = await reader.readexactly(length - 1)
+                response = self._process(pdu)
+                writer.write(struct.pack(">HHHB", transaction_id, 0, len(response) + 1, unit) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _process(self, pdu):
+        function = pdu[0]
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if function in (1, 2):
+                address, count = struct.unpack(">HH", pdu[1:5])
+                bits = [self.coils[address + i] if address + i < len(self.coils) else 0 for i in range(count)]
+                packed = bytearray((count + 7) // 8)
+                for i, bit in enumerate(bits):
+                    if bit:
+                        packed[i // 8] |= 1 << (i % 8)
+                return bytes([function, len(packed)]) + bytes(packed)
+            if function in (3, 4):
+                address, count = struct.unpack(">HH", pdu[1:5])
+                if function == 4:
+                    values = [self.input_registers[address + i] if address + i < len(self.input_registers) else 0 for i in range(count)]
+                else:
+                    values = [self.holding_registers.get(address + i, 0) for i in range(count)]
+                return bytes([function, count * 2]) + struct.pack(f">{count}H", *values)
+            if function == 5:
+                address, value = struct.unpack(">HH", pdu[1:5])
+                self.coils[address] = 1 if value == 0xFF00 else 0
+                return pdu[:5]
+            if function == 6:
+                address, value = struct.unpack(">HH", pdu[1:5])
+                self.holding_registers[address] = value
+                self.writes.append((now, address, value))
+                return pdu[:5]
+            if function == 15:
+                address, count = struct.unpack(">HH", pdu[1:5])
+                data = pdu[6:]
+                for i in range(count):
+                    self.coils[address + i] = (data[i // 8] >> (i % 8)) & 1
+                return pdu[:5]
+            if function == 16:
+                address, count = struct.unpack(">HH", pdu[1:5])
+                values = struct.unpack(f">{count}H", pdu[6:6 + count * 2])
+                for offset, value in enumerate(values):
+                    self.holding_registers[address + offset] = value
+                    self.writes.append((now, address + offset, value))
+                return pdu[:5]
+        return bytes([function | 0x80, 0x01])
+
+class PalletIQStandIn:
+    """Local HTTP server emulating the PalletIQ login and product data endpoints."""
+
+    def __init__(self, latency_ms=80.0, jitter_ms=20.0, error_rate=0.0, unauthorized_rate=0.0,
+                 token_ttl=None, seed=None, host="127.0.0.1", port=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.unauthorized_rate = unauthorized_rate
+        self.token_ttl = token_ttl
+        self.host = host
+        self.port = port or _free_port()
+        self.random = random.Random(seed)
+        self.token = None
+        self.token_issued = 0.0
+        self.counters = {"logins": 0, "lookups": 0, "errors": 0, "unauthorized": 0, "no_results": 0}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def login_url(self):
+        return f"http://{self.host}:{self.port}/login"
+
+    @property
+    def data_url_template(self):
+        return f"http://{self.host}:{self.port}/data?scan={{scan}}&token={{token}}"
+
+    def start(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload=None):
+                body = json.dumps(payload if payload is not None else {}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self._reply(200)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                if urlsplit(self.path).path != "/login":
+                    return self._reply(404)
+                self._reply(200, {"token": stand_in.issue_token()})
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if parts.path != "/data":
+                    return self._reply(404)
+                query = parse_qs(parts.query)
+                status, payload = stand_in.lookup(query.get("scan", [""])[0], query.get("token", [""])[0])
+                self._reply(status, payload)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="PalletIQ-StandIn").start()
+
+    def issue_token(self):
+        with self._lock:
+            self.counters["logins"] += 1
+            self.token = f"token-{self.counters['logins']}"
+            self.token_issued = time.monotonic()
+            return self.token
+
+    def lookup(self, barcode, token):
+        with self._lock:
+            self.counters["lookups"] += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter))
+            roll = self.random.random()
+            expired = self.token_ttl is not None and time.monotonic() - self.token_issued > self.token_ttl
+            valid = token == self.token and not expired
+        time.sleep(delay)
+
+        with self._lock:
+            if not valid or roll < self.unauthorized_rate:
+                self.counters["unauthorized"] += 1
+                if valid:
+                    self.token = None
+                return 401, {"error": "Unauthorized"}
+            if roll < self.unauthorized_rate + self.error_rate:
+                self.counters["errors"] += 1
+                return 500, {"error": "Internal Server Error"}
+
+        label = label_for(barcode)
+        if label is None:
+            with self._lock:
+                self.counters["no_results"] += 1
+            return 400, {"error": "No results"}
+        if label in REJECT_GROUPS:
+            return 200, {"winner": None, "meta": {"product_group": REJECT_GROUPS[label]}}
+        if label == "Extra":
+            return 200, {"winner": None, "meta": None}
+        return 200, {"winner": {"winnerModule": "module", "winnerSubModule": label}, "meta": {}}
+
+class ScanFeeder:
+    """Feeds barcodes through a pseudo-terminal so the real serial reader is used.
+
+    Falls back to invoking the registered barcode callbacks where ptys are not
+    available (Windows).
+    """
+
+    def __init__(self, terminator=b"\r\n"):
+        self.terminator = terminator
+        self.master_fd = None
+        self.port = None
+        try:
+            import pty
+            self.master_fd, slave_fd = pty.openpty()
+            self.port = os.ttyname(slave_fd)
+            self._slave_fd = slave_fd
+        except (ImportError, OSError):
+            self.master_fd = None
+
+    def send(self, barcode):
+        if self.master_fd is not None:
+            os.write(self.master_fd, barcode.encode() + self.terminator)
+            return
+        from barcode_scanner import _barcode_callbacks
+        from dispatcher import dispatch
+        for callback in list(_barcode_callbacks):
+            dispatch("barcode", callback, barcode)
+
+def _distance_registers(settings):
+    from plc import pusher_distance_registers
+    return pusher_distance_registers(settings)
+
+def run(args):
+    plc_stand_in = PlcStandIn()
+    plc_stand_in.start()
+    palletiq = PalletIQStandIn(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        unauthorized_rate=args.unauthorized_rate,
+        token_ttl=args.token_ttl,
+        seed=args.seed,
+    )
+    palletiq.start()
+    feeder = ScanFeeder()
+
+    os.environ.update({
+        "PLC_IP": "127.0.0.1",
+        "PLC_PORT": str(plc_stand_in.port),
+        "PALLETIQ_API_LOGIN_URL": palletiq.login_url,
+        "PALLETIQ_API_DATA_URL_TEMPLATE": palletiq.data_url_template,
+        "EMAIL": "load-test@example.com",
+        "PASSWORD": "load-test",
+        "SCAN_MODE": "SERIAL",
+        "SCAN_PORT": feeder.port or "LOADTEST",
+        "SCAN_TO_EYE_SECONDS": str(args.eye_delay),
+    })
+    if not args.keep_cache:
+        os.environ["PALLETIQ_CACHE_DB"] = ""
+
+    import app
+    from metrics import tracer
+    from routing import get_routing_table
+
+    snapshot = get_routing_table().snapshot
+    plc_stand_in.set_holding(PUSHER_DISTANCE_REGISTER, _distance_registers(snapshot.settings))
+    app.main()
+
+    rng = random.Random(args.seed)
+    catalog = [f"97800000{index:05d}" for index in range(args.distinct)]
+    interval = 60.0 / args.items_per_minute
+    beam = min(args.beam_ms / 1000, interval / 2)
+    belt_speed = app.belt_speed
+
+    items = []
+    events = []
+    seq = 0
+    start = time.monotonic() + 0.5
+    previous = None
+    positions = 0
+    for index in range(args.items):
+        barcode = rng.choice(catalog)
+        # The scanner debounces identical consecutive reads, so never send one.
+        while barcode == previous and args.distinct > 1:
+            barcode = rng.choice(catalog)
+        # Faults the correlation has to survive: a book the scanner missed,
+        # one that falls off before the eye, and a flickering beam.
+        scanned = rng.random() >= args.no_read_rate
+        if scanned:
+            previous = barcode
+        reaches_eye = not scanned or rng.random() >= args.drop_rate
+        flicker = reaches_eye and rng.random() < args.double_trigger_rate
+        scan_at = start + index * interval + rng.uniform(0, args.spacing_jitter * interval)
+        label = label_for(barcode)
+        route = snapshot.resolve(label if label is not None else "Extra")
+        item = {
+            "barcode": barcode,
+            "position_id": FIRST_POSITION_ID + positions % POSITION_ID_COUNT if reaches_eye else None,
+            "scanned": scanned,
+            "expected_pusher": route["pusher"],
+            "travel": (route["distance"] or 0) / belt_speed,
+            "scan_at": scan_at,
+        }
+        item["eye_at"] = item["scan_at"] + args.eye_delay
+        items.append(item)
+        schedule = []
+        if scanned:
+            schedule.append((item["scan_at"], "scan"))
+        if reaches_eye:
+            positions += 1
+            schedule += [(item["eye_at"], "eye_on"), (item["eye_at"] + beam, "eye_off")]
+            if flicker:
+                schedule += [(item["eye_at"] + beam / 4, "eye_off"), (item["eye_at"] + beam / 2, "eye_on")]
+        for at, action in schedule:
+            heapq.heappush(events, (at, seq, action, item))
+            seq += 1
+
+    print(f"🚚 Driving {args.items} items at {args.items_per_minute}/min "
+          f"(PLC stand-in :{plc_stand_in.port}, PalletIQ stand-in :{palletiq.port}, "
+          f"scanner {'pty ' + feeder.port if feeder.port else 'callbacks'})", flush=True)
+
+    while events:
+        at, _, action, item = heapq.heappop(events)
+        delay = at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if action == "scan":
+            feeder.send(item["barcode"])
+        elif action == "eye_on":
+            item.setdefault("eye_actual", time.monotonic())
+            plc_stand_in.set_photo_eye(True, item["position_id"])
+        else:
+            plc_stand_in.set_photo_eye(False)
+
+    finished = time.monotonic()
+    time.sleep(args.drain)
+    return _report(args, items, plc_stand_in, palletiq, tracer, start, finished)
+
+def _report(args, items, plc_stand_in, palletiq, tracer, start, finished):
+    with plc_stand_in._lock:
+        writes = list(plc_stand_in.writes)
+        modbus_requests = plc_stand_in.requests
+
+    by_position = {}
+    for item in items:
+        if item["position_id"] is not None:
+            by_position.setdefault(item["position_id"], []).append(item)
+
+    correct = missorted = missing = late = phantom = 0
+    scan_to_write, eye_to_write = [], []
+    for position_id, position_items in by_position.items():
+        register = BUCKET_BASE_REGISTER + position_id - FIRST_POSITION_ID
+        bucket_writes = [(at, value) for at, address, value in writes if address == register]
+        for index, item in enumerate(position_items):
+            eye_at = item.get("eye_actual", item["eye_at"])
+            next_eye = position_items[index + 1].get("eye_actual", float("inf")) if index + 1 < len(position_items) else float("inf")
+            match = next(((at, value) for at, value in bucket_writes if eye_at <= at < next_eye), None)
+            if not item["scanned"]:
+                # Nothing is known about an unscanned book; any write is a mismatch.
+                phantom += match is not None
+                continue
+            if match is None:
+                missing += 1
+                continue
+            at, value = match
+            scan_to_write.append(at - item["scan_at"])
+            eye_to_write.append(at - eye_at)
+            if value != item["expected_pusher"]:
+                missorted += 1
+            elif at - eye_at > item["travel"]:
+                late += 1
+            else:
+                correct += 1
+
+    elapsed = max(finished - start, 1e-9)
+    report = {
+        "items": len(items),
+        "target_items_per_minute": args.items_per_minute,
+        "achieved_items_per_minute": len(items) / elapsed * 60,
+        "correct": correct,
+        "missorted": missorted,
+        "late": late,
+        "missing": missing,
+        "unscanned": sum(not item["scanned"] for item in items),
+        "dropped": sum(item["scanned"] and item["position_id"] is None for item in items),
+        "phantom": phantom,
+        "modbus_requests": modbus_requests,
+        "palletiq": dict(palletiq.counters),
+        "latency": {
+            "scan_to_bucket_write": _percentiles(scan_to_write),
+            "photo_eye_to_bucket_write": _percentiles(eye_to_write),
+        },
+        "app": tracer.summary(),
+        "correlation": sys.modules["app"].correlator.stats(),
+    }
+
+    print("=" * 70)
+    print("Load Test Report")
+    print("=" * 70)
+    print(f"Items: {report['items']}  Achieved: {report['achieved_items_per_minute']:.1f}/min")
+    print(f"Correct: {correct}  Mis-sorted: {missorted}  Late: {late}  Missing: {missing}")
+    if report["unscanned"] or report["dropped"]:
+        print(f"Unscanned: {report['unscanned']}  Dropped: {report['dropped']}  Phantom writes: {phantom}")
+    print(f"PalletIQ: {report['palletiq']}")
+    correlation = report["correlation"]
+    print(f"Correlation: travel {correlation['travel'] * 1000:.0f} ms ±{correlation['travel_std'] * 1000:.0f}  "
+          f"confidence {correlation['confidence_avg']:.2f}  orphan edges {correlation['orphan_edges']}  "
+          f"double triggers {correlation['double_triggers']}  unmatched scans {correlation['unmatched_scans']}")
+    for name, stats in report["latency"].items():
+        if stats["count"]:
+            print(f"{name}: p50 {stats['p50_ms']:.1f} ms  p95 {stats['p95_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms  max {stats['max_ms']:.1f} ms")
+    print("=" * 70)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against local PLC and PalletIQ stand-ins")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--items-per-minute", type=float, default=120)
+    parser.add_argument("--distinct", type=int, default=50, help="number of distinct barcodes in the lot")
+    parser.add_argument("--eye-delay", type=float, default=1.0, help="seconds from scanner to photo eye")
+    parser.add_argument("--spacing-jitter", type=float, default=0.0, help="random extra gap between books, as a share of the interval")
+    parser.add_argument("--no-read-rate", type=float, default=0.0, help="share of books the scanner never reads")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of scanned books that never reach the eye")
+    parser.add_argument("--double-trigger-rate", type=float, default=0.0, help="share of books whose beam flickers")
+    parser.add_argument("--beam-ms", type=float, default=60, help="how long an item blocks the photo eye")
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--unauthorized-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=None)
+    parser.add_argument("--drain", type=float, default=3.0, help="seconds to wait for late writes after the last item")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--keep-cache", action="store_true", help="use the on-disk decision cache")
+    parser.add_argument("--json", help="write the report as JSON to this file")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    run(parse_args())
+    os._exit(0)
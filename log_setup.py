@@ -0,0 +1,194 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Per-logger overrides, e.g. "promise=WARNING,plc=DEBUG".
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+# Console lines as plain text ("text") or JSON lines ("json"); the log file is always JSON lines.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_FILE = os.getenv('LOG_FILE', '')
+LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.getenv('LOG_FILE_BACKUPS', '5'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Below WARNING each call site may log this many lines per second (bursts up to LOG_RATE_BURST).
+LOG_RATE_LIMIT = float(os.getenv('LOG_RATE_LIMIT', '20'))
+LOG_RATE_BURST = float(os.getenv('LOG_RATE_BURST', '50'))
+
+_DEFAULT_LEVELS = {
+    "werkzeug": "WARNING",
+    "engineio": "WARNING",
+    "socketio": "WARNING",
+    "urllib3": "WARNING",
+    "asyncio": "WARNING",
+}
+
+# Attributes every LogRecord has; anything else was passed via `extra`.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra`` fields at the top level."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site for records below WARNING.
+
+    The next record let through from a throttled site carries the number of
+    lines dropped in between as ``suppressed``.
+    """
+
+    def __init__(self, rate: float = LOG_RATE_LIMIT, burst: float = LOG_RATE_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._lock = threading.Lock()
+        self._buckets: Dict[tuple, list] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] = tokens - 1.0
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: when the writer falls behind records are dropped and counted."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like QueueHandler.prepare, but the traceback stays in exc_text
+        # instead of being folded into the message.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_exception_formatter = logging.Formatter()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+_rate_limiter: Optional[RateLimitFilter] = None
+_setup_lock = threading.Lock()
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = dict(_DEFAULT_LEVELS)
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def setup_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS, fmt: str = LOG_FORMAT,
+                  log_file: str = LOG_FILE) -> None:
+    """Routes all logging through a bounded queue to a background writer thread.
+
+    Callers only pay for formatting the message and a non-blocking put; the
+    console and the rotating JSON-lines file are written (and rotated) on the
+    listener thread. Safe to call more than once.
+    """
+    global _listener, _queue_handler, _rate_limiter
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter("%(message)s"))
+        handlers = [console]
+        if log_file:
+            directory = os.path.dirname(log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+
+        _rate_limiter = RateLimitFilter()
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(_rate_limiter)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        for name, logger_level in _parse_levels(levels).items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+def stop_logging() -> None:
+    # Drains whatever is still queued.
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def get_logging_stats() -> dict:
+    if _queue_handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queue_depth": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "suppressed": _rate_limiter.suppressed if _rate_limiter is not None else 0,
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dispatcher import dispatch
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on manifest rows; also capped at what the label cache can hold
+# (see manifest_limit) so a lot never evicts its own preloaded labels.
+MAX_MANIFEST_ENTRIES = int(os.getenv('MAX_MANIFEST_ENTRIES', '100000'))
+# Conservative cache footprint of one preloaded label, for the byte budget.
+MANIFEST_ENTRY_BYTES = 256
+MANIFEST_PROGRESS_INTERVAL = float(os.getenv('MANIFEST_PROGRESS_INTERVAL', '0.25'))
+MANIFEST_JOBS_KEPT = 20
+
+BARCODE_COLUMNS = ("barcode", "isbn", "isbn13", "isbn10", "upc", "ean", "scan", "code")
+
+def _clean(value) -> str:
+    return str(value).strip().replace("-", "") if value is not None else ""
+
+def manifest_limit() -> int:
+    """Largest manifest accepted: never more rows than the label cache holds."""
+    from palletiq_api import get_cache_stats
+
+    cache = get_cache_stats()
+    return max(0, min(MAX_MANIFEST_ENTRIES, cache["max_entries"], cache["max_bytes"] // MANIFEST_ENTRY_BYTES))
+
+def parse_manifest(text: str, filename: str = "") -> List[str]:
+    """Returns the unique barcodes of a JSON or CSV manifest in file order."""
+    text = text.lstrip("\ufeff")
+    stripped = text.strip()
+    barcodes: List[str] = []
+
+    if filename.lower().endswith(".json") or stripped.startswith(("[", "{")):
+        data = json.loads(stripped)
+        if isinstance(data, dict):
+            data = next((data[key] for key in ("barcodes", "items", "isbns") if key in data), [])
+        if not isinstance(data, list):
+            raise ValueError("JSON manifest must be a list of barcodes")
+        for entry in data:
+            if isinstance(entry, dict):
+                entry = next((entry[key] for key in BARCODE_COLUMNS if key in entry), None)
+            barcodes.append(_clean(entry))
+    else:
+        rows = list(csv.reader(io.StringIO(text)))
+        column = 0
+        if rows:
+            header = [cell.strip().lower() for cell in rows[0]]
+            match = next((header.index(name) for name in BARCODE_COLUMNS if name in header), None)
+            if match is not None:
+                column = match
+                rows = rows[1:]
+        for row in rows:
+            if len(row) > column:
+                barcodes.append(_clean(row[column]))
+
+    unique = list(OrderedDict.fromkeys(barcode for barcode in barcodes if barcode))
+    limit = manifest_limit()
+    if len(unique) > limit:
+        raise ValueError(f"Manifest has {len(unique)} entries, limit is {limit}")
+    return unique
+
+class ManifestJobs:
+    """Runs manifest pre-resolution jobs on the PalletIQ loop and reports progress.
+
+    ``publish(event, payload)`` is called off the loop thread with throttled
+    ``manifest_progress`` updates and one final ``manifest_complete``. The loop
+    never waits on the dispatcher: only the latest unsent event per job is
+    kept, and a send dropped by a full queue is retried shortly after.
+    """
+
+    def __init__(self, publish: Optional[Callable[[str, dict], None]] = None):
+        self.publish = publish
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._ids = itertools.count(1)
+        # job id -> latest (event, payload) not yet handed to publish
+        self._outbox: Dict[str, Tuple[str, dict]] = {}
+
+    def start(self, barcodes: List[str], name: str = "", concurrency: Optional[int] = None) -> dict:
+        from palletiq_api import get_event_loop, preload_palletiq, MANIFEST_CONCURRENCY
+
+        job = {
+            "id": str(next(self._ids)),
+            "name": name,
+            "status": "running",
+            "total": len(barcodes),
+            "done": 0,
+            "resolved": 0,
+            "already_cached": 0,
+            "failed": 0,
+            "concurrency": max(1, concurrency or MANIFEST_CONCURRENCY),
+            "started_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > MANIFEST_JOBS_KEPT:
+                self._jobs.popitem(last=False)
+
+        last_published = [0.0]
+
+        def on_progress(counts, barcode, route):
+            with self._lock:
+                job.update(counts)
+                snapshot = dict(job)
+            now = time.monotonic()
+            if now - last_published[0] >= MANIFEST_PROGRESS_INTERVAL and counts["done"] < counts["total"]:
+                last_published[0] = now
+                self._publish("manifest_progress", snapshot)
+
+        def on_done(future):
+            with self._lock:
+                try:
+                    job.update(future.result())
+                    job["status"] = "completed"
+                except Exception as e:
+                    job["status"] = "failed"
+                    job["error"] = str(e)
+                job["finished_at"] = time.time()
+                snapshot = dict(job)
+            logger.info(f"📦 Manifest {snapshot['name'] or snapshot['id']} {snapshot['status']}: "
+                        f"{snapshot['resolved']} resolved, {snapshot['already_cached']} cached, "
+                        f"{snapshot['failed']} failed of {snapshot['total']}")
+            self._publish("manifest_complete", snapshot)
+
+        coro = preload_palletiq(barcodes, concurrency=job["concurrency"], on_progress=on_progress)
+        future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+        future.add_done_callback(on_done)
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def _publish(self, event: str, payload: dict):
+        if self.publish is None:
+            return
+        job_id = payload["id"]
+        with self._lock:
+            scheduled = job_id in self._outbox
+            self._outbox[job_id] = (event, payload)
+        if not scheduled:
+            self._schedule(job_id)
+
+    def _schedule(self, job_id: str):
+        if dispatch("manifest", self._send, job_id, block=False):
+            return
+        from palletiq_api import get_event_loop
+
+        loop = get_event_loop()
+        loop.call_soon_threadsafe(loop.call_later, MANIFEST_PROGRESS_INTERVAL, self._schedule, job_id)
+
+    def _send(self, job_id: str):
+        with self._lock:
+            event, payload = self._outbox.pop(job_id)
+        self.publish(event, payload)
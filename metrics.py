@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, Optional
+
+HISTOGRAM_WINDOW = int(os.getenv('METRICS_WINDOW', '2048'))
+MAX_ACTIVE_TRACES = int(os.getenv('METRICS_MAX_TRACES', '5000'))
+
+STAGES = (
+    "scan_received",
+    "api_request_sent",
+    "api_response",
+    "photo_eye_edge",
+    "write_bucket_issued",
+    "plc_ack",
+)
+
+# Histogram name -> (from stage, to stage). "decision" is whichever of the API
+# response and the photo-eye edge came last, i.e. when the bucket write became possible.
+INTERVALS = {
+    "scan_to_request": ("scan_received", "api_request_sent"),
+    "api_round_trip": ("api_request_sent", "api_response"),
+    "scan_to_decision": ("scan_received", "api_response"),
+    "scan_to_photo_eye": ("scan_received", "photo_eye_edge"),
+    "ready_to_write": ("decision", "write_bucket_issued"),
+    "plc_write": ("write_bucket_issued", "plc_ack"),
+    "scan_to_ack": ("scan_received", "plc_ack"),
+}
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class LatencyHistogram:
+    """Rolling window of recent samples (for quantiles) plus lifetime sum/count."""
+
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def quantiles(self, quantiles: Iterable[float] = QUANTILES) -> Dict[float, Optional[float]]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {q: None for q in quantiles}
+        last = len(samples) - 1
+        return {q: samples[min(last, int(round(q * last)))] for q in quantiles}
+
+    def summary(self) -> dict:
+        quantiles = self.quantiles()
+        with self._lock:
+            window = len(self._samples)
+            count, total = self.count, self.total
+        return {
+            "count": count,
+            "window": window,
+            "avg_ms": (total / count * 1000) if count else None,
+            **{f"p{int(q * 100)}_ms": (value * 1000 if value is not None else None) for q, value in quantiles.items()},
+        }
+
+class TraceRecorder:
+    """Per-item stage timestamps feeding one LatencyHistogram per interval.
+
+    Stamps use the monotonic clock; traces are dropped once the item is acked
+    or when more than ``max_traces`` items are in flight.
+    """
+
+    def __init__(self, max_traces: int = MAX_ACTIVE_TRACES):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.histograms = {name: LatencyHistogram() for name in INTERVALS}
+        self.counters = {
+            "items_traced": 0,
+            "items_acked": 0,
+            "late_decisions": 0,
+            "write_failures": 0,
+        }
+
+    def mark(self, item_id: str, stage: str, at: Optional[float] = None):
+        if at is None:
+            at = time.monotonic()
+        with self._lock:
+            stamps = self._traces.get(item_id)
+            if stamps is None:
+                if stage != "scan_received":
+                    return
+                stamps = {}
+                self._traces[item_id] = stamps
+                self.counters["items_traced"] += 1
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            if stage in stamps:
+                return
+            stamps[stage] = at
+
+            if stage in ("api_response", "photo_eye_edge"):
+                if stage == "api_response" and "photo_eye_edge" in stamps:
+                    # The item was already on the belt when its decision arrived.
+                    self.counters["late_decisions"] += 1
+                if "api_response" in stamps and "photo_eye_edge" in stamps:
+                    stamps["decision"] = max(stamps["api_response"], stamps["photo_eye_edge"])
+
+            observed = []
+            for name, (start, end) in INTERVALS.items():
+                if end == stage and start in stamps:
+                    observed.append((name, at - stamps[start]))
+
+            if stage == "plc_ack":
+                self.counters["items_acked"] += 1
+                self._traces.pop(item_id, None)
+
+        for name, seconds in observed:
+            self.histograms[name].observe(seconds)
+
+    def fail(self, item_id: str):
+        with self._lock:
+            self.counters["write_failures"] += 1
+            stamps = self._traces.get(item_id)
+            if stamps is not None:
+                stamps.pop("write_bucket_issued", None)
+
+    def discard(self, item_id: str):
+        with self._lock:
+            self._traces.pop(item_id, None)
+
+    def summary(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            active = len(self._traces)
+        return {
+            "active_traces": active,
+            "counters": counters,
+            "stages": {name: histogram.summary() for name, histogram in self.histograms.items()},
+        }
+
+tracer = TraceRecorder()
+
+def _prometheus_number(value) -> str:
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value))
+
+def _flatten(prefix: str, value, out: list):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(f"{prefix}_{key}", child, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out.append((prefix, value))
+
+def render_prometheus(recorder: TraceRecorder = tracer, gauges: Optional[Dict[str, dict]] = None) -> str:
+    lines = [
+        "# HELP conveyor_stage_latency_seconds Per-item latency between pipeline stages.",
+        "# TYPE conveyor_stage_latency_seconds summary",
+    ]
+    for name, histogram in recorder.histograms.items():
+        for q, value in histogram.quantiles().items():
+            lines.append(f'conveyor_stage_latency_seconds{{stage="{name}",quantile="{q}"}} {_prometheus_number(value)}')
+        lines.append(f'conveyor_stage_latency_seconds_sum{{stage="{name}"}} {_prometheus_number(histogram.total)}')
+        lines.append(f'conveyor_stage_latency_seconds_count{{stage="{name}"}} {histogram.count}')
+
+    summary = recorder.summary()
+    for name, value in summary["counters"].items():
+        lines.append(f"# TYPE conveyor_{name}_total counter")
+        lines.append(f"conveyor_{name}_total {value}")
+    lines.append("# TYPE conveyor_active_traces gauge")
+    lines.append(f"conveyor_active_traces {summary['active_traces']}")
+
+    for group, values in (gauges or {}).items():
+        flattened: list = []
+        _flatten(f"conveyor_{group}", values, flattened)
+        for metric, value in flattened:
+            lines.append(f"{metric} {_prometheus_number(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -1,14 +1,22 @@
-import requests # type: ignore
 import aiohttp
 import asyncio
 import os
 import json
 from dotenv import load_dotenv
-from typing import Dict, Optional
-import re
+from typing import Callable, Dict, Optional
 import time
 import threading
 import logging
+import atexit
+
+from decision_cache import DecisionCache
+from deadlines import DeadlineGate
+from circuit_breaker import CircuitBreaker, OPEN
+from label_history import LabelHistory
+from token_manager import TokenManager
+from promise import Promise, set_default_loop
+from routing import get_routing_table
+from urllib.parse import urlsplit
 
 logger = logging.getLogger(__name__)
 
@@ -19,95 +27,245 @@ DATA_URL_TEMPLATE = os.getenv('PALLETIQ_API_DATA_URL_TEMPLATE')
 EMAIL = os.getenv('EMAIL')
 PASSWORD = os.getenv('PASSWORD')
 
-_session = None
-_session_lock = threading.Lock()
-_token = None
-_token_lock = threading.Lock()
-
-_api_cache: Dict[str, tuple] = {}
-_cache_ttl = 300
-
-SETTINGS_FILE = 'settings.json'
-try:
-    with open(SETTINGS_FILE, 'r') as f:
-        SETTINGS = json.load(f)
-except (FileNotFoundError, json.JSONDecodeError):
-    SETTINGS = {}
-
-def init_session():
-    global _session
-    _session = requests.Session()
-    _session.timeout = 10
-    return
-
-def init_token():
-    global _token
-
-    login_payload = {
-        "wl_team_id": 0,
-        "user_email": EMAIL,
-        "user_password": PASSWORD,
-    }
-    
-    if not LOGIN_URL:
-        return
-    
-    response = _session.post(LOGIN_URL, json=login_payload, timeout=10)
-    if response.status_code == 200:
-        data = response.json()
-        with _token_lock:
-            _token = data.get('token')
-            return
-
-    return
-
-def get_pusher_number(label: str):
-    for pusher, config in SETTINGS.items():
-        if config.get('label') == label:
-            match = re.search(r'\d+', pusher)
-            if match:
-                return {
-                    "pusher": int(match.group(0)),
-                    "label": config.get('label'),
-                    "distance": config.get('distance')
-                }
+HTTP_POOL_LIMIT = int(os.getenv('PALLETIQ_POOL_LIMIT', '100'))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('PALLETIQ_POOL_LIMIT_PER_HOST', '50'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('PALLETIQ_KEEPALIVE_TIMEOUT', '75'))
+HTTP_DNS_CACHE_TTL = int(os.getenv('PALLETIQ_DNS_CACHE_TTL', '600'))
+HTTP_TIMEOUT = float(os.getenv('PALLETIQ_TIMEOUT', '10'))
+# Upstream lookups allowed at once; the rest queue earliest-deadline-first.
+MAX_CONCURRENT_LOOKUPS = int(os.getenv('PALLETIQ_MAX_CONCURRENT', str(HTTP_POOL_LIMIT_PER_HOST)))
+# Floor for deadline-sized waits so cache hits still complete for late items.
+MIN_LOOKUP_TIMEOUT = float(os.getenv('PALLETIQ_MIN_TIMEOUT', '0.05'))
+# Manifest pre-resolution: parallel lookups and how long preloaded labels stay cached.
+MANIFEST_CONCURRENCY = int(os.getenv('PALLETIQ_MANIFEST_CONCURRENCY', '8'))
+MANIFEST_TTL = float(os.getenv('PALLETIQ_MANIFEST_TTL', str(12 * 3600)))
+# Label routed when PalletIQ cannot answer and the label history has no match.
+DEGRADED_LABEL = os.getenv('PALLETIQ_DEGRADED_LABEL', 'Extra')
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+_async_session: Optional[aiohttp.ClientSession] = None
+
+# barcode -> shared upstream lookup; only touched from the PalletIQ loop thread.
+_inflight: Dict[str, asyncio.Future] = {}
+_lookup_stats = {"upstream": 0, "coalesced": 0, "degraded_history": 0, "degraded_fallback": 0}
+_lookup_gate = DeadlineGate(MAX_CONCURRENT_LOOKUPS)
+_breaker = CircuitBreaker(
+    "palletiq",
+    window=int(os.getenv('PALLETIQ_BREAKER_WINDOW', '20')),
+    min_calls=int(os.getenv('PALLETIQ_BREAKER_MIN_CALLS', '5')),
+    failure_rate=float(os.getenv('PALLETIQ_BREAKER_FAILURE_RATE', '0.5')),
+    slow_call=float(os.getenv('PALLETIQ_BREAKER_SLOW_CALL', '2.0')),
+    open_seconds=float(os.getenv('PALLETIQ_BREAKER_OPEN_SECONDS', '10')),
+    half_open_trials=int(os.getenv('PALLETIQ_BREAKER_HALF_OPEN_TRIALS', '2')),
+)
+_label_history = LabelHistory()
+
+_cache_ttl = float(os.getenv('PALLETIQ_CACHE_TTL', '300'))
+_api_cache = DecisionCache(
+    ttl=_cache_ttl,
+    max_entries=int(os.getenv('PALLETIQ_CACHE_MAX_ENTRIES', '50000')),
+    max_bytes=int(os.getenv('PALLETIQ_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    db_path=os.getenv('PALLETIQ_CACHE_DB', 'palletiq_cache.db') or None,
+)
+
+def init_token(timeout: float = HTTP_TIMEOUT):
+    # Blocking first login at startup; after that the token manager renews it
+    # in the background on the PalletIQ loop ahead of expiry.
+    async def first_login():
+        token = await _tokens.refresh()
+        _tokens.start()
+        return token
+
+    try:
+        return asyncio.run_coroutine_threadsafe(first_login(), get_event_loop()).result(timeout=timeout)
+    except Exception as e:
+        logger.error(f"❌ Initial PalletIQ login failed: {e}")
+        return None
+
+def get_pusher_number(label: str, routing=None):
+    # Each conveyor line resolves shared labels against its own routing table.
+    return (routing or get_routing_table()).resolve(label)
+
+def _run_event_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_run_event_loop, args=(_loop,), daemon=True, name="PalletIQ-Loop")
+            _loop_thread.start()
+            set_default_loop(_loop)
+        return _loop
+
+async def _get_async_session():
+    # Only ever touched from the PalletIQ loop thread, so no lock is needed.
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        _async_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return _async_session
+
+_tokens = TokenManager(
+    LOGIN_URL, EMAIL, PASSWORD, _get_async_session,
+    refresh_margin=float(os.getenv('PALLETIQ_TOKEN_REFRESH_MARGIN', '60')),
+    default_ttl=float(os.getenv('PALLETIQ_TOKEN_TTL', '3600')),
+    min_refresh=float(os.getenv('PALLETIQ_TOKEN_MIN_REFRESH', '5')),
+)
+
+async def _warm_up():
+    if not DATA_URL_TEMPLATE:
+        return False
+    parts = urlsplit(DATA_URL_TEMPLATE)
+    if not parts.scheme or not parts.netloc:
+        return False
+    origin = f"{parts.scheme}://{parts.netloc}/"
+    session = await _get_async_session()
+    try:
+        async with session.head(origin, allow_redirects=False) as response:
+            await response.read()
+        return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"⚠️ PalletIQ connection warm-up failed: {e}")
+        return False
 
+def warm_up_connection(timeout: float = HTTP_TIMEOUT) -> bool:
+    future = asyncio.run_coroutine_threadsafe(_warm_up(), get_event_loop())
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        logger.warning(f"⚠️ PalletIQ connection warm-up did not complete: {e}")
+        return False
+
+async def _close_async_session():
+    global _async_session
+    _tokens.stop()
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+    _async_session = None
+
+def get_cache_stats() -> dict:
+    return _api_cache.stats()
+
+def get_lookup_stats() -> dict:
     return {
-        "pusher": 8,
-        "label": "Extra",
-        "distance": 0
+        "inflight": len(_inflight),
+        "upstream": _lookup_stats["upstream"],
+        "coalesced": _lookup_stats["coalesced"],
+        "degraded_history": _lookup_stats["degraded_history"],
+        "degraded_fallback": _lookup_stats["degraded_fallback"],
+        "gate": _lookup_gate.stats(),
+        "history": _label_history.stats(),
+        "token": _tokens.stats(),
     }
 
-async def _get_async_session():
-    loop = asyncio.get_event_loop()
+def get_breaker_stats() -> dict:
+    return _breaker.stats()
+
+def load_label_history(path: Optional[str]) -> int:
+    return _label_history.load(path)
+
+def _degraded_route(barcode: str, routing=None) -> Dict:
+    # Used while the breaker is open or when a lookup failed: last known label
+    # for this barcode (or its prefix), else the configured catch-all.
+    label = _label_history.lookup(barcode)
+    if label is not None:
+        _lookup_stats["degraded_history"] += 1
+        source = "history"
+    else:
+        _lookup_stats["degraded_fallback"] += 1
+        label = DEGRADED_LABEL
+        source = "fallback"
+    route = get_pusher_number(label, routing)
+    route["degraded"] = source
+    return route
+
+@atexit.register
+def close_cache():
+    _api_cache.close()
+
+@atexit.register
+def close_event_loop():
+    global _loop
+    with _loop_lock:
+        loop = _loop
+        _loop = None
+    if loop is None or loop.is_closed():
+        return
     try:
-        if loop.is_closed():
-            return None
-    except RuntimeError:
-        return None
-    
-    connector = aiohttp.TCPConnector(limit=100, limit_per_host=50)
-    session = aiohttp.ClientSession(connector=connector)
-    return session
+        asyncio.run_coroutine_threadsafe(_close_async_session(), loop).result(timeout=2)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
 
-async def request_palletiq(barcode: str) -> Optional[Dict]: 
-    global _token
+async def request_palletiq(barcode: str, deadline: Optional[float] = None, routing=None) -> Optional[Dict]:
     if not DATA_URL_TEMPLATE:
         return None
     
-    current_time = time.time()
+    # The cache holds classification labels; they are resolved against the
+    # current routing table on every lookup so settings changes apply at once.
+    cached_label = _api_cache.get(barcode)
+    if isinstance(cached_label, dict):
+        # Entries persisted before labels were cached held the resolved route.
+        cached_label = cached_label.get("label")
+    if cached_label is not None:
+        await asyncio.sleep(0)
+        return get_pusher_number(cached_label, routing)
     
-    if barcode in _api_cache:
-        cached_data, cached_time = _api_cache[barcode]
-        if current_time - cached_time < _cache_ttl:
-            await asyncio.sleep(0)
-            return cached_data
-        else:
-            del _api_cache[barcode]
+    pending = _inflight.get(barcode)
+    if pending is None:
+        if not _breaker.allow():
+            return _degraded_route(barcode, routing)
+        pending = asyncio.ensure_future(_fetch_palletiq(barcode, deadline))
+        _inflight[barcode] = pending
+        _lookup_stats["upstream"] += 1
+        
+        def _clear_inflight(done, barcode=barcode):
+            if _inflight.get(barcode) is done:
+                del _inflight[barcode]
+        
+        pending.add_done_callback(_clear_inflight)
+    else:
+        _lookup_stats["coalesced"] += 1
+        logger.info(f"🔗 Joining in-flight PalletIQ lookup for barcode {barcode}")
     
+    # Shield the shared lookup so one waiter timing out does not cancel it for the rest.
+    label = await asyncio.shield(pending)
+    if label is None:
+        return _degraded_route(barcode, routing)
+    return get_pusher_number(label, routing)
+
+async def _fetch_palletiq(barcode: str, deadline: Optional[float] = None) -> Optional[str]:
+    async with _lookup_gate.slot(deadline):
+        if _breaker.state == OPEN:
+            # Opened while this lookup was queued; do not add to the pile-up.
+            return None
+        started = time.monotonic()
+        label = None
+        try:
+            label = await _query_palletiq(barcode)
+        finally:
+            _breaker.record(label is not None, time.monotonic() - started)
+    if label is not None:
+        _label_history.record(barcode, label)
+    return label
+
+async def _query_palletiq(barcode: str) -> Optional[str]:
     try:
-        with _token_lock:
-            token = _token
+        token = await _tokens.get_token()
         if not token:
             logger.warning(f"⚠️ No token available for barcode {barcode}")
             return None
@@ -141,46 +299,42 @@ async def request_palletiq(barcode: str) -> Optional[Dict]:
                         elif group == 'Video Game':
                             label = 'Reject Video Game'
                     
-                    pusher_data = get_pusher_number(label)
-                    _api_cache[barcode] = (pusher_data, current_time)
-                    result = pusher_data
+                    _api_cache.set(barcode, label)
+                    result = label
                 elif response.status == 401:
                     logger.warning(f"⚠️ Token expired (401), refreshing token for barcode {barcode}")
-                    with _token_lock:
-                        _token = None
                     try:
-                        init_token()
-                        with _token_lock:
-                            if _token:
-                                logger.info(f"✅ Token refreshed successfully, retrying request")
-                                retry_url = DATA_URL_TEMPLATE.format(scan=barcode, token=_token)
-                                async with async_session.get(retry_url) as retry_response:
-                                    if retry_response.status == 200:
-                                        product_data = await retry_response.json()
-                                        winner = product_data.get('winner')
-                                        meta = product_data.get('meta')
-                                        label = 'Extra'
-                                        if winner and winner.get('winnerModule'):
-                                            label = winner.get('winnerSubModule', 'Extra')
-                                        elif meta:
-                                            group = meta.get('product_group')
-                                            if group == 'Book':
-                                                label = 'Reject Book'
-                                            elif group == 'Music':
-                                                label = 'Reject Music'
-                                            elif group == 'DVD':
-                                                label = 'Reject DVD'
-                                            elif group == 'Video Game':
-                                                label = 'Reject Video Game'
-                                        pusher_data = get_pusher_number(label)
-                                        _api_cache[barcode] = (pusher_data, current_time)
-                                        result = pusher_data
-                                    else:
-                                        logger.error(f"❌ Retry after token refresh failed with status {retry_response.status}")
-                                        result = None
-                            else:
-                                logger.error(f"❌ Failed to refresh token")
-                                result = None
+                        # Concurrent 401s share one login; a newer token is reused as-is.
+                        token = await _tokens.invalidate(token)
+                        if token:
+                            logger.info(f"✅ Token refreshed successfully, retrying request")
+                            retry_url = DATA_URL_TEMPLATE.format(scan=barcode, token=token)
+                            async with async_session.get(retry_url) as retry_response:
+                                if retry_response.status == 200:
+                                    product_data = await retry_response.json()
+                                    winner = product_data.get('winner')
+                                    meta = product_data.get('meta')
+                                    label = 'Extra'
+                                    if winner and winner.get('winnerModule'):
+                                        label = winner.get('winnerSubModule', 'Extra')
+                                    elif meta:
+                                        group = meta.get('product_group')
+                                        if group == 'Book':
+                                            label = 'Reject Book'
+                                        elif group == 'Music':
+                                            label = 'Reject Music'
+                                        elif group == 'DVD':
+                                            label = 'Reject DVD'
+                                        elif group == 'Video Game':
+                                            label = 'Reject Video Game'
+                                    _api_cache.set(barcode, label)
+                                    result = label
+                                else:
+                                    logger.error(f"❌ Retry after token refresh failed with status {retry_response.status}")
+                                    result = None
+                        else:
+                            logger.error(f"❌ Failed to refresh token")
+                            result = None
                     except Exception as e:
                         logger.error(f"❌ Error refreshing token: {e}", exc_info=True)
                         result = None
@@ -192,9 +346,8 @@ async def request_palletiq(barcode: str) -> Optional[Dict]:
                         
                         if error_msg == "No results":
                             logger.info(f"ℹ️ PalletIQ API: No results found for barcode {barcode}, using default pusher")
-                            pusher_data = get_pusher_number('Extra')
-                            _api_cache[barcode] = (pusher_data, current_time)
-                            result = pusher_data
+                            _api_cache.set(barcode, 'Extra')
+                            result = 'Extra'
                         else:
                             logger.error(f"❌ PalletIQ API returned status 400 (Bad Request) for barcode {barcode}. Error: {error_body}")
                             result = None
@@ -220,29 +373,57 @@ async def request_palletiq(barcode: str) -> Optional[Dict]:
         except Exception as e:
             logger.error(f"❌ Unexpected error in request_palletiq for barcode {barcode}: {e}", exc_info=True)
             result = None
-        finally:
-            if async_session:
-                try:
-                    await async_session.close()
-                except:
-                    pass
         
         return result
     except Exception as e:
         logger.error(f"❌ Fatal error in request_palletiq for barcode {barcode}: {e}", exc_info=True)
         return None
 
-from promise import Promise
-
-def request_palletiq_async(barcode: str):
-    return Promise(request_palletiq(barcode))
+def request_palletiq_async(barcode: str, deadline: Optional[float] = None, routing=None, source: str = "promise"):
+    # With a deadline (epoch seconds) the wait is sized to the time left; the
+    # shared upstream lookup keeps running and still fills the cache. `source`
+    # picks the dispatch source (and so the line's pool) for the callbacks.
+    if deadline is None:
+        return Promise(request_palletiq(barcode, routing=routing), loop=get_event_loop(), source=source)
+    timeout = max(MIN_LOOKUP_TIMEOUT, deadline - time.time())
+    return Promise(request_palletiq(barcode, deadline, routing), loop=get_event_loop(), timeout=timeout, source=source)
 
 def request_palletiq_sync(barcode: str):
-    import asyncio
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        result = loop.run_until_complete(request_palletiq(barcode))
-        return result
-    finally:
-        loop.close()
+    future = asyncio.run_coroutine_threadsafe(request_palletiq(barcode), get_event_loop())
+    return future.result()
+
+async def preload_palletiq(barcodes, concurrency: int = MANIFEST_CONCURRENCY,
+                           on_progress: Optional[Callable[[dict, str, Optional[Dict]], None]] = None) -> dict:
+    # Resolves a manifest ahead of the lot. Lookups carry no deadline, so the
+    # gate always admits live belt lookups ahead of them. A fixed set of
+    # workers drains the manifest, so a 100k-row lot never means 100k tasks.
+    pending = iter(barcodes)
+    counts = {"total": len(barcodes), "done": 0, "resolved": 0, "already_cached": 0, "failed": 0}
+
+    async def resolve(barcode):
+        already_cached = barcode in _api_cache
+        try:
+            route = await request_palletiq(barcode)
+        except Exception as e:
+            logger.error(f"❌ Manifest lookup failed for barcode {barcode}: {e}")
+            route = None
+
+        # Keep the label cached until the lot is run; not counted as a lookup.
+        _api_cache.extend(barcode, MANIFEST_TTL)
+        counts["done"] += 1
+        if route is None or route.get("degraded"):
+            counts["failed"] += 1
+        elif already_cached:
+            counts["already_cached"] += 1
+        else:
+            counts["resolved"] += 1
+        if on_progress is not None:
+            on_progress(dict(counts), barcode, route)
+
+    async def worker():
+        for barcode in pending:
+            await resolve(barcode)
+
+    workers = min(max(1, concurrency), max(1, len(barcodes)))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return counts
@@ -3,337 +3,589 @@ import struct
 import time
 import threading
 import atexit
+import inspect
 import os
+import logging
 from pymodbus.client import ModbusTcpClient
 
+from dispatcher import dispatch
+from routing import get_routing_table
+from plc_io import PlcIoScheduler, PRIORITY_EDGE, PRIORITY_BUCKET, PRIORITY_CONNECT, PRIORITY_STATUS, PRIORITY_SETTINGS
+from plc_link import PlcLink
+
+logger = logging.getLogger(__name__)
+
 PLC_IP = os.getenv('PLC_IP')
 PLC_PORT = int(os.getenv('PLC_PORT', '502'))
 PLC_TIMEOUT = float(os.getenv('PLC_TIMEOUT', '5.0'))
 PHOTO_EYE_ADDRESS = int(os.getenv('PHOTO_EYE_ADDRESS', '0x0015'), 16)
+# Pusher N's distance is a big-endian float in the two holding registers at
+# PUSHER_DISTANCE_ADDRESS + 2 * (N - 1), so the whole table is one block.
+PUSHER_DISTANCE_ADDRESS = int(os.getenv('PUSHER_DISTANCE_ADDRESS', '0x7001'), 16)
+PUSHER_COUNT = int(os.getenv('PUSHER_COUNT', '8'))
 UNIT_ID = int(os.getenv('MODBUS_UNIT_ID', '1'))
 
-plc = None
-modbus_lock = threading.Lock()
-_settings_lock = threading.Lock()
-SETTINGS = {}
+def _unit_keyword():
+    # pymodbus renamed the unit argument across releases (unit -> slave -> device_id).
+    params = inspect.signature(ModbusTcpClient.write_register).parameters
+    for name in ("device_id", "slave", "unit"):
+        if name in params:
+            return name
+    return "slave"
+
+UNIT_KEYWORD = _unit_keyword()
+UNIT_KWARGS = {UNIT_KEYWORD: UNIT_ID}
+PLC_IO_TIMEOUT = float(os.getenv('PLC_IO_TIMEOUT', str(PLC_TIMEOUT * 3)))
 
-_photo_eye_callbacks = []
-_photo_eye_callbacks_lock = threading.Lock()
-_photo_eye_monitor_thread = None
-_photo_eye_monitor_running = False
-_photo_eye_last_value = 0
+# "coil": read the photo-eye coil, then the position register on a rising edge.
+# "block": one input-register read returning both the photo-eye state and the
+# position ID (requires the PLC to mirror/latch the eye into that block).
+PHOTO_EYE_SAMPLE_MODE = os.getenv('PHOTO_EYE_SAMPLE_MODE', 'coil').lower()
+POSITION_ID_ADDRESS = int(os.getenv('POSITION_ID_ADDRESS', '0x0015'), 16)
+PHOTO_EYE_BLOCK_ADDRESS = int(os.getenv('PHOTO_EYE_BLOCK_ADDRESS', '0x0014'), 16)
+PHOTO_EYE_BLOCK_COUNT = int(os.getenv('PHOTO_EYE_BLOCK_COUNT', '2'))
+PHOTO_EYE_STATE_OFFSET = int(os.getenv('PHOTO_EYE_STATE_OFFSET', '0'))
+PHOTO_EYE_STATE_BIT = int(os.getenv('PHOTO_EYE_STATE_BIT', '0'))
+PHOTO_EYE_POSITION_OFFSET = int(os.getenv('PHOTO_EYE_POSITION_OFFSET', '1'))
+PHOTO_EYE_POLL_MIN = float(os.getenv('PHOTO_EYE_POLL_MIN', '0.005'))
+PHOTO_EYE_POLL_MAX = float(os.getenv('PHOTO_EYE_POLL_MAX', '0.02'))
+PHOTO_EYE_ACTIVE_WINDOW = float(os.getenv('PHOTO_EYE_ACTIVE_WINDOW', '5.0'))
+# The link counts as healthy while the monitor has had a good sample this recently.
+PLC_HEALTH_STALE = float(os.getenv('PLC_HEALTH_STALE', '2.0'))
 
 def load_settings():
-    global SETTINGS
-    with _settings_lock:
+    return get_routing_table().load().settings
+
+def float_to_registers(value):
+    packed = struct.pack('>f', float(value))
+    return struct.unpack('>HH', packed)
+
+def pusher_distance_registers(settings, current=None):
+    # Register image of the pusher table; pushers missing from `settings` keep
+    # their `current` values (or 0 when there is nothing to keep).
+    values = list(current) if current is not None else [0] * (2 * PUSHER_COUNT)
+    for index in range(PUSHER_COUNT):
+        pusher = settings.get(f"Pusher {index + 1}")
+        if pusher is not None:
+            values[2 * index:2 * index + 2] = float_to_registers(pusher.get("distance", 0))
+    return values
+
+class PlcConnection:
+    """One PLC endpoint: its Modbus client, I/O thread, link and photo-eye monitor.
+
+    Only this connection's I/O thread touches ``plc``; everything else goes
+    through ``io``. Bucket writes are validated against ``routing``, the
+    routing table of the line the PLC drives.
+    """
+
+    def __init__(self, host, port=PLC_PORT, unit_id=UNIT_ID, routing=None, name="PLC", dispatch_source="photo_eye"):
+        self.host = host
+        self.port = port
+        self.unit_id = unit_id
+        self.routing = routing if routing is not None else get_routing_table()
+        self.name = name
+        self.unit_kwargs = {UNIT_KEYWORD: unit_id}
+
+        self.plc = None
+        self.io = PlcIoScheduler(name=f"{name}-IO")
+        self.io.start()
+        self.link = PlcLink(self.io, self._connect_plc, self._probe_plc, io_timeout=PLC_IO_TIMEOUT,
+                            name=f"{name}-Link", on_up=self._on_link_up)
+
+        self._photo_eye_callbacks = []
+        self._photo_eye_callbacks_lock = threading.Lock()
+        self._photo_eye_monitor_thread = None
+        self._photo_eye_monitor_running = False
+        self._photo_eye_last_value = 0
+        self._photo_eye_active_until = 0.0
+        self._photo_eye_stats_lock = threading.Lock()
+        self._photo_eye_stats = {
+            "samples": 0,
+            "sample_errors": 0,
+            "edges_detected": 0,
+            "position_read_failures": 0,
+            "latency_count": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+            "latency_last": 0.0,
+            "last_ok_at": None,
+            "last_error_at": None,
+            "last_value": None,
+        }
+        # Dispatch sources are pinned to one worker each; a connection per line
+        # with its own source keeps each line's edges in order independently.
+        self.dispatch_source = dispatch_source
+
+    def connect(self):
+        # One blocking attempt at startup; from then on the link thread keeps the
+        # connection alive and reconnects with backoff.
+        self.link.connect_now()
+        self.link.start()
+        self.start_photo_eye_monitor()
+        return self.plc if self.link.connected else None
+
+    def _connect_plc(self):
+        if self.plc is not None:
+            try:
+                self.plc.close()
+            except Exception:
+                pass
+            self.plc = None
         try:
-            with open("settings.json", "r") as f:
-                SETTINGS = json.load(f)
-        except FileNotFoundError:
-            SETTINGS = {}
-        except json.JSONDecodeError:
-            SETTINGS = {}
+            client = ModbusTcpClient(self.host, port=self.port, timeout=PLC_TIMEOUT)
+            if not client.connect():
+                return False
         except Exception:
-            SETTINGS = {}
-    return SETTINGS
+            return False
+        self.plc = client
+        return True
 
-load_settings()
-
-def connect_plc():
-    global plc
-    with modbus_lock:
-        if plc is not None:
-            is_real_plc = (hasattr(plc, "_socket") or 
-                            hasattr(plc, "_socket") or 
-                            type(plc).__name__ == "ModbusTcpClient")
-            
-            if is_real_plc:
-                if hasattr(plc, 'connected'):
-                    if plc.connected:
-                        try:
-                            test_result = plc.read_coils(PHOTO_EYE_ADDRESS, count=1)
-                            if test_result and not test_result.isError():
-                                return plc
-                        except (OSError, AttributeError, Exception):
-                            pass
-                    try:
-                        if hasattr(plc, 'close'):
-                            plc.close()
-                    except (OSError, AttributeError):
-                        pass
-                    plc = None
-                else:
-                    if hasattr(plc, '_socket') and plc._socket:
-                        try:
-                            test_result = plc.read_coils(PHOTO_EYE_ADDRESS, count=1)
-                            if test_result and not test_result.isError():
-                                return plc
-                        except (OSError, AttributeError, Exception):
-                            pass
-                    try:
-                        if hasattr(plc, 'close'):
-                            plc.close()
-                    except (OSError, AttributeError):
-                        pass
-                    plc = None
+    def _probe_plc(self):
+        # Any response, even a Modbus exception reply, means the PLC is reachable.
+        if self.plc is None:
+            return False
         try:
-            plc = ModbusTcpClient(PLC_IP, port=PLC_PORT, timeout=PLC_TIMEOUT)
-            connection_result = plc.connect()
-
-            if connection_result:
-                try:
-                    test_result = plc.read_coils(PHOTO_EYE_ADDRESS, count=1)
-                    if test_result and not test_result.isError():
-                        return plc
-                except Exception:
-                    pass
-                return plc
-            else:
-                plc = None
-                return None
+            return self.plc.read_coils(PHOTO_EYE_ADDRESS, count=1) is not None
+        except Exception:
+            return False
 
-        except (ConnectionRefusedError, TimeoutError, OSError, Exception) as e:
-            plc = None
-            return None
+    @property
+    def connected(self):
+        return self.link.connected
 
-def is_plc_connected():
-    global plc
-    with modbus_lock:
-        if plc is not None:
-            is_real_plc = (hasattr(plc, "_socket") or
-                          hasattr(plc, "socket") or
-                          type(plc).__name__ == 'ModbusTcpClient')
-
-            if is_real_plc:
-                if hasattr(plc, '_socket') and plc._socket is not None:
-                    try:
-                        if hasattr(plc._socket, 'fileno'):
-                            plc._socket.fileno()
-                            return True
-                    except:
-                        pass
-                if hasattr(plc, 'connected') and plc.connected:
-                    return True
-                try:
-                    result = plc.read_coils(PHOTO_EYE_ADDRESS, count=1)
-                    if result and not result.isError():
-                        return True
-                except:
-                    pass
-        return False
+    def reset(self):
+        try:
+            self.io.call("reset", PRIORITY_CONNECT, self._reset_plc, timeout=PLC_IO_TIMEOUT)
+        except Exception:
+            pass
 
-def reset_plc():
-    global plc
-    with modbus_lock:
-        if plc is not None:
+    def _reset_plc(self):
+        self.link.mark_down()
+        if self.plc is not None:
             try:
-                if hasattr(plc, 'close'):
-                    plc.close()
+                if hasattr(self.plc, 'close'):
+                    self.plc.close()
             except:
                 pass
-            plc = None
+            self.plc = None
 
-@atexit.register
-def cleanup_modbus():
-    global plc
-    try:
-        lock_acquired = False
-        try:
-            lock_acquired = modbus_lock.acquire(blocking = False)
-        except (KeyboardInterrupt, SystemExit, RuntimeError):
-            lock_acquired = False
-        
+    def close(self):
         try:
-            current_plc = plc
-            if current_plc:
-                try:
-                    if hasattr(current_plc, 'close'):
-                        try:
-                            current_plc.close()
-                        except (OSError, AttributeError, KeyboardInterrupt, SystemExit):
-                            pass
-                except (KeyboardInterrupt, SystemExit):
-                    pass
-                except Exception:
-                    pass
-                if lock_acquired:
-                    plc = None
-        except (KeyboardInterrupt, SystemExit):
-            pass
+            self.stop_photo_eye_monitor()
+            self.link.stop()
+            self.io.stop()
         except Exception:
             pass
-        finally:
-            if lock_acquired:
-                try:
-                    modbus_lock.release()
-                except:
-                    pass
-    except (KeyboardInterrupt, SystemExit):
-        pass
-    except Exception:
-        pass
-
-def float_to_registers(value):
-    packed = struct.pack('>f', float(value))
-    return struct.unpack('>HH', packed)
+        current_plc = self.plc
+        self.plc = None
+        if current_plc is not None:
+            try:
+                current_plc.close()
+            except Exception:
+                pass
 
-def write_settings(settings=None):
-    global SETTINGS
-    if not settings:
-        with _settings_lock:
+    def write_settings(self, settings=None):
+        # The routing table (and with it every deadline) only switches once the
+        # PLC holds the same pusher distances; returns whether it does.
+        if not settings:
             try:
-                with open("settings.json", "r") as f:
+                with open(self.routing.settings_file, "r") as f:
                     settings = json.load(f)
             except Exception:
-                settings = SETTINGS.copy() if SETTINGS else {}
-
-    MODBUS_REGISTERS = {
-        "Pusher 1": 0x7000,
-        "Pusher 2": 0x7002,
-        "Pusher 3": 0x7004,
-        "Pusher 4": 0x7006,
-        "Pusher 5": 0x7008,
-        "Pusher 6": 0x700A,
-        "Pusher 7": 0x700C,
-        "Pusher 8": 0x700E
-    }
-    with modbus_lock:
-        for pusher, address in MODBUS_REGISTERS.items():
-            if pusher not in settings:
-                continue
-            dist = settings[pusher].get("distance", 0)
-            high, low = float_to_registers(dist)
-            print(f"📝 Writing {pusher}: {dist} → [{high}, {low}] to 0x{address:X}")
-            try:
-                plc.write_registers(address + 1, [high, low], unit=UNIT_ID)
-            except Exception as e:
-                print(f"❌ Error writing {pusher}: {e}")
-        plc.close()
+                settings = dict(self.routing.snapshot.settings)
 
-    load_settings()
+        if not self.link.connected:
+            logger.error(f"❌ Error writing settings to {self.name}: PLC not connected")
+            return False
+        try:
+            written = self.io.call("settings", PRIORITY_SETTINGS, self._write_pusher_distances, settings, timeout=PLC_IO_TIMEOUT)
+        except Exception as e:
+            logger.error(f"❌ Error writing settings to {self.name}: {e}")
+            return False
+        if not written:
+            return False
 
-def write_bucket(value, pusher):
-    global plc
-    
-    if not (101 <= value <= 150):
-        print(f"❌ Invalid bucket value: {value}. Must be between 101 and 150.")
-        return -1
-
-    register_address = 0x0064 + (value - 101)
-    register_ref = 0x0013
-
-    pusher_key = f"Pusher {pusher}"
-    if pusher_key not in SETTINGS:
-        print(f"❌ Pusher {pusher} not found in settings.json")
-        return -1
-
-    with modbus_lock:
-        if plc is None:
-            print(f"❌ PLC not connected, attempting to reconnect...")
-            connect_plc()
-        
-        if plc is None:
-            print(f"❌ Modbus write error: PLC not connected")
+        self.routing.update(settings)
+        return True
+
+    def _on_link_up(self):
+        # Runs on the link thread after every (re)connect: a restarted PLC may
+        # have lost the distances the routing table is using.
+        settings = self.routing.snapshot.settings
+        if not settings:
+            return
+        try:
+            self.io.call("settings", PRIORITY_SETTINGS, self._write_pusher_distances, settings, timeout=PLC_IO_TIMEOUT)
+        except Exception as e:
+            logger.error(f"❌ Error restoring pusher distances on {self.name}: {e}")
+
+    def _read_pusher_distances(self):
+        count = 2 * PUSHER_COUNT
+        result = self.plc.read_holding_registers(PUSHER_DISTANCE_ADDRESS, count=count, **self.unit_kwargs)
+        if result is None or result.isError() or len(result.registers) < count:
+            raise IOError(f"could not read back pusher distances from 0x{PUSHER_DISTANCE_ADDRESS:04X}")
+        return list(result.registers[:count])
+
+    def _write_pusher_distances(self, settings):
+        # Read back, write only the span that differs in one transaction, verify.
+        # The connection stays open so bucket writes are not held up by a reconnect.
+        if self.plc is None:
+            logger.error(f"❌ Modbus write error: {self.name} not connected")
+            return False
+        try:
+            current = self._read_pusher_distances()
+            wanted = pusher_distance_registers(settings, current)
+            changed = [index for index in range(len(wanted)) if wanted[index] != current[index]]
+            if not changed:
+                self.link.report(True)
+                logger.info(f"✅ {self.name} pusher distances already up to date")
+                return True
+
+            first = changed[0] - changed[0] % 2
+            last = changed[-1] | 1
+            for index in range(first // 2, last // 2 + 1):
+                logger.debug(f"📝 Writing Pusher {index + 1}: {wanted[2 * index:2 * index + 2]} "
+                             f"to 0x{PUSHER_DISTANCE_ADDRESS + 2 * index:X}")
+            result = self.plc.write_registers(PUSHER_DISTANCE_ADDRESS + first, wanted[first:last + 1], **self.unit_kwargs)
+            if result is None or result.isError():
+                raise IOError(f"PLC rejected the pusher distance write: {result}")
+
+            verified = self._read_pusher_distances()
+        except Exception as e:
+            self.link.report(False)
+            logger.error(f"❌ Error writing pusher distances to {self.name}: {e}")
+            return False
+
+        self.link.report(True)
+        if verified != wanted:
+            logger.error(f"❌ Pusher distance verification failed on {self.name}: wrote {wanted}, read back {verified}")
+            return False
+        logger.info(f"✅ Wrote pusher distances {first // 2 + 1}-{last // 2 + 1} to {self.name} in one transaction")
+        return True
+
+    def write_bucket(self, value, pusher):
+        if not (101 <= value <= 150):
+            logger.error(f"❌ Invalid bucket value: {value}. Must be between 101 and 150.")
+            return -1
+
+        if not self.routing.snapshot.has_pusher(pusher):
+            logger.error(f"❌ Pusher {pusher} not found in {self.routing.settings_file}")
+            return -1
+
+        # Only the cached link state is checked here; probing and reconnecting
+        # are left to the link thread.
+        if not self.link.connected:
+            logger.error(f"❌ Modbus write error: {self.name} not connected")
             return -1
-        
+
+        try:
+            return self.io.call("bucket", PRIORITY_BUCKET, self._write_bucket, value, pusher, timeout=PLC_IO_TIMEOUT)
+        except Exception as e:
+            logger.error(f"❌ Modbus write error: {e}")
+            return -1
+
+    def _write_bucket(self, value, pusher):
+        register_address = 0x0064 + (value - 101)
+        register_ref = 0x0013
+
+        if self.plc is None:
+            logger.error(f"❌ Modbus write error: {self.name} not connected")
+            return -1
+
         try:
-            if not is_plc_connected():
-                print(f"❌ PLC connection lost, attempting to reconnect...")
-                connect_plc()
-                if plc is None:
-                    print(f"❌ Modbus write error: Failed to reconnect PLC")
-                    return -1
-            
-            plc.write_register(register_address, pusher, unit=UNIT_ID)
-            plc.write_register(register_ref, value, unit=UNIT_ID)
-
-            print(f"✅ Updated register 0x{register_ref:04X} with {value}")
-            print(f"✅ Wrote pusher {pusher} to register 0x{register_address:04X}")
+            self.plc.write_register(register_address, pusher, **self.unit_kwargs)
+            self.plc.write_register(register_ref, value, **self.unit_kwargs)
+
+            logger.debug(f"✅ Updated register 0x{register_ref:04X} with {value}")
+            logger.debug(f"✅ Wrote pusher {pusher} to register 0x{register_address:04X}")
         except Exception as e:
-            print(f"❌ Modbus write error: {e}")
+            self.link.report(False)
+            logger.error(f"❌ Modbus write error: {e}")
             return -1
 
-    return 1
+        self.link.report(True)
+        return 1
+
+    def read_photo_eye(self, priority=PRIORITY_STATUS):
+        if self.plc is None:
+            return None
+
+        try:
+            return self.io.call("photo_eye", priority, self._read_photo_eye, timeout=PLC_IO_TIMEOUT)
+        except Exception:
+            pass
+
+        return 0
+
+    def _read_photo_eye(self):
+        if self.plc is None:
+            return None
 
-def read_photo_eye():
-    if plc is None:
-        return None
-    
-    try:
-        with modbus_lock:
-            result = plc.read_coils(1, count=1)
+        try:
+            result = self.plc.read_coils(1, count=1)
+            self.link.report(True)
             if result and not result.isError():
-                return result.bits[0] if result.bits else 0 
+                return result.bits[0] if result.bits else 0
             else:
-                print(f"Photo eye blocked")
+                logger.debug(f"Photo eye blocked")
                 return None
-    except Exception:
-        pass
-    
-    return 0
+        except Exception:
+            self.link.report(False)
 
-def connect_photo_eye_signal(callback):
-    with _photo_eye_callbacks_lock:
-        if callback not in _photo_eye_callbacks:
-            _photo_eye_callbacks.append(callback)
-            print(f"✅ Registered photo eye callback: {callback.__name__}", flush=True)
+        return 0
 
-def disconnect_photo_eye_signal(callback):
-    with _photo_eye_callbacks_lock:
-        if callback in _photo_eye_callbacks:
-            _photo_eye_callbacks.remove(callback)
-
-def _photo_eye_monitor_loop():
-    global _photo_eye_last_value, _photo_eye_monitor_running
-    _photo_eye_last_value = 0
-    
-    positionId = 0
-    
-    while _photo_eye_monitor_running:
-        try:
-            current_value = read_photo_eye()
+    def _count_photo_eye(self, key, amount=1):
+        with self._photo_eye_stats_lock:
+            self._photo_eye_stats[key] += amount
 
-            if _photo_eye_last_value == 0 and current_value == 1:
-                with _photo_eye_callbacks_lock:
-                    callbacks = _photo_eye_callbacks.copy()
-                
+    def _read_position_id(self):
+        positionId = 0
+        if self.plc is not None:
+            try:
+                result = self.plc.read_input_registers(POSITION_ID_ADDRESS, count=1)
+                if result and not result.isError() and result.registers:
+                    positionId = result.registers[0]
+                else:
+                    logger.error(f"❌ Error reading position ID from 0x{POSITION_ID_ADDRESS:04X}")
+                    self._count_photo_eye("position_read_failures")
+                    positionId = 0
+            except Exception as e:
+                self.link.report(False)
+                logger.error(f"❌ Exception reading position ID: {e}")
+                self._count_photo_eye("position_read_failures")
                 positionId = 0
-                with modbus_lock:
-                    if plc is not None:
-                        try:
-                            result = plc.read_input_registers(0x0015, count=1)
-                            if result and not result.isError() and result.registers:
-                                positionId = result.registers[0]
-                            else:
-                                print(f"❌ Error reading position ID from 0x0015")
-                                positionId = 0
-                        except Exception as e:
-                            print(f"❌ Exception reading position ID: {e}")
-                            positionId = 0
-                
-                for callback in callbacks:
-                    try:
-                        threading.Thread(target=callback, args=(positionId,), daemon=True).start()
-                    except:
-                        pass
-            
-            _photo_eye_last_value = current_value
-            
-            time.sleep(0.01)
-        except:
-            time.sleep(0.1)
+        return positionId
+
+    def _read_photo_eye_block(self):
+        if self.plc is None:
+            return None, None
+        try:
+            result = self.plc.read_input_registers(PHOTO_EYE_BLOCK_ADDRESS, count=PHOTO_EYE_BLOCK_COUNT)
+            self.link.report(True)
+            if result and not result.isError() and len(result.registers) >= PHOTO_EYE_BLOCK_COUNT:
+                state = (result.registers[PHOTO_EYE_STATE_OFFSET] >> PHOTO_EYE_STATE_BIT) & 1
+                return state, result.registers[PHOTO_EYE_POSITION_OFFSET]
+        except Exception:
+            self.link.report(False)
+        return None, None
+
+    def _sample_photo_eye(self, last_value):
+        # Runs on the I/O thread, so in coil mode the position read follows the
+        # edge with no other command interleaved between the two transactions.
+        if PHOTO_EYE_SAMPLE_MODE == 'block':
+            current_value, positionId = self._read_photo_eye_block()
+            if current_value is None:
+                self._count_photo_eye("sample_errors")
+                return None, None
+            if last_value == 0 and current_value == 1:
+                return current_value, positionId
+            return current_value, None
+
+        current_value = self._read_photo_eye()
+        if current_value is None:
+            self._count_photo_eye("sample_errors")
+        if last_value == 0 and current_value == 1:
+            return current_value, self._read_position_id()
+        return current_value, None
+
+    def expect_photo_eye_edge(self, window=PHOTO_EYE_ACTIVE_WINDOW):
+        # Called when an item is scanned so the monitor polls at the fast rate
+        # while that item is on its way to the eye.
+        self._photo_eye_active_until = max(self._photo_eye_active_until, time.monotonic() + window)
+
+    def _deliver_photo_eye_edge(self, callbacks, positionId, edge_time):
+        latency = time.monotonic() - edge_time
+        with self._photo_eye_stats_lock:
+            self._photo_eye_stats["latency_count"] += 1
+            self._photo_eye_stats["latency_total"] += latency
+            self._photo_eye_stats["latency_last"] = latency
+            if latency > self._photo_eye_stats["latency_max"]:
+                self._photo_eye_stats["latency_max"] = latency
+        for callback in callbacks:
+            try:
+                callback(positionId)
+            except Exception as e:
+                logger.error(f"❌ Photo eye callback {callback.__name__} failed: {e}")
+
+    def photo_eye_stats(self):
+        with self._photo_eye_stats_lock:
+            stats = dict(self._photo_eye_stats)
+        count = stats["latency_count"]
+        return {
+            "mode": PHOTO_EYE_SAMPLE_MODE,
+            "samples": stats["samples"],
+            "sample_errors": stats["sample_errors"],
+            "edges_detected": stats["edges_detected"],
+            "position_read_failures": stats["position_read_failures"],
+            "edge_to_callback_ms": {
+                "count": count,
+                "avg": (stats["latency_total"] / count * 1000) if count else 0.0,
+                "max": stats["latency_max"] * 1000,
+                "last": stats["latency_last"] * 1000,
+            },
+        }
+
+    def health(self):
+        # Built only from what the photo-eye monitor already observed; never
+        # issues a Modbus transaction, so dashboards can call it freely.
+        with self._photo_eye_stats_lock:
+            last_ok_at = self._photo_eye_stats["last_ok_at"]
+            last_error_at = self._photo_eye_stats["last_error_at"]
+            last_value = self._photo_eye_stats["last_value"]
+        now = time.monotonic()
+        sample_age = (now - last_ok_at) if last_ok_at is not None else None
+        connected = (self.link.connected and sample_age is not None and sample_age <= PLC_HEALTH_STALE
+                     and (last_error_at is None or last_error_at <= last_ok_at))
+        return {
+            "connected": connected,
+            "photo_eye": last_value if connected else None,
+            "sample_age": sample_age,
+        }
+
+    def connect_photo_eye_signal(self, callback):
+        with self._photo_eye_callbacks_lock:
+            if callback not in self._photo_eye_callbacks:
+                self._photo_eye_callbacks.append(callback)
+                logger.info(f"✅ Registered photo eye callback on {self.name}: {callback.__name__}")
+
+    def disconnect_photo_eye_signal(self, callback):
+        with self._photo_eye_callbacks_lock:
+            if callback in self._photo_eye_callbacks:
+                self._photo_eye_callbacks.remove(callback)
+
+    def _photo_eye_monitor_loop(self):
+        self._photo_eye_last_value = 0
+        interval = PHOTO_EYE_POLL_MIN
+
+        while self._photo_eye_monitor_running:
+            try:
+                if not self.link.connected:
+                    # Sampling a dead link would make pymodbus reconnect inline on the I/O thread.
+                    time.sleep(PHOTO_EYE_POLL_MAX)
+                    continue
+                sampled_at = time.monotonic()
+                current_value, positionId = self.io.call(
+                    "edge", PRIORITY_EDGE, self._sample_photo_eye, self._photo_eye_last_value, timeout=PLC_IO_TIMEOUT
+                )
+                now = time.monotonic()
+                with self._photo_eye_stats_lock:
+                    self._photo_eye_stats["samples"] += 1
+                    if current_value is None:
+                        self._photo_eye_stats["last_error_at"] = now
+                    else:
+                        self._photo_eye_stats["last_ok_at"] = now
+                    self._photo_eye_stats["last_value"] = current_value
+
+                if positionId is not None:
+                    self._count_photo_eye("edges_detected")
+                    with self._photo_eye_callbacks_lock:
+                        callbacks = self._photo_eye_callbacks.copy()
+
+                    dispatch(self.dispatch_source, self._deliver_photo_eye_edge, callbacks, positionId, sampled_at)
+
+                if current_value != self._photo_eye_last_value:
+                    self.expect_photo_eye_edge()
+                self._photo_eye_last_value = current_value
+
+                # Poll fast while items are expected or the beam is blocked, back
+                # off towards PHOTO_EYE_POLL_MAX while the belt is idle.
+                if now < self._photo_eye_active_until or current_value == 1:
+                    interval = PHOTO_EYE_POLL_MIN
+                else:
+                    interval = min(PHOTO_EYE_POLL_MAX, interval * 1.5)
+                time.sleep(interval)
+            except:
+                time.sleep(0.1)
+
+    def start_photo_eye_monitor(self):
+        if self._photo_eye_monitor_thread is None or not self._photo_eye_monitor_thread.is_alive():
+            self._photo_eye_monitor_running = True
+            self._photo_eye_monitor_thread = threading.Thread(
+                target=self._photo_eye_monitor_loop, daemon=True, name=f"{self.name}-PhotoEye"
+            )
+            self._photo_eye_monitor_thread.start()
+
+    def stop_photo_eye_monitor(self):
+        self._photo_eye_monitor_running = False
+
+    def io_stats(self):
+        return self.io.stats()
+
+    def link_stats(self):
+        return self.link.stats()
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def get_plc_connection(host=None, port=None, unit_id=None, routing=None, name=None, dispatch_source="photo_eye"):
+    """The connection for one PLC endpoint, created on first use.
+
+    Called without arguments it returns the default connection configured by
+    PLC_IP / PLC_PORT / MODBUS_UNIT_ID.
+    """
+    key = (host or PLC_IP, port or PLC_PORT, unit_id if unit_id is not None else UNIT_ID)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            connection = PlcConnection(*key, routing=routing, name=name or "PLC", dispatch_source=dispatch_source)
+            _connections[key] = connection
+        return connection
+
+def get_plc_connections():
+    with _connections_lock:
+        return list(_connections.values())
+
+@atexit.register
+def cleanup_modbus():
+    for connection in get_plc_connections():
+        connection.close()
+
+# Module-level API for the default connection.
+_default = get_plc_connection()
+_default.start_photo_eye_monitor()
+_photo_eye_callbacks = _default._photo_eye_callbacks
+
+def connect_plc():
+    return _default.connect()
+
+def is_plc_connected():
+    return _default.connected
+
+def reset_plc():
+    _default.reset()
+
+def write_settings(settings=None):
+    return _default.write_settings(settings)
+
+def write_bucket(value, pusher):
+    return _default.write_bucket(value, pusher)
+
+def read_photo_eye(priority=PRIORITY_STATUS):
+    return _default.read_photo_eye(priority)
+
+def expect_photo_eye_edge(window=PHOTO_EYE_ACTIVE_WINDOW):
+    _default.expect_photo_eye_edge(window)
+
+def get_photo_eye_stats():
+    return _default.photo_eye_stats()
+
+def get_plc_health():
+    return _default.health()
+
+def connect_photo_eye_signal(callback):
+    _default.connect_photo_eye_signal(callback)
+
+def disconnect_photo_eye_signal(callback):
+    _default.disconnect_photo_eye_signal(callback)
 
 def start_photo_eye_monitor():
-    global _photo_eye_monitor_thread, _photo_eye_monitor_running
-    
-    if _photo_eye_monitor_thread is None or not _photo_eye_monitor_thread.is_alive():
-        _photo_eye_monitor_running = True
-        _photo_eye_monitor_thread = threading.Thread(target=_photo_eye_monitor_loop, daemon=True)
-        _photo_eye_monitor_thread.start()
+    _default.start_photo_eye_monitor()
 
 def stop_photo_eye_monitor():
-    global _photo_eye_monitor_running
-    _photo_eye_monitor_running = False
+    _default.stop_photo_eye_monitor()
 
-start_photo_eye_monitor()
+def get_io_stats():
+    return _default.io_stats()
 
+def get_link_stats():
+    return _default.link_stats()
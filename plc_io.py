@@ -0,0 +1,116 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_EDGE = 0
+PRIORITY_BUCKET = 1
+PRIORITY_CONNECT = 2
+PRIORITY_STATUS = 5
+PRIORITY_SETTINGS = 9
+
+class PlcIoScheduler:
+    """Single thread that performs every Modbus transaction.
+
+    Commands are served lowest priority value first, FIFO within a priority,
+    so photo-eye sampling and bucket writes never wait behind status probes or
+    settings writes. Per-command queue wait and execution times are recorded.
+    """
+
+    def __init__(self, name: str = "PLC-IO"):
+        self.name = name
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._stats: Dict[str, dict] = {}
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put((float("inf"), next(self._seq), None, None, None, None, 0.0))
+        if self._thread is not None and not self.in_io_thread():
+            self._thread.join(timeout=timeout)
+
+    def in_io_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, name: str, priority: int, fn: Callable, *args) -> Future:
+        future: Future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError(f"{self.name} is not running"))
+            return future
+        self._queue.put((priority, next(self._seq), name, fn, args, future, time.monotonic()))
+        return future
+
+    def call(self, name: str, priority: int, fn: Callable, *args, timeout: Optional[float] = None):
+        # Commands issued from the I/O thread itself run inline; queueing them would deadlock.
+        if self.in_io_thread():
+            return fn(*args)
+        return self.submit(name, priority, fn, *args).result(timeout=timeout)
+
+    def _run(self):
+        while self._running:
+            priority, _, name, fn, args, future, queued_at = self._queue.get()
+            if fn is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started = time.monotonic()
+            failed = False
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                failed = True
+                future.set_exception(e)
+            finished = time.monotonic()
+            self._record(name, started - queued_at, finished - started, failed)
+
+    def _record(self, name: str, waited: float, elapsed: float, failed: bool):
+        with self._stats_lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = {"count": 0, "errors": 0, "wait_total": 0.0, "wait_max": 0.0,
+                         "exec_total": 0.0, "exec_max": 0.0, "last_exec": 0.0}
+                self._stats[name] = stats
+            stats["count"] += 1
+            if failed:
+                stats["errors"] += 1
+            stats["wait_total"] += waited
+            stats["exec_total"] += elapsed
+            stats["last_exec"] = elapsed
+            if waited > stats["wait_max"]:
+                stats["wait_max"] = waited
+            if elapsed > stats["exec_max"]:
+                stats["exec_max"] = elapsed
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            commands = {
+                name: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "avg_wait_ms": stats["wait_total"] / stats["count"] * 1000,
+                    "max_wait_ms": stats["wait_max"] * 1000,
+                    "avg_exec_ms": stats["exec_total"] / stats["count"] * 1000,
+                    "max_exec_ms": stats["exec_max"] * 1000,
+                    "last_exec_ms": stats["last_exec"] * 1000,
+                }
+                for name, stats in self._stats.items()
+            }
+        return {"queue_depth": self._queue.qsize(), "commands": commands}
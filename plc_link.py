@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+import logging
+from typing import Callable, Optional
+
+from plc_io import PlcIoScheduler, PRIORITY_CONNECT, PRIORITY_STATUS
+
+logger = logging.getLogger(__name__)
+
+PLC_HEARTBEAT_INTERVAL = float(os.getenv('PLC_HEARTBEAT_INTERVAL', '1.0'))
+# Consecutive failed transactions (heartbeats or real traffic) before the link is declared down.
+PLC_MAX_FAILURES = int(os.getenv('PLC_MAX_FAILURES', '3'))
+PLC_RECONNECT_MIN = float(os.getenv('PLC_RECONNECT_MIN', '0.5'))
+PLC_RECONNECT_MAX = float(os.getenv('PLC_RECONNECT_MAX', '30.0'))
+
+class PlcLink:
+    """Owns the PLC connection state from a background thread.
+
+    While up, the link is probed with ``probe`` only after ``heartbeat``
+    seconds without a successful transaction, so a busy line costs no extra
+    round trips. After ``max_failures`` consecutive failures it is declared
+    down and ``connect`` is retried with exponential backoff. Hot-path callers
+    only read ``connected`` and ``report`` how their transactions went.
+    ``on_up`` runs after every successful connect, off the I/O thread, so
+    state the PLC may have lost can be written back.
+    """
+
+    def __init__(self, io: PlcIoScheduler, connect: Callable[[], bool], probe: Callable[[], bool],
+                 heartbeat: float = PLC_HEARTBEAT_INTERVAL, max_failures: int = PLC_MAX_FAILURES,
+                 backoff_min: float = PLC_RECONNECT_MIN, backoff_max: float = PLC_RECONNECT_MAX,
+                 io_timeout: Optional[float] = None, name: str = "PLC-Link",
+                 on_up: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.on_up = on_up
+        self.io = io
+        self.connect = connect
+        self.probe = probe
+        self.heartbeat = heartbeat
+        self.max_failures = max(1, max_failures)
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.io_timeout = io_timeout
+
+        self.connected = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._failures = 0
+        self._last_ok = 0.0
+        self._changed_at: Optional[float] = None
+        self._backoff = backoff_min
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"connects": 0, "connect_failures": 0, "disconnects": 0,
+                         "heartbeats": 0, "heartbeat_failures": 0, "transaction_failures": 0}
+
+    def report(self, ok: bool):
+        # Called from the PLC I/O thread after every real transaction; never blocks on I/O.
+        with self._lock:
+            if ok:
+                self._failures = 0
+                self._last_ok = time.monotonic()
+                return
+            if not self.connected:
+                return
+            self._failures += 1
+            self.counters["transaction_failures"] += 1
+            if self._failures < self.max_failures:
+                return
+            self._set_connected(False)
+        logger.error(f"❌ {self.name} down after {self.max_failures} failed transactions, reconnecting in the background")
+        self._wake.set()
+
+    def mark_down(self):
+        with self._lock:
+            if not self.connected:
+                return
+            self._set_connected(False)
+        self._wake.set()
+
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+        self._failures = 0
+        self._changed_at = time.monotonic()
+        if connected:
+            self._last_ok = self._changed_at
+            self.counters["connects"] += 1
+        else:
+            self.counters["disconnects"] += 1
+
+    def _io_call(self, name: str, priority: int, fn: Callable[[], bool]) -> bool:
+        try:
+            return bool(self.io.call(name, priority, fn, timeout=self.io_timeout))
+        except Exception:
+            return False
+
+    def connect_now(self) -> bool:
+        """One blocking connection attempt; the background thread takes over afterwards."""
+        if self.connected:
+            return True
+        if not self._io_call("connect", PRIORITY_CONNECT, self.connect):
+            with self._lock:
+                self.counters["connect_failures"] += 1
+            return False
+        with self._lock:
+            self._set_connected(True)
+            self._backoff = self.backoff_min
+        if self.on_up is not None:
+            try:
+                self.on_up()
+            except Exception as e:
+                logger.error(f"❌ {self.name} on_up callback failed: {e}", exc_info=True)
+        return True
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            self._wake.clear()
+            if self.connected:
+                idle = time.monotonic() - self._last_ok
+                if idle >= self.heartbeat:
+                    ok = self._io_call("heartbeat", PRIORITY_STATUS, self.probe)
+                    with self._lock:
+                        self.counters["heartbeats"] += 1
+                        if not ok:
+                            self.counters["heartbeat_failures"] += 1
+                    self.report(ok)
+                    idle = 0.0
+                self._wake.wait(max(0.05, self.heartbeat - idle))
+                continue
+
+            if self.connect_now():
+                logger.info(f"✅ {self.name} up")
+                continue
+            delay = self._backoff
+            self._backoff = min(self.backoff_max, self._backoff * 2)
+            logger.warning(f"⚠️ {self.name} connect failed, retrying in {delay:.1f}s")
+            # A stop() wakes this early; failure reports while down do not.
+            self._wake.wait(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connected": self.connected,
+                "consecutive_failures": self._failures,
+                "since_change": (time.monotonic() - self._changed_at) if self._changed_at is not None else None,
+                "backoff": self._backoff,
+                **self.counters,
+            }
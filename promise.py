@@ -1,279 +1,299 @@
 import asyncio
+import concurrent.futures
+import functools
 import logging
 import threading
 from enum import Enum
-from typing import Callable, Any, Coroutine, Optional
-from contextlib import suppress
+from typing import Callable, Any, Coroutine, Iterable, List, Optional
+
+from dispatcher import dispatch
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    handler.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+DEFAULT_TIMEOUT = 30.0
+
+_default_loop: Optional[asyncio.AbstractEventLoop] = None
+_default_loop_lock = threading.Lock()
 
 class PromiseState(Enum):
     PENDING = "pending"
     FULFILLED = "fulfilled"
     REJECTED = "rejected"
+    CANCELLED = "cancelled"
 
-class Promise:
-    def __init__(self, coro: Optional[Coroutine] = None, executor: Optional[Callable] = None, loop=None):
-        if coro is None and executor is None:
-            raise ValueError("Either coro or executor must be provided")
-        
-        self.coro = coro
-        self.executor = executor
-        self.state = PromiseState.PENDING
-        self.value: Any = None
-        self.reason: Optional[Exception] = None
-        self.callback: Optional[Callable[[Any], None]] = None
-        self.error_callback: Optional[Callable[[Exception], None]] = None
-        self.loop = loop
-        self.task = None
-        self.thread = None
-        self._started = False
-        
-        if executor:
-            self._execute_executor()
-        elif coro:
-            pass
-    
-    def then(self, callback: Optional[Callable] = None, error_callback: Optional[Callable] = None):
-        if callback:
-            self.callback = callback
-        if error_callback:
-            self.error_callback = error_callback
-        
-        if not self._started and self.coro:
-            self._start()
-        elif self.state == PromiseState.FULFILLED and self.callback is not None:
-            try:
-                self.callback(self.value)
-            except Exception as e:
-                logger.error(f"❌ Callback error in then: {e}", exc_info=True)
-        elif self.state == PromiseState.REJECTED and self.error_callback is not None and self.reason is not None:
+class PromiseTimeoutError(TimeoutError):
+    pass
+
+class PromiseDispatchError(RuntimeError):
+    """A settled promise's callbacks could not be queued on the dispatch pool."""
+
+class AggregateError(Exception):
+    """Raised by ``Promise.any`` when every input was rejected."""
+
+    def __init__(self, message: str, errors: List[BaseException]):
+        super().__init__(message)
+        self.errors = errors
+
+def set_default_loop(loop: asyncio.AbstractEventLoop):
+    # Coroutine promises created without an explicit loop run here.
+    global _default_loop
+    with _default_loop_lock:
+        _default_loop = loop
+
+def _run_event_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+def get_default_loop() -> asyncio.AbstractEventLoop:
+    global _default_loop
+    with _default_loop_lock:
+        if _default_loop is None or _default_loop.is_closed():
+            _default_loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_event_loop, args=(_default_loop,), daemon=True, name="Promise-Loop").start()
+        return _default_loop
+
+class Promise(concurrent.futures.Future):
+    """A ``concurrent.futures.Future`` with promise-style chaining.
+
+    A coroutine runs on a shared event loop (``loop`` or the default loop),
+    bounded by its own ``timeout``. ``then``/``catch`` return new promises
+    and any number of them may be attached; their callbacks are handed to the
+    dispatch pool so blocking consumers (Modbus writes) never stall the loop.
+    Promises can be cancelled, waited on with ``result()`` or awaited from
+    any event loop. ``source`` is the dispatch source the callbacks run on;
+    chained promises inherit it.
+    """
+
+    def __init__(self, coro: Optional[Coroutine] = None, executor: Optional[Callable] = None, loop=None,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT, source: str = "promise"):
+        super().__init__()
+        self.timeout = timeout
+        self.source = source
+        self._inner: Optional[concurrent.futures.Future] = None
+
+        if coro is not None:
+            self._start(coro, loop or get_default_loop())
+        elif executor is not None:
             try:
-                self.error_callback(self.reason)
+                executor(self._fulfil, self._reject)
             except Exception as e:
-                logger.error(f"❌ Error callback error in then: {e}", exc_info=True)
-        
-        return self
-    
-    def catch(self, error_callback: Callable):
-        self.error_callback = error_callback
-        
-        if not self._started and self.coro:
-            self._start()
-        elif self.state == PromiseState.REJECTED and self.reason is not None:
-            if self.error_callback is not None:
-                try:
-                    self.error_callback(self.reason)
-                except Exception as e:
-                    logger.error(f"❌ Error callback error in catch: {e}", exc_info=True)
-        
-        return self
-    
-    def _execute_executor(self):
-        if self.executor:
-            def resolve(value):
-                if self.state == PromiseState.PENDING:
-                    self.state = PromiseState.FULFILLED
-                    self.value = value
-                    if self.callback is not None:
-                        try:
-                            self.callback(value)
-                        except Exception as e:
-                            logger.error(f"❌ Callback error: {e}", exc_info=True)
-            
-            def reject(reason):
-                if self.state == PromiseState.PENDING:
-                    self.state = PromiseState.REJECTED
-                    self.reason = reason
-                    if self.error_callback is not None:
-                        try:
-                            self.error_callback(reason)
-                        except Exception as e:
-                            logger.error(f"❌ Error callback error: {e}", exc_info=True)
-            
+                self._reject(e)
+
+    def _start(self, coro: Coroutine, loop: asyncio.AbstractEventLoop):
+        timeout = self.timeout
+
+        async def run():
+            if timeout is None:
+                return await coro
+            return await asyncio.wait_for(coro, timeout=timeout)
+
+        self._inner = asyncio.run_coroutine_threadsafe(run(), loop)
+        self._inner.add_done_callback(self._settle_inner)
+
+    def _settle_inner(self, inner: concurrent.futures.Future):
+        if inner.cancelled():
+            self.cancel()
+            return
+        error = inner.exception()
+        if error is None:
+            self._fulfil(inner.result())
+        elif isinstance(error, asyncio.TimeoutError) and self.timeout is not None:
+            error_msg = f"Promise coroutine timed out after {self.timeout:.2f} seconds"
+            logger.error(f"⏱️ {error_msg}")
+            self._reject(PromiseTimeoutError(error_msg))
+        else:
+            logger.error(f"❌ Promise execution error: {error}", exc_info=error)
+            self._reject(error)
+
+    def _fulfil(self, value: Any):
+        try:
+            self.set_result(value)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _reject(self, reason: BaseException):
+        try:
+            self.set_exception(reason)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _adopt(self, value: Any):
+        # Settles like `value` if it is itself a promise, future or coroutine.
+        if isinstance(value, Coroutine):
+            value = Promise(value)
+        if isinstance(value, concurrent.futures.Future):
+            value.add_done_callback(self._copy_from)
+        else:
+            self._fulfil(value)
+
+    def _copy_from(self, source: concurrent.futures.Future):
+        if source.cancelled():
+            self.cancel()
+        elif source.exception() is not None:
+            self._reject(source.exception())
+        else:
+            self._fulfil(source.result())
+
+    def cancel(self) -> bool:
+        if not super().cancel():
+            return False
+        if self._inner is not None:
+            self._inner.cancel()
+        return True
+
+    @property
+    def state(self) -> PromiseState:
+        if not self.done():
+            return PromiseState.PENDING
+        if self.cancelled():
+            return PromiseState.CANCELLED
+        return PromiseState.REJECTED if self.exception() is not None else PromiseState.FULFILLED
+
+    @property
+    def value(self) -> Any:
+        return self.result() if self.state == PromiseState.FULFILLED else None
+
+    @property
+    def reason(self) -> Optional[BaseException]:
+        if self.state == PromiseState.CANCELLED:
+            return concurrent.futures.CancelledError()
+        return self.exception() if self.state == PromiseState.REJECTED else None
+
+    def then(self, callback: Optional[Callable] = None, error_callback: Optional[Callable] = None) -> 'Promise':
+        child = Promise(source=self.source)
+
+        def settle(source):
+            if source.cancelled():
+                child.cancel()
+                return
+            error = source.exception()
             try:
-                self.executor(resolve, reject)
+                if error is None:
+                    result = callback(source.result()) if callback is not None else source.result()
+                elif error_callback is not None:
+                    result = error_callback(error)
+                else:
+                    child._reject(error)
+                    return
             except Exception as e:
-                reject(e)
-    
+                logger.error(f"❌ Callback error: {e}", exc_info=True)
+                child._reject(e)
+                return
+            child._adopt(result)
+
+        def schedule(done):
+            # Usually runs on the event loop that settled this promise, so it
+            # must not wait for room; a dropped settle rejects the child.
+            if not dispatch(self.source, settle, done, block=False):
+                child._reject(PromiseDispatchError("Promise callback dropped: dispatch queue is full"))
+
+        self.add_done_callback(schedule)
+        return child
+
+    def catch(self, error_callback: Callable) -> 'Promise':
+        return self.then(None, error_callback)
+
+    def with_timeout(self, timeout: float, loop=None) -> 'Promise':
+        """A promise that settles like this one, or is rejected after ``timeout`` seconds."""
+        child = Promise()
+        child._adopt(self)
+        loop = loop or get_default_loop()
+
+        def expire():
+            child._reject(PromiseTimeoutError(f"Promise timed out after {timeout:.2f} seconds"))
+
+        def arm():
+            handle = loop.call_later(timeout, expire)
+            child.add_done_callback(lambda _: loop.call_soon_threadsafe(handle.cancel))
+
+        loop.call_soon_threadsafe(arm)
+        return child
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
     @staticmethod
-    def from_coroutine(coro: Coroutine) -> 'Promise':
+    def from_coroutine(coro: Coroutine, loop=None, timeout: Optional[float] = DEFAULT_TIMEOUT) -> 'Promise':
         """Create a Promise from a coroutine"""
-        def executor(resolve, reject):
-            loop = None
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                async def run_coro():
-                    try:
-                        result = await coro
-                        resolve(result)
-                    except Exception as e:
-                        reject(e)
-                
-                loop.run_until_complete(run_coro())
-            finally:
-                if loop is not None:
-                    try:
-                        if not loop.is_closed():
-                            try:
-                                loop.run_until_complete(loop.shutdown_asyncgens())
-                            except:
-                                pass
-                            try:
-                                loop.close()
-                            except:
-                                pass
-                    except:
-                        pass
-                try:
-                    asyncio.set_event_loop(None)
-                except:
-                    pass
-        
-        promise = Promise(executor=executor)
-        return promise
-    
+        return Promise(coro, loop=loop, timeout=timeout)
+
     @staticmethod
     def resolve(value: Any) -> 'Promise':
         """Create a resolved Promise"""
-        promise = Promise(executor=lambda resolve, reject: resolve(value))
+        if isinstance(value, Promise):
+            return value
+        promise = Promise()
+        promise._adopt(value)
         return promise
-    
+
     @staticmethod
-    def reject(reason: Exception) -> 'Promise':
+    def reject(reason: BaseException) -> 'Promise':
         """Create a rejected Promise"""
-        promise = Promise(executor=lambda resolve, reject: reject(reason))
+        promise = Promise()
+        promise._reject(reason)
         return promise
-    
-    def _start(self):
-        if self._started:
-            logger.warning("⚠️ Promise already started, ignoring duplicate start")
-            return
-        
-        self._started = True
-        logger.info(f"🚀 Starting Promise execution in new thread...")
-        
-        def run_in_thread():
-            loop = None
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                logger.info(f"🔄 Promise thread started, executing coroutine...")
-                
-                result = None
-                try:
-                    result = loop.run_until_complete(
-                        asyncio.wait_for(self.coro, timeout=30.0)
-                    )
-                    result_type = type(result).__name__
-                    result_repr = "None" if result is None else f"{result_type}({bool(result)})"
-                    logger.info(f"✅ Coroutine completed successfully, result type: {result_repr}")
-                    
-                    self.state = PromiseState.FULFILLED
-                    self.value = result
-                    
-                    if self.callback is not None:
-                        try:
-                            logger.info(f"📞 Executing success callback with result (type: {result_type})...")
-                            self.callback(result)
-                            logger.info(f"✅ Success callback completed")
-                        except Exception as callback_error:
-                            logger.error(f"❌ Callback error: {callback_error}", exc_info=True)
-                            if self.error_callback is not None:
-                                try:
-                                    self.error_callback(callback_error)
-                                except:
-                                    pass
-                    else:
-                        logger.warning(f"⚠️ Coroutine returned result but no success callback registered")
-                except asyncio.TimeoutError:
-                    error_msg = "Promise coroutine timed out after 30 seconds"
-                    logger.error(f"⏱️ {error_msg}")
-                    timeout_error = Exception(error_msg)
-                    self.state = PromiseState.REJECTED
-                    self.reason = timeout_error
-                    if self.error_callback is not None:
-                        try:
-                            self.error_callback(timeout_error)
-                        except Exception as e:
-                            logger.error(f"❌ Error callback error: {e}", exc_info=True)
-                    else:
-                        logger.warning(f"⚠️ Timeout occurred but no error callback registered")
-                except Exception as e:
-                    logger.error(f"❌ Promise execution error: {e}", exc_info=True)
-                    self.state = PromiseState.REJECTED
-                    self.reason = e
-                    if self.error_callback is not None:
-                        try:
-                            self.error_callback(e)
-                        except Exception as callback_error:
-                            logger.error(f"❌ Error callback error: {callback_error}", exc_info=True)
-                    else:
-                        logger.warning(f"⚠️ Exception occurred but no error callback registered: {e}")
-            except Exception as e:
-                logger.error(f"❌ Fatal error in Promise thread: {e}", exc_info=True)
-                if self.error_callback is not None:
-                    try:
-                        self.error_callback(e)
-                    except:
-                        pass
-            finally:
-                if loop is not None:
-                    try:
-                        if not loop.is_closed():
-                            try:
-                                pending = asyncio.all_tasks(loop)
-                                if pending:
-                                    for task in pending:
-                                        task.cancel()
-                                    try:
-                                        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
-                                    except Exception:
-                                        pass
-                            except (RuntimeError, ValueError):
-                                pass
-                            
-                            try:
-                                loop.run_until_complete(loop.shutdown_asyncgens())
-                            except (RuntimeError, ValueError, Exception):
-                                pass
-                            
-                            try:
-                                loop.run_until_complete(loop.shutdown_default_executor())
-                            except (RuntimeError, ValueError, Exception):
-                                pass
-                            
-                            try:
-                                loop.close()
-                            except Exception:
-                                pass
-                    except Exception as cleanup_error:
-                        logger.debug(f"Cleanup error (ignored): {cleanup_error}")
-                
-                try:
-                    asyncio.set_event_loop(None)
-                except:
-                    pass
-                
-                try:
-                    import gc
-                    gc.collect()
-                except:
-                    pass
-                
-                logger.info(f"🔄 Promise thread finished")
-        
-        self.thread = threading.Thread(target=run_in_thread, daemon=True, name=f"Promise-{id(self)}")
-        self.thread.start()
-        logger.info(f"✅ Promise thread started: {self.thread.name}")
+
+    @staticmethod
+    def all(items: Iterable[Any]) -> 'Promise':
+        """Fulfils with every result in order, or rejects with the first rejection."""
+        promises = [Promise.resolve(item) for item in items]
+        combined = Promise()
+        if not promises:
+            combined._fulfil([])
+            return combined
+        results: List[Any] = [None] * len(promises)
+        remaining = [len(promises)]
+        lock = threading.Lock()
+
+        def on_done(index, source):
+            if source.cancelled():
+                combined._reject(concurrent.futures.CancelledError())
+                return
+            if source.exception() is not None:
+                combined._reject(source.exception())
+                return
+            with lock:
+                results[index] = source.result()
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                combined._fulfil(results)
+
+        for index, promise in enumerate(promises):
+            promise.add_done_callback(functools.partial(on_done, index))
+        return combined
+
+    @staticmethod
+    def race(items: Iterable[Any]) -> 'Promise':
+        """Settles like whichever input settles first."""
+        combined = Promise()
+        for item in items:
+            Promise.resolve(item).add_done_callback(combined._copy_from)
+        return combined
+
+    @staticmethod
+    def any(items: Iterable[Any]) -> 'Promise':
+        """Fulfils with the first fulfilled input; rejects with AggregateError if all reject."""
+        promises = [Promise.resolve(item) for item in items]
+        combined = Promise()
+        if not promises:
+            combined._reject(AggregateError("No promises to wait for", []))
+            return combined
+        errors: List[Optional[BaseException]] = [None] * len(promises)
+        remaining = [len(promises)]
+        lock = threading.Lock()
+
+        def on_done(index, source):
+            if not source.cancelled() and source.exception() is None:
+                combined._fulfil(source.result())
+                return
+            with lock:
+                errors[index] = source.exception() if not source.cancelled() else concurrent.futures.CancelledError()
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                combined._reject(AggregateError("All promises were rejected", errors))
+
+        for index, promise in enumerate(promises):
+            promise.add_done_callback(functools.partial(on_done, index))
+        return combined
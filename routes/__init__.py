@@ -1,2 +1,11 @@
 # Routes package
 
+from flask import current_app, request
+
+def get_line():
+    # The line named by ?line=, the first line when none is given, None if unknown.
+    lines = current_app.extensions.get('lines') or {}
+    name = request.args.get('line')
+    if name is None:
+        return next(iter(lines.values()), None)
+    return lines.get(name)
@@ -0,0 +1,28 @@
+from flask import Blueprint, request, jsonify
+import time
+
+from routes import get_line
+
+items_bp = Blueprint('items', __name__)
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+@items_bp.route('/book-dict', methods=['GET'])
+def book_dict():
+    line = get_line()
+    if line is None:
+        return jsonify({"error": "Unknown line"}), 404
+
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    snapshot = request.args.get('snapshot', '').lower() in ('1', 'true')
+    changes = line.item_store.changes(since, limit, request.args.get('epoch'), snapshot)
+    changes["count"] = len(changes["items"])
+    changes["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return jsonify(changes)
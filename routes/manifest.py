@@ -0,0 +1,55 @@
+from flask import Blueprint, request, jsonify, current_app
+
+manifest_bp = Blueprint('manifest', __name__)
+
+@manifest_bp.route('/manifest', methods=['POST'])
+def upload_manifest():
+    from manifest import parse_manifest
+
+    manifest_jobs = current_app.extensions.get('manifest_jobs')
+    if manifest_jobs is None:
+        return jsonify({"error": "Manifest pre-resolution not available"}), 503
+
+    upload = request.files.get('file')
+    if upload is not None:
+        filename = upload.filename or ""
+        text = upload.read().decode('utf-8', errors='replace')
+    elif request.is_json:
+        filename = "manifest.json"
+        text = request.get_data(as_text=True)
+    else:
+        filename = ""
+        text = request.get_data(as_text=True)
+
+    try:
+        barcodes = parse_manifest(text, filename)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid manifest: {e}"}), 400
+
+    if not barcodes:
+        return jsonify({"error": "Manifest contains no barcodes"}), 400
+
+    try:
+        concurrency = int(request.args.get('concurrency', 0)) or None
+    except ValueError:
+        return jsonify({"error": "concurrency must be an integer"}), 400
+
+    job = manifest_jobs.start(barcodes, name=request.args.get('name', filename), concurrency=concurrency)
+    return jsonify(job), 202
+
+@manifest_bp.route('/manifest', methods=['GET'])
+def list_manifests():
+    manifest_jobs = current_app.extensions.get('manifest_jobs')
+    if manifest_jobs is None:
+        return jsonify({"error": "Manifest pre-resolution not available"}), 503
+    return jsonify({"jobs": manifest_jobs.list()})
+
+@manifest_bp.route('/manifest/<job_id>', methods=['GET'])
+def manifest_status(job_id):
+    manifest_jobs = current_app.extensions.get('manifest_jobs')
+    if manifest_jobs is None:
+        return jsonify({"error": "Manifest pre-resolution not available"}), 503
+    job = manifest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown manifest job"}), 404
+    return jsonify(job)
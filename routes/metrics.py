@@ -0,0 +1,38 @@
+import re
+
+from flask import Blueprint, Response, current_app, jsonify
+
+metrics_bp = Blueprint('metrics', __name__)
+
+def _collect_gauges():
+    from dispatcher import get_dispatch_stats
+    from palletiq_api import get_cache_stats, get_lookup_stats, get_breaker_stats
+    from log_setup import get_logging_stats
+
+    gauges = {
+        "dispatch": get_dispatch_stats(),
+        "palletiq_cache": get_cache_stats(),
+        "palletiq_lookups": get_lookup_stats(),
+        "palletiq_breaker": get_breaker_stats(),
+        "logging": get_logging_stats(),
+    }
+    lines = current_app.extensions.get('lines') or {}
+    for line in lines.values():
+        # A single line keeps the plain group names; several are told apart by prefix.
+        prefix = f"line_{re.sub(r'[^A-Za-z0-9_]', '_', line.name)}_" if len(lines) > 1 else ""
+        io_stats = line.plc.io_stats()
+        line_gauges = line.stats()
+        line_gauges["plc_io"] = {"queue_depth": io_stats["queue_depth"], **io_stats["commands"]}
+        for group, values in line_gauges.items():
+            gauges[prefix + group] = values
+    return gauges
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    from metrics import render_prometheus
+    return Response(render_prometheus(gauges=_collect_gauges()), mimetype='text/plain; version=0.0.4')
+
+@metrics_bp.route('/metrics.json', methods=['GET'])
+def metrics_summary():
+    from metrics import tracer
+    return jsonify({**tracer.summary(), **_collect_gauges()})
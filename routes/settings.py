@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify, render_template
 import json
 import os
 
+from routes import get_line
+
 settings_bp = Blueprint('settings', __name__)
 
 DISTANCE_LABELS = [
@@ -17,17 +19,16 @@ def settings_page():
 
 @settings_bp.route('/get-settings', methods=['GET'])
 def get_settings():
-    try:
-        with open("settings.json", "r") as f:
-            return jsonify(json.load(f))
-    except FileNotFoundError:
-        return jsonify({})
-    except json.JSONDecodeError:
-        return jsonify({})
+    line = get_line()
+    if line is None:
+        return jsonify({"error": "Unknown line"}), 404
+    return jsonify(line.routing.snapshot.settings)
 
 @settings_bp.route('/update-settings', methods=['POST'])
 def update_settings():
-    from plc import write_settings
+    line = get_line()
+    if line is None:
+        return jsonify({"error": "Unknown line"}), 404
     
     data = request.json or {}
     new_settings = data.get("settings")
@@ -36,10 +37,12 @@ def update_settings():
         return jsonify({"error": "Invalid input format"}), 400
     
     try:
-        with open("settings.json", "w") as f:
+        # Saved only once the PLC has the new distances, so the file, the
+        # routing table and the PLC never disagree.
+        if not line.plc.write_settings(new_settings):
+            return jsonify({"error": "The PLC did not accept the new pusher distances; settings were not applied"}), 503
+        with open(line.routing.settings_file, "w") as f:
             json.dump(new_settings, f, indent=2)
-        write_settings(new_settings)
         return jsonify({"message": "Settings updated successfully!"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-
@@ -0,0 +1,17 @@
+from flask import Blueprint, jsonify, current_app
+
+from routes import get_line
+
+status_bp = Blueprint('status', __name__)
+
+@status_bp.route('/api/system-status', methods=['GET'])
+def system_status():
+    line = get_line()
+    if line is None:
+        return jsonify({"error": "Unknown line"}), 404
+    return jsonify(line.status_sampler.snapshot())
+
+@status_bp.route('/api/lines', methods=['GET'])
+def list_lines():
+    lines = current_app.extensions.get('lines') or {}
+    return jsonify([line.describe() for line in lines.values()])
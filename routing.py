@@ -0,0 +1,121 @@
+import json
+import re
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_FILE = 'settings.json'
+
+FALLBACK_ROUTE = {
+    "pusher": 8,
+    "label": "Extra",
+    "distance": 0
+}
+
+class RoutingSnapshot:
+    """Immutable view of one settings version with precomputed lookups."""
+
+    __slots__ = ("version", "settings", "by_label", "by_pusher")
+
+    def __init__(self, version: int, settings: Dict[str, dict]):
+        self.version = version
+        self.settings = settings
+        self.by_label: Dict[str, dict] = {}
+        self.by_pusher: Dict[int, dict] = {}
+
+        for pusher, config in settings.items():
+            match = re.search(r'\d+', pusher)
+            if not match or not isinstance(config, dict):
+                continue
+            route = {
+                "pusher": int(match.group(0)),
+                "label": config.get('label'),
+                "distance": config.get('distance')
+            }
+            self.by_pusher.setdefault(route["pusher"], route)
+            if route["label"] is not None:
+                self.by_label.setdefault(route["label"], route)
+
+    def resolve(self, label: Optional[str]) -> dict:
+        route = self.by_label.get(label)
+        return dict(route if route is not None else FALLBACK_ROUTE)
+
+    def has_pusher(self, pusher: int) -> bool:
+        return pusher in self.by_pusher
+
+class RoutingTable:
+    """Holds the current RoutingSnapshot and swaps it atomically on change.
+
+    Readers grab ``snapshot`` once and use it without locking; subscribers are
+    called with the new snapshot after every swap.
+    """
+
+    def __init__(self, settings_file: str = SETTINGS_FILE):
+        self.settings_file = settings_file
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[RoutingSnapshot], None]] = []
+        self._snapshot = RoutingSnapshot(0, {})
+
+    @property
+    def snapshot(self) -> RoutingSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def load(self) -> RoutingSnapshot:
+        try:
+            with open(self.settings_file, "r") as f:
+                settings = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            settings = {}
+        except Exception:
+            settings = {}
+        return self.update(settings)
+
+    def update(self, settings: Dict[str, dict]) -> RoutingSnapshot:
+        with self._lock:
+            snapshot = RoutingSnapshot(self._snapshot.version + 1, dict(settings or {}))
+            self._snapshot = snapshot
+            subscribers = self._subscribers.copy()
+
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"❌ Routing subscriber {getattr(callback, '__name__', callback)} failed: {e}", exc_info=True)
+        return snapshot
+
+    def resolve(self, label: Optional[str]) -> dict:
+        return self._snapshot.resolve(label)
+
+    def subscribe(self, callback: Callable[[RoutingSnapshot], None]):
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[RoutingSnapshot], None]):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+routing_table = RoutingTable()
+routing_table.load()
+
+_tables: Dict[str, RoutingTable] = {SETTINGS_FILE: routing_table}
+_tables_lock = threading.Lock()
+
+def get_routing_table(settings_file: Optional[str] = None) -> RoutingTable:
+    """The table for ``settings_file`` (one per file, loaded on first use); the default table without one."""
+    if settings_file is None:
+        return routing_table
+    with _tables_lock:
+        table = _tables.get(settings_file)
+        if table is None:
+            table = RoutingTable(settings_file)
+            table.load()
+            _tables[settings_file] = table
+        return table
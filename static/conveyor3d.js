@@ -895,7 +895,8 @@ class ConveyorSystem3D {
     }
 
     loadSettings() {
-        fetch('/get-settings')
+        const line = new URLSearchParams(window.location.search).get('line');
+        fetch(line ? `/get-settings?line=${encodeURIComponent(line)}` : '/get-settings')
             .then(response => response.json())
             .then(settings => {
                 this.settings = settings;
@@ -962,7 +963,7 @@ class ConveyorSystem3D {
         
         this.animationId = requestAnimationFrame(() => this.animate());
         
-        // Move items continuously at belt speed (32.1 cm/s) based on start_time
+        // Move items toward the position the server last reported for them
         const itemsLength = this.items.length;
         for (let i = 0; i < itemsLength; i++) {
             const item = this.items[i];
@@ -973,12 +974,12 @@ class ConveyorSystem3D {
             // Skip items that are routed, but allow beingPushed items to continue animating
             if (item.userData.routed || item.userData.beingPushed) continue;
             
-            // Calculate current position - prefer stored positionCm, otherwise calculate from start_time
+            // Positions only come from the server tracker; until the first one
+            // arrives the item holds where it was placed (the browser clock is
+            // never compared with server timestamps)
             let currentPosition = null;
             if (item.userData.positionCm !== undefined && item.userData.positionCm !== null) {
                 currentPosition = item.userData.positionCm;
-            } else if (item.userData.start_time) {
-                currentPosition = this.calculatePositionFromStartTime(item.userData.start_time);
             }
             if (currentPosition !== null) {
                 // Calculate Z position from current position in cm
@@ -1120,16 +1121,6 @@ class ConveyorSystem3D {
         return {};
     }
 
-    calculatePositionFromStartTime(startTime) {
-        // Calculate current position from start_time using belt_speed=32.1 cm/s
-        // startTime is in seconds (Python time.time() format)
-        if (!startTime) return null;
-        const now = Date.now() / 1000; // Current time in seconds
-        const elapsed = now - startTime;
-        if (elapsed < 0) return 0; // Don't allow negative positions
-        return elapsed * this.beltSpeedCmPerSec; // Position in cm
-    }
-
     calculatePositionIdToCm() {
         // Calculate real position in cm for each position ID (101-150)
         // PositionId 101 = 0cm (start), PositionId 150 = end
@@ -1181,9 +1172,9 @@ class ConveyorSystem3D {
         
         // Listen for pusher activation events
         document.addEventListener('pusherActivate', (event) => {
-            const { barcode, pusher } = event.detail;
-            if (barcode) {
-                const item = this.itemsByBarcode[barcode];
+            const { id, barcode, pusher } = event.detail;
+            if (id || barcode) {
+                const item = this.itemsByBarcode[id || barcode];
                 if (item) {
                     item.userData.pusherActivated = true;
                 }
@@ -1192,10 +1183,11 @@ class ConveyorSystem3D {
     }
 
     updateItemsFromTracking(trackedItems) {
-        const trackedBarcodes = new Set(trackedItems.map(item => item.barcode));
+        // Keyed by item id so several copies of one barcode are tracked separately
+        const trackedBarcodes = new Set(trackedItems.map(item => String(item.id || item.barcode)));
         
         trackedItems.forEach(trackedItem => {
-            const barcode = trackedItem.barcode;
+            const barcode = String(trackedItem.id || trackedItem.barcode);
             trackedBarcodes.add(barcode);
             
             if (this.itemsByBarcode[barcode]) {
@@ -1224,8 +1216,6 @@ class ConveyorSystem3D {
                     let currentPositionCm = null;
                     if (trackedItem.positionCm !== undefined && trackedItem.positionCm !== null) {
                         currentPositionCm = typeof trackedItem.positionCm === 'string' ? parseFloat(trackedItem.positionCm) : trackedItem.positionCm;
-                    } else if (trackedItem.start_time && trackedItem.positionId) {
-                        currentPositionCm = this.calculatePositionFromStartTime(trackedItem.start_time);
                     }
                     
                     if (currentPositionCm !== null && currentPositionCm >= -5 && currentPositionCm <= 5) {
@@ -1235,15 +1225,11 @@ class ConveyorSystem3D {
                 }
                 
             } else {
-                // Create new item - use positionCm from backend if available, otherwise calculate from start_time
+                // Create new item - use positionCm from backend if available; without
+                // one yet it waits as pending before the photo eye
                 let currentPosition = null;
                 if (trackedItem.positionCm !== undefined && trackedItem.positionCm !== null) {
                     currentPosition = typeof trackedItem.positionCm === 'string' ? parseFloat(trackedItem.positionCm) : trackedItem.positionCm;
-                } else if (trackedItem.start_time) {
-                    currentPosition = this.calculatePositionFromStartTime(trackedItem.start_time);
-                }
-                if (currentPosition === null) {
-                    return;
                 }
                 
                 // Calculate Z position from current position in cm
@@ -1271,6 +1257,7 @@ class ConveyorSystem3D {
                 item.userData.positionCm = currentPosition;
                 
                 // Store reference
+                item.userData.itemKey = barcode;
                 this.itemsByBarcode[barcode] = item;
             }
         });
@@ -1448,8 +1435,8 @@ class ConveyorSystem3D {
         }
         
         // Remove from itemsByBarcode map
-        if (item.userData.barcode) {
-            delete this.itemsByBarcode[item.userData.barcode];
+        if (item.userData.itemKey || item.userData.barcode) {
+            delete this.itemsByBarcode[item.userData.itemKey || item.userData.barcode];
         }
         
     }
@@ -8,11 +8,8 @@ function updateActiveItemsTableFromFrontendItems() {
     updateActiveItemsTableFromData(data);
 }
 
-function calculateCurrentPosition(startTime, beltSpeed = 32.1) {
-    if (!startTime) return null;
-    const now = Date.now() / 1000;
-    const elapsed = now - startTime;
-    return elapsed * beltSpeed;
+function itemKey(item) {
+    return item.id !== undefined && item.id !== null ? String(item.id) : item.barcode;
 }
 
 function updateActiveItemsTableFromData(data) {
@@ -37,24 +34,24 @@ function updateActiveItemsTableFromData(data) {
 
     if (items && items.length > 0) {
         Array.from(tbody.children).forEach(row => {
-            if (!row.dataset.barcode) {
+            if (!row.dataset.itemKey) {
                 row.remove();
             }
         });
 
         const existingRows = {};
         Array.from(tbody.children).forEach(row => {
-            const barcode = row.dataset.barcode;
-            if (barcode) {
-                existingRows[barcode] = row;
+            const key = row.dataset.itemKey;
+            if (key) {
+                existingRows[key] = row;
             }
         });
 
-        const activeBarcodes = new Set(items.map(item => item.barcode));
+        const activeKeys = new Set(items.map(item => itemKey(item)));
 
-        Object.keys(existingRows).forEach(barcode => {
-            if (!activeBarcodes.has(barcode)) {
-                const row = existingRows[barcode];
+        Object.keys(existingRows).forEach(key => {
+            if (!activeKeys.has(key)) {
+                const row = existingRows[key];
                 row.style.transition = "opacity 0.3s ease-out";
                 row.style.opacity = "0";
                 setTimeout(() => {
@@ -62,7 +59,7 @@ function updateActiveItemsTableFromData(data) {
                         row.remove();
                     }
                 }, 300);
-                delete existingRows[barcode];
+                delete existingRows[key];
             }
         });
 
@@ -72,33 +69,28 @@ function updateActiveItemsTableFromData(data) {
                 if (!barcode) {
                     return;
                 }
+                const key = itemKey(item);
 
-                let row = existingRows[barcode];
+                let row = existingRows[key];
 
                 if (!row) {
                     row = document.createElement("tr");
-                    row.dataset.barcode = barcode;
+                    row.dataset.itemKey = key;
                     row.style.borderBottom = "1px solid var(--border)";
                     row.style.transition = "background 0.2s, opacity 0.3s";
                     row.onmouseenter = () => row.style.background = "rgba(58, 122, 254, 0.05)";
                     row.onmouseleave = () => row.style.background = "";
                     tbody.appendChild(row);
-                    existingRows[barcode] = row;
+                    existingRows[key] = row;
                 }
 
                 const timeStr = item.created_at || new Date().toLocaleTimeString();
 
-                let positionCm = "0.0 cm";
+                // Only server position frames set positionCm; until the first
+                // one arrives the row shows the item as pending.
+                let positionCm = "pending";
                 if (item.positionCm !== undefined && item.positionCm !== null) {
                     positionCm = parseFloat(item.positionCm).toFixed(1) + " cm";
-                } else if (item.start_time && item.status === "progress" && item.positionId) {
-                    const startTime = typeof item.start_time === 'string' ? parseFloat(item.start_time) : item.start_time;
-                    const currentTime = Date.now() / 1000;
-                    const elapsed = currentTime - startTime;
-                    if (elapsed >= 0) {
-                        const position = elapsed * BELT_SPEED;
-                        positionCm = position.toFixed(1) + " cm";
-                    }
                 }
 
                 const status = item.status || "pending";
@@ -163,29 +155,79 @@ function updateActiveItemsTableFromData(data) {
     }
 }
 
-async function updateActiveItemsTable() {
-    if (socket && socket.connected) {
+function noteItemsVersion(data) {
+    if (data && typeof data.version === 'number' && data.version > itemsVersion) {
+        itemsVersion = data.version;
+    }
+}
+
+function applyServerItem(itemData) {
+    const key = itemKey(itemData);
+    const existing = frontendItems.get(key);
+    if (existing && existing.version !== undefined && itemData.version !== undefined && existing.version > itemData.version) {
         return;
     }
+    frontendItems.set(key, {
+        ...(existing || {}),
+        id: itemData.id,
+        barcode: itemData.barcode,
+        start_time: itemData.start_time,
+        positionId: itemData.positionId,
+        positionCm: itemData.positionCm,
+        pusher: itemData.pusher,
+        label: itemData.label,
+        distance: itemData.distance,
+        status: itemData.status,
+        created_at: itemData.created_at,
+        version: itemData.version,
+        pusherActivated: existing ? existing.pusherActivated : false
+    });
+}
 
-    if (!socket) {
-        try {
-            socket = io();
-        } catch (error) {
-        }
+// Pulls whatever changed since the last version this page saw, page by page.
+// Called on every socket (re)connect so a flaky link only costs the delta.
+async function updateActiveItemsTable() {
+    if (itemsSyncInFlight) {
+        return;
     }
+    itemsSyncInFlight = true;
 
     try {
-        const response = await fetch("/book-dict");
-        const data = await response.json();
-        if (data.items) {
-            const items = Object.entries(data.items).map(([barcode, itemData]) => ({
-                barcode: barcode,
-                ...itemData
-            }));
-            updateActiveItemsTableFromData({ items: items, count: items.length, timestamp: data.timestamp });
+        let hasMore = true;
+        while (hasMore) {
+            let url = `/book-dict?since=${itemsVersion}`;
+            if (itemsEpoch) {
+                url += `&epoch=${encodeURIComponent(itemsEpoch)}`;
+            }
+            if (itemsSnapshot) {
+                url += '&snapshot=1';
+            }
+            const response = await fetch(withLine(url));
+            if (!response.ok) {
+                break;
+            }
+            const data = await response.json();
+            if (data.reset) {
+                frontendItems.clear();
+                itemsVersion = 0;
+            }
+            itemsEpoch = data.epoch || null;
+            itemsSnapshot = Boolean(data.snapshot);
+            Object.values(data.items || {}).forEach(applyServerItem);
+            (data.removed || []).forEach(id => frontendItems.delete(String(id)));
+            if (typeof data.cursor === 'number' && data.cursor > itemsVersion) {
+                itemsVersion = data.cursor;
+            }
+            hasMore = Boolean(data.has_more);
         }
+
+        updateActiveItemsTableFromFrontendItems();
+        document.dispatchEvent(new CustomEvent('activeItemsUpdated', {
+            detail: { items: Array.from(frontendItems.values()) }
+        }));
     } catch (error) {
+    } finally {
+        itemsSyncInFlight = false;
     }
 }
 
@@ -222,15 +264,56 @@ function updateSystemStatusFromData(status) {
             photoEyeStatus.style.background = "#666";
         }
     }
+
+    const palletiqStatus = document.getElementById("palletiq-status");
+    if (palletiqStatus && status.palletiq) {
+        const online = status.palletiq.breaker === "closed";
+        palletiqStatus.innerHTML = `<span style="display: inline-block; width: 8px; height: 8px; border-radius: 50%; background: #fff; margin-right: 6px; opacity: ${online ? 1 : 0.5};${online ? ' box-shadow: 0 0 6px rgba(255,255,255,0.8);' : ''}"></span>PalletIQ: ${status.palletiq.message}`;
+        palletiqStatus.style.background = online ? "#27ae60" : (status.palletiq.breaker === "half_open" ? "#f39c12" : "#e74c3c");
+    }
 }
 
 let socket = null;
+// The conveyor line this page follows (?line=name); the server's first line when absent.
+const LINE = new URLSearchParams(window.location.search).get('line');
 let frontendItems = new Map();
+let itemsVersion = 0;
+// Cursors are only valid within one server run (epoch); a reset is paged with snapshot=1.
+let itemsEpoch = null;
+let itemsSnapshot = false;
+let itemsSyncInFlight = false;
+const ITEM_FIELDS = ["positionId", "status", "start_time", "pusher", "label", "distance", "created_at", "version"];
 let positionUpdateIntervalId = null;
 const BELT_SPEED = 32.1;
 const MAX_DISTANCE = 972;
-const COMPLETION_OFFSET = 3.21;
 const UPDATE_INTERVAL = 100;
+// Never run more than this far ahead of the last server position frame.
+const MAX_EXTRAPOLATION = 1.0;
+
+// The server tracker owns positions and pusher arrival; between its frames
+// positions are advanced on the local clock only, so browser/server clock
+// skew never shows up on the belt.
+function applyPositionFrame(frame) {
+    const receivedAt = performance.now() / 1000;
+    (frame.ids || []).forEach((id, index) => {
+        const item = frontendItems.get(String(id));
+        if (item) {
+            item.serverPositionCm = frame.pos[index];
+            item.serverPositionAt = receivedAt;
+            item.positionCm = frame.pos[index];
+        }
+    });
+}
+
+function activatePusher(key, item) {
+    if (item.status !== "routing" || item.pusherActivated) {
+        return;
+    }
+    item.pusherActivated = true;
+    document.dispatchEvent(new CustomEvent('pusherActivate', {
+        detail: { id: key, barcode: item.barcode, pusher: item.pusher, distance: item.distance }
+    }));
+}
 
 function updateTablePositions() {
     const tbody = document.getElementById("active-items-tbody");
@@ -238,61 +321,22 @@ function updateTablePositions() {
         return;
     }
 
-    const currentTime = Date.now() / 1000;
-    const itemsToRemove = [];
+    const currentTime = performance.now() / 1000;
 
-    frontendItems.forEach((item, barcode) => {
-        if (item.status === "routing" || item.status === "completed") {
-            if (!item.start_time) {
-                item.start_time = currentTime;
-            }
-            const routingDuration = currentTime - item.start_time;
-            if (routingDuration >= 1.5) {
-                itemsToRemove.push(barcode);
-            }
+    frontendItems.forEach((item) => {
+        if (item.status !== "progress" || item.serverPositionCm === undefined) {
             return;
         }
-
-        if (item.status !== "progress" || !item.positionId || !item.start_time) {
-            return;
-        }
-
-        const startTime = typeof item.start_time === 'string' ? parseFloat(item.start_time) : item.start_time;
-        const elapsed = currentTime - startTime;
-
-        if (elapsed < 0) {
-            return;
-        }
-
-        item.positionCm = elapsed * BELT_SPEED;
-
-        const positionCm = item.positionCm;
-        const distance = item.distance !== undefined && item.distance !== null ? parseFloat(item.distance) : null;
-        const removalThreshold = distance !== null ? distance - COMPLETION_OFFSET : MAX_DISTANCE - COMPLETION_OFFSET;
-
-        if (distance !== null && positionCm >= distance - COMPLETION_OFFSET && !item.pusherActivated) {
-            item.pusherActivated = true;
-            item.status = "routing";
-            item.start_time = currentTime;
-            document.dispatchEvent(new CustomEvent('pusherActivate', {
-                detail: { barcode: barcode, pusher: item.pusher, distance: distance }
-            }));
-            updateActiveItemsTableFromFrontendItems();
-        } else if (positionCm >= removalThreshold) {
-            itemsToRemove.push(barcode);
-        }
-    });
-
-    itemsToRemove.forEach(barcode => {
-        frontendItems.delete(barcode);
+        const sinceFrame = Math.min(Math.max(currentTime - item.serverPositionAt, 0), MAX_EXTRAPOLATION);
+        item.positionCm = Math.min(item.serverPositionCm + sinceFrame * BELT_SPEED, MAX_DISTANCE);
     });
 
     const rows = Array.from(tbody.querySelectorAll("tr"));
     rows.forEach(row => {
-        const barcode = row.dataset.barcode;
-        if (!barcode) return;
+        const key = row.dataset.itemKey;
+        if (!key) return;
 
-        const item = frontendItems.get(barcode);
+        const item = frontendItems.get(key);
         if (!item) {
             row.style.transition = "opacity 0.3s ease-out";
             row.style.opacity = "0";
@@ -316,10 +360,6 @@ function updateTablePositions() {
         }
     });
 
-    if (itemsToRemove.length > 0) {
-        updateActiveItemsTableFromFrontendItems();
-    }
-
     document.dispatchEvent(new CustomEvent('activeItemsUpdated', {
         detail: { items: Array.from(frontendItems.values()) }
     }));
@@ -341,54 +381,40 @@ function stopPositionUpdateLoop() {
 
 document.addEventListener("DOMContentLoaded", () => {
     try {
-        socket = io();
+        socket = io({ query: LINE ? { line: LINE } : {} });
 
         if (socket) {
             socket.on('connect', () => {
+                updateActiveItemsTable();
             });
 
             socket.on('disconnect', () => {
             });
 
-            socket.on('add_book', (itemData) => {
+            // One frame per ~50 ms: new items in full, changed fields only for the rest.
+            socket.on('items_batch', (frame) => {
                 try {
-                    if (itemData && itemData.barcode) {
-                        const item = {
-                            barcode: itemData.barcode,
-                            start_time: itemData.start_time,
-                            positionId: itemData.positionId,
-                            positionCm: itemData.positionCm,
-                            pusher: itemData.pusher,
-                            label: itemData.label,
-                            distance: itemData.distance,
-                            status: itemData.status,
-                            created_at: itemData.created_at,
-                            pusherActivated: false
-                        };
-                        frontendItems.set(itemData.barcode, item);
-                        updateActiveItemsTableFromFrontendItems();
-                        document.dispatchEvent(new CustomEvent('activeItemsUpdated', {
-                            detail: { items: Array.from(frontendItems.values()) }
-                        }));
+                    if (!frame) {
+                        return;
                     }
-                } catch (error) {
-                }
-            });
-
-            socket.on('update_book', (data) => {
-                try {
-                    if (data && data.barcode) {
-                        let existingItem = frontendItems.get(data.barcode);
-                        if (existingItem) {
-                            existingItem.positionId = data.positionId;
-                            existingItem.status = data.status;
-                            existingItem.start_time = data.start_time;
-                            existingItem.pusher = data.pusher;
-                            existingItem.label = data.label;
-                            existingItem.distance = data.distance;
+                    (frame.added || []).forEach(applyServerItem);
+                    (frame.updated || []).forEach(changes => {
+                        const existingItem = frontendItems.get(itemKey(changes));
+                        if (!existingItem) {
+                            return;
                         }
-                        console.log(existingItem);
-                    }
+                        if (existingItem.version !== undefined && changes.version !== undefined && existingItem.version > changes.version) {
+                            return;
+                        }
+                        ITEM_FIELDS.forEach(field => {
+                            if (field in changes) {
+                                existingItem[field] = changes[field];
+                            }
+                        });
+                        activatePusher(itemKey(changes), existingItem);
+                    });
+                    (frame.removed || []).forEach(data => frontendItems.delete(itemKey(data)));
+                    noteItemsVersion(frame);
 
                     updateActiveItemsTableFromFrontendItems();
                     document.dispatchEvent(new CustomEvent('activeItemsUpdated', {
@@ -398,6 +424,16 @@ document.addEventListener("DOMContentLoaded", () => {
                 }
             });
 
+            socket.on('positions', (frame) => {
+                if (frame) {
+                    applyPositionFrame(frame);
+                }
+            });
+
+            socket.on('routing_updated', () => {
+                document.dispatchEvent(new CustomEvent('settingsUpdated'));
+            });
+
             socket.on('system_status', (status) => {
                 try {
                     updateSystemStatusFromData(status);
@@ -415,11 +451,42 @@ document.addEventListener("DOMContentLoaded", () => {
     }
 
     startPositionUpdateLoop();
+    loadLines();
 });
 
+function withLine(url) {
+    if (!LINE) return url;
+    return url + (url.includes('?') ? '&' : '?') + 'line=' + encodeURIComponent(LINE);
+}
+
+// The line picker only appears when the server runs more than one line.
+async function loadLines() {
+    const select = document.getElementById('line-select');
+    if (!select) return;
+    try {
+        const response = await fetch('/api/lines');
+        const lines = await response.json();
+        if (!Array.isArray(lines) || lines.length < 2) return;
+        lines.forEach((line, index) => {
+            const option = document.createElement('option');
+            option.value = line.name;
+            option.textContent = `Line ${line.name}`;
+            option.selected = LINE ? line.name === LINE : index === 0;
+            select.appendChild(option);
+        });
+        select.style.display = '';
+        select.addEventListener('change', () => {
+            const params = new URLSearchParams(window.location.search);
+            params.set('line', select.value);
+            window.location.search = params.toString();
+        });
+    } catch (error) {
+    }
+}
+
 async function loadInitialStatus() {
     try {
-        const response = await fetch('/api/system-status');
+        const response = await fetch(withLine('/api/system-status'));
         const status = await response.json();
         if (status) {
             updateSystemStatusFromData(status);
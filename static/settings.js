@@ -1,8 +1,15 @@
 document.addEventListener("DOMContentLoaded", function () {
     const form = document.getElementById("settingsForm");
+    // Settings belong to one conveyor line, chosen with ?line= like the dashboard.
+    const line = new URLSearchParams(window.location.search).get("line");
+    const lineQuery = line ? `?line=${encodeURIComponent(line)}` : "";
+    const backLink = document.querySelector('a[href="/"]');
+    if (backLink) {
+        backLink.href = "/" + lineQuery;
+    }
 
     // Load existing settings from server and update each pusher's inputs
-    fetch("/get-settings")
+    fetch("/get-settings" + lineQuery)
         .then(response => response.json())
         .then(settings => {
             // For each fieldset in the pusher settings
@@ -44,14 +51,14 @@ document.addEventListener("DOMContentLoaded", function () {
             }
         });
 
-        fetch("/update-settings", {
+        fetch("/update-settings" + lineQuery, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ settings: updatedSettings })
         })
         .then(response => response.json())
         .then(data => {
-            alert(data.message);
+            alert(data.message || data.error);
             // Trigger settings update event for 3D visualization
             document.dispatchEvent(new CustomEvent('settingsUpdated'));
         })
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_INTERVAL = float(os.getenv('STATUS_INTERVAL', '1.0'))
+
+class StatusSampler:
+    """Refreshes a system-status snapshot at a fixed rate and publishes changes.
+
+    ``collect`` must only read state the I/O paths already maintain; readers
+    get the cached snapshot and never trigger a sample themselves.
+    """
+
+    def __init__(self, collect: Callable[[], dict], publish: Optional[Callable[[dict], None]] = None,
+                 interval: float = STATUS_INTERVAL):
+        self.collect = collect
+        self.publish = publish
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._snapshot: Optional[dict] = None
+        self._updated_at: Optional[float] = None
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"samples": 0, "changes": 0, "errors": 0}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="StatusSampler")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def refresh(self) -> dict:
+        status = self.collect()
+        with self._lock:
+            self.counters["samples"] += 1
+            changed = status != self._snapshot
+            if changed:
+                self._snapshot = status
+                self.counters["changes"] += 1
+            self._updated_at = time.time()
+        if changed and self.publish is not None:
+            self.publish(status)
+        return status
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    def _run(self):
+        while self._running:
+            try:
+                self.refresh()
+            except Exception as e:
+                with self._lock:
+                    self.counters["errors"] += 1
+                logger.error(f"❌ System status sample failed: {e}", exc_info=True)
+            time.sleep(self.interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            age = (time.time() - self._updated_at) if self._updated_at is not None else None
+            return {"age": age, **self.counters}
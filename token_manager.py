@@ -0,0 +1,189 @@
+import asyncio
+import base64
+import json
+import math
+import time
+import logging
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+def decode_token_expiry(token: str) -> Optional[float]:
+    """Returns the ``exp`` claim (epoch seconds) of a JWT, or None for opaque tokens."""
+    parts = token.split(".") if token else []
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode()))
+        exp = claims.get("exp")
+        return float(exp) if exp is not None else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+class TokenManager:
+    """Owns the PalletIQ token on the shared event loop.
+
+    Concurrent refreshes (startup, 401s, the background refresher) share one
+    login; callers that hit a 401 wait on it instead of failing. Expiry comes
+    from the JWT ``exp`` claim, an ``expires_in``/``expires_at`` field in the
+    login response, or ``default_ttl``, and the token is renewed
+    ``refresh_margin`` seconds (at most half its lifetime) ahead of it, but
+    never sooner than ``min_refresh`` after the last login.
+    """
+
+    def __init__(self, login_url: Optional[str], email: Optional[str], password: Optional[str],
+                 session_factory: Callable[[], Awaitable[aiohttp.ClientSession]],
+                 refresh_margin: float = 60.0, default_ttl: float = 3600.0,
+                 retry_min: float = 2.0, retry_max: float = 60.0, min_refresh: float = 5.0):
+        self.login_url = login_url
+        self.email = email
+        self.password = password
+        self.session_factory = session_factory
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.min_refresh = min_refresh
+
+        self.token: Optional[str] = None
+        self.expires_at: Optional[float] = None
+        self.issued_at: Optional[float] = None
+        self._refreshing: Optional[asyncio.Future] = None
+        self._refresher: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.counters = {"logins": 0, "login_failures": 0, "coalesced": 0, "proactive": 0, "invalidated": 0}
+
+    def valid(self) -> bool:
+        return self.token is not None and (self.expires_at is None or time.time() < self.expires_at)
+
+    async def get_token(self) -> Optional[str]:
+        if self.valid():
+            return self.token
+        return await self.refresh()
+
+    async def invalidate(self, token: Optional[str]) -> Optional[str]:
+        # A 401 on `token`: if a newer token already replaced it, use that.
+        if token is not None and token != self.token and self.valid():
+            return self.token
+        self.counters["invalidated"] += 1
+        if token is not None and token == self.token:
+            self.token = None
+        return await self.refresh()
+
+    async def refresh(self) -> Optional[str]:
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._login())
+            self._refreshing.add_done_callback(self._clear_refreshing)
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(self._refreshing)
+
+    def _clear_refreshing(self, done):
+        if self._refreshing is done:
+            self._refreshing = None
+
+    async def _login(self) -> Optional[str]:
+        if not self.login_url:
+            return None
+        payload = {
+            "wl_team_id": 0,
+            "user_email": self.email,
+            "user_password": self.password,
+        }
+        try:
+            session = await self.session_factory()
+            async with session.post(self.login_url, json=payload) as response:
+                if response.status != 200:
+                    self.counters["login_failures"] += 1
+                    logger.error(f"❌ PalletIQ login failed with status {response.status}")
+                    return None
+                data = await response.json()
+            token, expires_at = self._parse_login(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.counters["login_failures"] += 1
+            logger.error(f"❌ PalletIQ login failed: {e}")
+            return None
+
+        self.token = token
+        self.expires_at = expires_at
+        self.issued_at = time.time()
+        self.counters["logins"] += 1
+        logger.info(f"✅ PalletIQ token refreshed, valid for {expires_at - time.time():.0f}s")
+        if self._wake is not None:
+            self._wake.set()
+        return token
+
+    def _parse_login(self, data) -> tuple:
+        # Any malformed body is a failed login (ValueError), never an escape
+        # from refresh() that would take the background refresher down with it.
+        if not isinstance(data, dict):
+            raise ValueError(f"unexpected login response {type(data).__name__}")
+        token = data.get("token")
+        if not token or not isinstance(token, str):
+            raise ValueError("login response had no token")
+        try:
+            expires_at = decode_token_expiry(token)
+            if expires_at is None and data.get("expires_at") is not None:
+                expires_at = float(data["expires_at"])
+            if expires_at is None and data.get("expires_in") is not None:
+                expires_at = time.time() + float(data["expires_in"])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"bad token expiry in login response: {e}")
+        if expires_at is not None and not math.isfinite(expires_at):
+            raise ValueError(f"bad token expiry in login response: {expires_at}")
+        if expires_at is None:
+            expires_at = time.time() + self.default_ttl
+        return token, expires_at
+
+    def start(self):
+        # Must run on the loop that owns the session.
+        if self._refresher is None or self._refresher.done():
+            self._wake = asyncio.Event()
+            self._refresher = asyncio.ensure_future(self._refresh_loop())
+
+    def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _refresh_loop(self):
+        retry = self.retry_min
+        while True:
+            self._wake.clear()
+            if self.expires_at is None:
+                delay = retry if self.token is None else self.default_ttl
+            else:
+                # Short-lived tokens (or a skewed clock) would otherwise put the
+                # refresh time at or before the login and re-login in a loop.
+                lifetime = max(0.0, self.expires_at - self.issued_at)
+                margin = min(self.refresh_margin, lifetime / 2)
+                delay = max(self.min_refresh, self.expires_at - margin - time.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                # A login happened elsewhere; recompute from the new expiry.
+                retry = self.retry_min
+                continue
+            except asyncio.TimeoutError:
+                pass
+            self.counters["proactive"] += 1
+            try:
+                token = await self.refresh()
+            except Exception as e:
+                # Keep the refresher alive whatever one login attempt does.
+                logger.error(f"❌ PalletIQ token refresh failed: {e}", exc_info=True)
+                token = None
+            if token is None:
+                await asyncio.sleep(retry)
+                retry = min(self.retry_max, retry * 2)
+            else:
+                retry = self.retry_min
+
+    def stats(self) -> dict:
+        return {
+            "valid": self.valid(),
+            "expires_in": (self.expires_at - time.time()) if self.expires_at is not None else None,
+            **self.counters,
+        }
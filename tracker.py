@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TRACKER_INTERVAL = float(os.getenv('TRACKER_INTERVAL', '0.05'))
+TRACKER_PUBLISH_INTERVAL = float(os.getenv('TRACKER_PUBLISH_INTERVAL', '0.2'))
+# Matches the dashboard: a pusher fires this far ahead of its nominal distance,
+# and an item stays in "routing" this long before it counts as sorted.
+PUSHER_LEAD_CM = float(os.getenv('PUSHER_LEAD_CM', '3.21'))
+ROUTING_HOLD = float(os.getenv('ROUTING_HOLD', '1.5'))
+
+FREE = 0
+MOVING = 1
+ROUTING = 2
+
+class BeltTracker:
+    """In-flight items past the photo eye, kept in parallel NumPy arrays.
+
+    Each tick recomputes every position as ``(now - eye_time) * belt_speed``
+    on the monotonic clock in one vectorised step, moves items that reached
+    their pusher to ROUTING and frees those whose routing hold elapsed.
+    Items without a decided distance ride to ``max_distance``.
+    """
+
+    def __init__(self, belt_speed: float, max_distance: float, capacity: int = 256,
+                 lead_cm: float = PUSHER_LEAD_CM, routing_hold: float = ROUTING_HOLD):
+        self.belt_speed = belt_speed
+        self.max_distance = max_distance
+        self.lead_cm = lead_cm
+        self.routing_hold = routing_hold
+
+        self._lock = threading.Lock()
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self._eye_time = np.zeros(capacity, dtype=np.float64)
+        self._target = np.zeros(capacity, dtype=np.float64)
+        self._state = np.zeros(capacity, dtype=np.int8)
+        self._state_since = np.zeros(capacity, dtype=np.float64)
+        self._position = np.zeros(capacity, dtype=np.float64)
+
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"tracked": 0, "arrived": 0, "completed": 0, "ticks": 0, "max_in_flight": 0}
+
+    def _grow(self):
+        capacity = len(self._ids)
+        self._ids.extend([None] * capacity)
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+        for name in ("_eye_time", "_target", "_state", "_state_since", "_position"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+
+    def add(self, item_id: str, eye_time: Optional[float] = None, distance: Optional[float] = None):
+        if eye_time is None:
+            eye_time = time.monotonic()
+        with self._lock:
+            slot = self._slots.get(item_id)
+            if slot is None:
+                if not self._free:
+                    self._grow()
+                slot = self._free.pop()
+                self._slots[item_id] = slot
+                self._ids[slot] = item_id
+                self.counters["tracked"] += 1
+                self.counters["max_in_flight"] = max(self.counters["max_in_flight"], len(self._slots))
+            self._eye_time[slot] = eye_time
+            self._target[slot] = distance if distance is not None else self.max_distance
+            self._state[slot] = MOVING
+            self._state_since[slot] = eye_time
+            self._position[slot] = 0.0
+
+    def set_target(self, item_id: str, distance: Optional[float]):
+        with self._lock:
+            slot = self._slots.get(item_id)
+            if slot is not None and self._state[slot] == MOVING:
+                self._target[slot] = distance if distance is not None else self.max_distance
+
+    def remove(self, item_id: str) -> bool:
+        with self._lock:
+            slot = self._slots.pop(item_id, None)
+            if slot is None:
+                return False
+            self._release(slot)
+            return True
+
+    def _release(self, slot: int):
+        self._ids[slot] = None
+        self._state[slot] = FREE
+        self._free.append(slot)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._slots)
+
+    def tick(self, now: Optional[float] = None):
+        """Advances every item; returns (ids that reached their pusher, ids now sorted)."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self.counters["ticks"] += 1
+            if not self._slots:
+                return [], []
+            state = self._state
+            moving = state == MOVING
+            np.multiply(np.maximum(now - self._eye_time, 0.0), self.belt_speed, out=self._position)
+
+            arrived_mask = moving & (self._position >= self._target - self.lead_cm)
+            arrived_slots = np.flatnonzero(arrived_mask)
+            state[arrived_slots] = ROUTING
+            self._state_since[arrived_slots] = now
+
+            done_mask = (state == ROUTING) & (now - self._state_since >= self.routing_hold)
+            done_slots = np.flatnonzero(done_mask)
+
+            arrived = [self._ids[slot] for slot in arrived_slots]
+            completed = []
+            for slot in done_slots:
+                item_id = self._ids[slot]
+                completed.append(item_id)
+                del self._slots[item_id]
+                self._release(slot)
+
+            self.counters["arrived"] += len(arrived)
+            self.counters["completed"] += len(completed)
+            return arrived, completed
+
+    def frame(self) -> dict:
+        # Compact columnar frame: ids, positions (cm, 1 decimal) and states.
+        with self._lock:
+            active = np.flatnonzero(self._state != FREE)
+            return {
+                "t": time.time(),
+                "ids": [self._ids[slot] for slot in active],
+                "pos": np.round(self._position[active], 1).tolist(),
+                "state": self._state[active].tolist(),
+            }
+
+    def start(self, on_arrival: Optional[Callable[[List[str]], None]] = None,
+              on_complete: Optional[Callable[[List[str]], None]] = None,
+              publish: Optional[Callable[[dict], None]] = None,
+              interval: float = TRACKER_INTERVAL, publish_interval: float = TRACKER_PUBLISH_INTERVAL):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, args=(on_arrival, on_complete, publish, interval, publish_interval),
+            daemon=True, name="BeltTracker",
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _run(self, on_arrival, on_complete, publish, interval, publish_interval):
+        last_publish = 0.0
+        published_empty = True
+        while self._running:
+            started = time.monotonic()
+            try:
+                arrived, completed = self.tick(started)
+                if arrived and on_arrival is not None:
+                    on_arrival(arrived)
+                if completed and on_complete is not None:
+                    on_complete(completed)
+                if publish is not None and started - last_publish >= publish_interval:
+                    frame = self.frame()
+                    # One empty frame after the belt clears, then stay quiet.
+                    if frame["ids"] or not published_empty:
+                        publish(frame)
+                        last_publish = started
+                    published_empty = not frame["ids"]
+            except Exception as e:
+                logger.error(f"❌ Belt tracker tick failed: {e}", exc_info=True)
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._slots), "capacity": len(self._ids), **self.counters}